@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from executor import effective_cpus, plan
+
+# Rolling-origin (walk-forward) backtest of the model on a model dataset (features + target as last column).
+# Every origin trains on the rows before it (all of them, or the last train_window rows) and predicts the
+# next max(horizons) rows; each horizon h gets the RMSE / MAE of the first h predictions.
+# Windows are spread over a process pool. Each worker builds one DMatrix of the whole dataset when it
+# starts and slices it per window, instead of re-slicing DataFrames. The features are not scaled:
+# tree splits do not change under the per-feature StandardScaler used by model_implementation.
+# The pool and the booster threads are planned from the effective CPUs (see executor.py), not os.cpu_count().
+
+_worker = {}
+
+def init_worker(X, y, params, num_boost_round):
+    import xgboost as xgb
+    _worker['dmatrix'] = xgb.DMatrix(X, label=y)
+    _worker['y'] = y
+    _worker['params'] = params
+    _worker['num_boost_round'] = num_boost_round
+
+def run_windows(windows, horizons):
+    import xgboost as xgb
+    full, y = _worker['dmatrix'], _worker['y']
+    rows = []
+    for train_start, origin, end in windows:
+        booster = xgb.train(_worker['params'], full.slice(np.arange(train_start, origin)), num_boost_round=_worker['num_boost_round'])
+        errors = booster.predict(full.slice(np.arange(origin, end))) - y[origin:end]
+        for h in horizons:
+            if h <= len(errors):
+                rows.append({'origin': origin, 'horizon': h, 'train_rows': origin - train_start,
+                             'rmse': float(np.sqrt(np.mean(errors[:h] ** 2))), 'mae': float(np.mean(np.abs(errors[:h])))})
+    return rows
+
+def booster_params(params, threads=1):
+    # XGBRegressor parameters -> native xgb.train parameters and number of rounds
+    params = dict(params)
+    num_boost_round = params.pop('n_estimators', 100)
+    # threads per booster; the rest of the parallelism comes from the process pool
+    return {'objective': 'reg:squarederror', 'nthread': threads, **params}, num_boost_round
+
+def backtest(model, params, horizons=(1, 5, 20, 60), min_train=1000, step=20, train_window=None, workers=None, chunk_size=8):
+    X = model.iloc[:, :-1].to_numpy(dtype=np.float32)
+    y = model.iloc[:, -1].to_numpy(dtype=np.float32)
+    max_horizon = max(horizons)
+    windows = [
+        (0 if train_window is None else max(0, origin - train_window), origin, min(origin + max_horizon, len(model)))
+        for origin in range(min_train, len(model) - min(horizons) + 1, step)
+    ]
+    chunks = [windows[i:i + chunk_size] for i in range(0, len(windows), chunk_size)]
+    cpus = effective_cpus()
+    workers = workers or plan(len(chunks), cpus, parallelism='folds').workers
+    native_params, num_boost_round = booster_params(params, max(1, cpus // workers))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(X, y, native_params, num_boost_round)) as executor:
+        rows = [row for chunk_rows in executor.map(run_windows, chunks, [horizons] * len(chunks)) for row in chunk_rows]
+    metrics = pd.DataFrame(rows, columns=['origin', 'horizon', 'train_rows', 'rmse', 'mae'])
+    metrics.insert(0, 'date', model.index[metrics['origin']])
+    return metrics.drop(columns='origin')
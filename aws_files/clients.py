@@ -0,0 +1,66 @@
+import os
+import threading
+import boto3
+import requests
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import count
+
+# Shared AWS clients and HTTP session for both lambdas.
+# They are created once per container and reused by warm invocations and by every worker thread,
+# so connections (and their TLS handshakes) are kept alive instead of being rebuilt on each call.
+
+# Connection pool size per host, large enough for the concurrent extractors and loaders
+POOL_SIZE = int(os.getenv('POOL_SIZE', 16))
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', 5))
+# Exponential backoff between retries: BACKOFF_FACTOR * 2 ** attempt seconds plus up to BACKOFF_JITTER seconds
+BACKOFF_FACTOR = float(os.getenv('BACKOFF_FACTOR', 0.5))
+BACKOFF_JITTER = float(os.getenv('BACKOFF_JITTER', 1.0))
+# Throttling and transient server errors
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_aws_clients = {}
+_http_session = None
+_lock = threading.Lock()
+
+def aws_client(service):
+    # boto3 clients are thread-safe once built, but building them from the default session is not
+    with _lock:
+        if service not in _aws_clients:
+            config = Config(
+                max_pool_connections=POOL_SIZE,
+                tcp_keepalive=True,
+                # adaptive mode adds client side rate limiting on top of jittered exponential backoff
+                retries={'max_attempts': MAX_RETRIES, 'mode': 'adaptive'},
+            )
+            _aws_clients[service] = boto3.session.Session().client(service, config=config)
+        return _aws_clients[service]
+
+def count_response(response, *args, stream=False, **kwargs):
+    # bytes and latency of every provider response, for metrics.py. The body of a streamed response is
+    # counted by its reader: reading it here would download all of it
+    if stream:
+        count(http_requests=1, http_ms=response.elapsed.total_seconds() * 1000)
+    else:
+        count(http_requests=1, http_bytes=len(response.content), http_ms=response.elapsed.total_seconds() * 1000)
+
+def http_session():
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                backoff_jitter=BACKOFF_JITTER,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=['GET'],
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.hooks['response'].append(count_response)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+        return _http_session
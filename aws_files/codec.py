@@ -0,0 +1,46 @@
+import os
+from io import StringIO, BytesIO
+import pandas as pd
+
+# File format of the S3 objects, shared by both lambdas and benchmarks/bench_formats.py.
+# 'csv' keeps the original layout, 'parquet' stores compressed, typed columns (datetime64 dates,
+# float values) so reads need no re-parsing and can project columns.
+# Keys are always given with a .csv extension and mapped to the configured format.
+FILE_FORMAT = os.getenv('FILE_FORMAT', 'csv')
+PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'snappy')
+
+def codec_key(key, file_format):
+    return key.rsplit('.', 1)[0] + '.' + file_format
+
+def apply_schema(df):
+    # datetime64 dates and float values
+    if 'date' in df.columns:
+        df = df.assign(date=pd.to_datetime(df['date']))
+    return df.astype({col: 'float64' for col in df.columns if col != 'date' and df[col].dtype.kind in 'iu'})
+
+def encode(df, file_format, index, compression=PARQUET_COMPRESSION):
+    if file_format == 'parquet':
+        buffer = BytesIO()
+        apply_schema(df).to_parquet(buffer, index=index, compression=compression)
+        return buffer.getvalue()
+    csv_buffer = StringIO()
+    df.to_csv(csv_buffer, index=index)
+    return csv_buffer.getvalue()
+
+def decode(body, file_format, columns=None):
+    if file_format == 'parquet':
+        df = pd.read_parquet(BytesIO(body), columns=columns)
+        # a stored index (e.g. date) comes back as a column, like with csv
+        return df.reset_index() if df.index.name is not None else df
+    return pd.read_csv(BytesIO(body), usecols=columns)
+
+def read_frame(storage, key, columns=None):
+    if FILE_FORMAT == 'parquet':
+        try:
+            return decode(storage.get(codec_key(key, 'parquet')), 'parquet', columns)
+        except KeyError:
+            pass  # not migrated yet, read the csv object
+    return decode(storage.get(codec_key(key, 'csv')), 'csv', columns)
+
+def write_frame(storage, key, df, index):
+    storage.put(codec_key(key, FILE_FORMAT), encode(df, FILE_FORMAT, index))
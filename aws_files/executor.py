@@ -0,0 +1,83 @@
+import os
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+
+# CPU planning for training: how many fits run at once (fold level) and how many threads each XGBoost fit
+# uses (tree level), so that workers x threads never exceeds the CPUs the process may actually use.
+# os.cpu_count() is not that number: a Lambda function or a container with a cgroup CPU quota sees more
+# cores than it is allowed to keep busy, and n_jobs=-1 pools with all-core XGBoost fits then run cores^2
+# threads on a fraction of them. effective_cpus() takes the smallest of:
+#   - the CPU affinity of the process
+#   - the cgroup CPU quota (cgroup v2 cpu.max, or v1 cpu.cfs_quota_us / cpu.cfs_period_us)
+#   - the Lambda share: one vCPU per LAMBDA_MB_PER_VCPU MB of AWS_LAMBDA_FUNCTION_MEMORY_SIZE
+#   - CPU_QUOTA, when set (e.g. to benchmark a smaller function on a bigger box)
+LAMBDA_MB_PER_VCPU = 1769
+CPU_QUOTA = os.getenv('CPU_QUOTA')
+# 'auto', 'folds' or 'trees'. 'folds' runs as many fits at once as there are CPUs (one thread each, leftover
+# CPUs go to the fits as threads), 'trees' runs one fit at a time on all of them. 'auto' picks 'folds' below
+# TREE_PARALLEL_MIN_ROWS training rows, where a single fit is too small to keep several threads busy.
+TRAINING_PARALLELISM = os.getenv('TRAINING_PARALLELISM', 'auto')
+TREE_PARALLEL_MIN_ROWS = int(os.getenv('TREE_PARALLEL_MIN_ROWS', 100000))
+
+CGROUP_V2 = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1 = ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', '/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+
+class Plan(NamedTuple):
+    workers: int
+    threads: int
+
+def read_first(path):
+    with open(path) as f:
+        return f.read().split()
+
+def cgroup_quota():
+    # CPUs of the cgroup quota, None when there is none
+    try:
+        quota, period = read_first(CGROUP_V2)[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota, period = int(read_first(CGROUP_V1[0])[0]), int(read_first(CGROUP_V1[1])[0])
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+def lambda_vcpus():
+    memory = os.getenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    return int(memory) / LAMBDA_MB_PER_VCPU if memory else None
+
+def affinity_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def effective_cpus():
+    limits = [affinity_cpus(), cgroup_quota(), lambda_vcpus(), float(CPU_QUOTA) if CPU_QUOTA else None]
+    # a fractional quota is rounded: 1.7 vCPUs keep two threads busy most of the time
+    return max(1, round(min(limit for limit in limits if limit is not None)))
+
+def plan(tasks, cpus=None, rows=None, parallelism=None):
+    # workers x threads for tasks independent fits of rows training rows on cpus CPUs
+    cpus = cpus or effective_cpus()
+    parallelism = parallelism or TRAINING_PARALLELISM
+    if parallelism == 'auto':
+        parallelism = 'trees' if rows is not None and rows >= TREE_PARALLEL_MIN_ROWS else 'folds'
+    if parallelism == 'trees' or tasks <= 1:
+        return Plan(1, cpus)
+    workers = min(tasks, cpus)
+    return Plan(workers, max(1, cpus // workers))
+
+def with_threads(estimator, threads):
+    # the estimator with its thread count set, when it has one (XGBoost's n_jobs)
+    if 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=threads)
+    return estimator
+
+def run(func, tasks, plan):
+    # func(*task) for every task, plan.workers at a time; XGBoost releases the GIL while it fits
+    if plan.workers == 1:
+        return [func(*task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=plan.workers) as executor:
+        return list(executor.map(lambda task: func(*task), tasks))
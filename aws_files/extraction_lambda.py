@@ -1,615 +1,502 @@
 import pandas as pd
-import requests
+import numpy as np
 from datetime import datetime
-from io import StringIO
-import boto3
-from fredapi import Fred
-from alpha_vantage.timeseries import TimeSeries
 import os
 import json
-
-s3 = boto3.client('s3')
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from clients import http_session, BACKOFF_FACTOR, BACKOFF_JITTER, MAX_RETRIES, POOL_SIZE
+from storage import get_storage
+from codec import FILE_FORMAT, read_frame, write_frame
+from response_cache import get_response_cache
+from metrics import instrument, stage, count
+from stream_parser import LAYOUTS, STREAM_CHUNK_BYTES, Scanner, parse_stream, to_cached, as_frame
+from manifest import write_shard_manifest, try_complete
+from watermarks import load_state, release_due, save_state
 
 # AWS S3 configuration
-S3_BUCKET = 'financial-project-1'
+S3_BUCKET = os.getenv('S3_BUCKET', 'financial-project-1')
 S3_PREFIX = 'extraction-staging/'
 
-def read_s3_file(key):
-    s3 = boto3.client('s3')
-    obj = s3.get_object(Bucket=S3_BUCKET, Key=key)
-    return pd.read_csv(obj['Body'])
+# S3, a local directory or memory depending on STORAGE_BACKEND (see storage.py)
+storage = get_storage(S3_BUCKET)
+
+# csv or parquet objects depending on FILE_FORMAT (see codec.py)
+def read_s3_file(key, columns=None):
+    return read_frame(storage, key, columns)
 
 def write_s3_file(key, df):
-    s3 = boto3.client('s3')
-    csv_buffer = StringIO()
-    df.to_csv(csv_buffer, index=False)
-    s3.put_object(Bucket=S3_BUCKET, Key=key, Body=csv_buffer.getvalue())
+    write_frame(storage, key, df, index=False)
 
-### Extraction ###
+### History store ###
 
-# Interest Rates
-# Note: there is no way of specifying start date for this security with this API
-def create_us_rates(key_AV):
-    function = 'FEDERAL_FUNDS_RATE'   # Effective Federal Funds Rate
-    url = f'https://www.alphavantage.co/query?function={function}&apikey={key_AV}'
-    r = requests.get(url)
-    data = r.json()
-    interest_rates = pd.DataFrame(data)
-    interest_rates = interest_rates['data'].apply(lambda x: pd.Series(x))
-    interest_rates.rename(columns={'value':'us_rates_%'},inplace=True)
-    interest_rates['date'] = pd.to_datetime(interest_rates['date'],format='%Y-%m-%d')
-    interest_rates['us_rates_%'] = interest_rates['us_rates_%'].astype(float)
-    interest_rates = interest_rates.sort_values('date').reset_index(drop=True)
-    interest_rates = interest_rates[interest_rates['date']>='2000-01-01']
-    # create date range from 2000 until today and fill gaps
-    start_date = '2000-01-01'
-    end_date = datetime.today().strftime('%Y-%m-%d') 
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    us_rates = date_range.merge(interest_rates,how='outer',on='date')
-    us_rates = us_rates.ffill()
-    write_s3_file(S3_PREFIX + "us_rates.csv", us_rates)
-
-# S&P 500 
-def create_snp(key_AV):
-    function = 'TIME_SERIES_DAILY'
-    symbol = 'SPY'  # S&P 500 ETF
-    try:
-        hist = read_s3_file(S3_PREFIX + "snp.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10] # extract since last 10th available date (possible updates in recent data)
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}'
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}&outputsize=full'
-    response = requests.get(url)
-    data = response.json()
-    sp500 = pd.DataFrame(data)
-    sp500 = pd.concat([sp500['Meta Data'],sp500['Time Series (Daily)'].apply(lambda x: pd.Series(x))],axis=1)
-    sp500 = sp500.reset_index()
-    sp500 = sp500.iloc[5:]
-    sp500.drop(columns=['Meta Data',0],inplace=True)
-    sp500.rename(columns={'index':'date'},inplace=True)
-    sp500.columns = [f'sp500{col[2:]}' if i >= 1 else col for i, col in enumerate(sp500.columns)]
-    sp500['date'] = pd.to_datetime(sp500['date'],format='%Y-%m-%d')
-    sp500['sp500 open'] = pd.to_numeric(sp500['sp500 open'], errors='coerce')
-    sp500['sp500 high'] = pd.to_numeric(sp500['sp500 high'], errors='coerce')
-    sp500['sp500 low'] = pd.to_numeric(sp500['sp500 low'], errors='coerce')
-    sp500['sp500 close'] = pd.to_numeric(sp500['sp500 close'], errors='coerce')
-    sp500['sp500 volume'] = pd.to_numeric(sp500['sp500 volume'], errors='coerce')
-    sp500['sp500 high-low'] = sp500['sp500 high'] - sp500['sp500 low']
-    sp500 = sp500.sort_values('date')
-    # create date range from 2000 until today and fill gaps
-    end_date = datetime.today().strftime('%Y-%m-%d') 
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    sp500 = date_range.merge(sp500,how='outer',on='date') # get date range from 2000 until today and fill gaps
-    sp500 = sp500.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    sp500['type'] = 'new'
-    hist['type'] = 'history'
-    snp = pd.concat([sp500,hist])
-    snp[snp.duplicated(subset=['date'],keep=False)] = snp[(snp.duplicated(subset=['date'],keep=False))&(snp['type']=='new')]
-    snp = snp[snp['date'].isna()==False]
-    snp.drop(columns='type',inplace=True)
-    snp = snp[snp['date']>='2000-01-01']
-    snp = snp.sort_values('date')
-    snp = snp.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "snp.csv", snp)
-
-# NASDAQ 100
-def create_nasdaq(key_AV):
-    function = 'TIME_SERIES_DAILY'
-    symbol = 'QQQ'  # NASDAQ 100 ETF
-    try:
-        hist = read_s3_file(S3_PREFIX + "nasdaq.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}'
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}&outputsize=full'
-    response = requests.get(url)
-    data = response.json()
-    nsdq = pd.DataFrame(data)
-    nsdq = pd.concat([nsdq['Meta Data'],nsdq['Time Series (Daily)'].apply(lambda x: pd.Series(x))],axis=1)
-    nsdq = nsdq.reset_index()
-    nsdq = nsdq.iloc[5:]
-    nsdq.drop(columns=['Meta Data',0],inplace=True)
-    nsdq.rename(columns={'index':'date'},inplace=True)
-    nsdq.columns = [f'nasdaq{col[2:]}' if i >= 1 else col for i, col in enumerate(nsdq.columns)]
-    nsdq['date'] = pd.to_datetime(nsdq['date'],format='%Y-%m-%d')
-    nsdq['nasdaq open'] = pd.to_numeric(nsdq['nasdaq open'], errors='coerce')
-    nsdq['nasdaq high'] = pd.to_numeric(nsdq['nasdaq high'], errors='coerce')
-    nsdq['nasdaq low'] = pd.to_numeric(nsdq['nasdaq low'], errors='coerce')
-    nsdq['nasdaq close'] = pd.to_numeric(nsdq['nasdaq close'], errors='coerce')
-    nsdq['nasdaq volume'] = pd.to_numeric(nsdq['nasdaq volume'], errors='coerce')
-    nsdq['nasdaq high-low'] = nsdq['nasdaq high'] - nsdq['nasdaq low']
-    nsdq = nsdq.sort_values('date')
-    # create date range from 2000 until today and fill gaps
-    end_date = datetime.today().strftime('%Y-%m-%d') 
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    nsdq = date_range.merge(nsdq,how='outer',on='date') # get date range from 2000 until today and fill gaps
-    nsdq = nsdq.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    nsdq['type'] = 'new'
-    hist['type'] = 'history'
-    nasdaq = pd.concat([nsdq,hist])
-    nasdaq[nasdaq.duplicated(subset=['date'],keep=False)] = nasdaq[(nasdaq.duplicated(subset=['date'],keep=False))&(nasdaq['type']=='new')]
-    nasdaq = nasdaq[nasdaq['date'].isna()==False]
-    nasdaq.drop(columns='type',inplace=True)
-    nasdaq = nasdaq[nasdaq['date']>='2000-01-01']
-    nasdaq = nasdaq.sort_values('date')
-    nasdaq = nasdaq.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "nasdaq.csv", nasdaq)
-
-# Consumer Price Index
-def create_cpi(key_FRED):
-    try:
-        hist = read_s3_file(S3_PREFIX + "cpi.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-80]
-        start_date = start_date.strftime('%Y-%m-%d')
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()    
-    end_date = datetime.now().date().strftime('%Y-%m-%d')
-    key = key_FRED
-    fred = Fred(api_key=key)
-    series_id = 'CPIAUCSL'
-    cpi_data = fred.get_series(series_id, start_date=f'{start_date}', end_date=f'{end_date}')
-    cpi_data = pd.DataFrame(cpi_data).reset_index()
-    cpi_data.rename(columns={'index':'date',0:'CPI'},inplace=True)
-    cpi_data = cpi_data[cpi_data['date']>='2000-01-01']
-    date_range = pd.date_range(start=start_date, end=end_date)
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    cpi_data = date_range.merge(cpi_data,how='outer',on='date')
-    cpi_data = cpi_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    cpi_data['type'] = 'new'
-    hist['type'] = 'history'
-    cpi = pd.concat([cpi_data,hist])
-    cpi[cpi.duplicated(subset=['date'],keep=False)] = cpi[(cpi.duplicated(subset=['date'],keep=False))&(cpi['type']=='new')]
-    cpi = cpi[cpi['date'].isna()==False]
-    cpi.drop(columns='type',inplace=True)
-    cpi = cpi.sort_values(by='date')
-    cpi = cpi.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "cpi.csv", cpi)
-
-# USD / CHF
-def create_usd_chf(key_FRED): 
-    try:
-        hist = read_s3_file(S3_PREFIX + "usd_chf.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        start_date = start_date.strftime('%Y-%m-%d')
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()    
-    end_date = datetime.now().date().strftime('%Y-%m-%d')
-    key = key_FRED
-    fred = Fred(api_key=key)
-    series_id = 'DEXSZUS'
-    usd_chf_data = fred.get_series(series_id, observation_start=start_date, observation_end=end_date)
-    usd_chf_data = pd.DataFrame(usd_chf_data).reset_index()
-    usd_chf_data.rename(columns={'index':'date',0:'usd_chf'},inplace=True)
-    usd_chf_data = usd_chf_data[usd_chf_data['date']>='2000-01-01']
-    date_range = pd.date_range(start=start_date, end=end_date)
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    usd_chf_data = date_range.merge(usd_chf_data,how='outer',on='date')
-    usd_chf_data = usd_chf_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    usd_chf_data['type'] = 'new'
-    hist['type'] = 'history'
-    usd_chf = pd.concat([usd_chf_data,hist])
-    usd_chf[usd_chf.duplicated(subset=['date'],keep=False)] = usd_chf[(usd_chf.duplicated(subset=['date'],keep=False))&(usd_chf['type']=='new')]
-    usd_chf = usd_chf[usd_chf['date'].isna()==False]
-    usd_chf.drop(columns='type',inplace=True)
-    usd_chf = usd_chf.sort_values(by='date')
-    usd_chf = usd_chf.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "usd_chf.csv", usd_chf)
-
-# EUR / USD
-def create_eur_usd(key_FRED):
+# Each series is stored as one csv per year (or month) under extraction-staging/<series>/,
+# so the daily upsert only rewrites the partitions touched by the revision window
+PARTITION_FREQ = os.getenv('PARTITION_FREQ', 'year')  # 'year' or 'month'
+
+def partition_labels(dates):
+    if PARTITION_FREQ == 'month':
+        return 'month=' + dates.dt.strftime('%Y-%m')
+    return 'year=' + dates.dt.strftime('%Y')
+
+def partition_key(name, label):
+    return f'{S3_PREFIX}{name}/{label}/{name}.csv'
+
+def list_partitions(name):
+    # partition labels of a series, oldest first
+    labels = [key.split('/')[-2] for key in storage.list(f'{S3_PREFIX}{name}/{PARTITION_FREQ}=')]
+    # a partition can hold both a csv and a parquet object while it is being migrated
+    return sorted(set(labels))
+
+def read_partition(name, label):
+    df = read_s3_file(partition_key(name, label))
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    return df
+
+def write_partitions(name, df, labels):
+    # only the given partitions are rewritten, the rest of the history is untouched
+    for label, part in df.groupby(partition_labels(df['date'])):
+        if label in labels:
+            write_s3_file(partition_key(name, label), part)
+
+def migrate_legacy_history(name):
+    # one-off split of a single-file extraction-staging/<series>.csv into partitions
     try:
-        hist = read_s3_file(S3_PREFIX + "eur_usd.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        start_date = start_date.strftime('%Y-%m-%d')
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()    
-    end_date = datetime.now().date().strftime('%Y-%m-%d')
-    key = key_FRED
-    fred = Fred(api_key=key)
-    series_id = 'DEXUSEU'
-    eur_usd_data = fred.get_series(series_id, observation_start=start_date, observation_end=end_date)
-    eur_usd_data = pd.DataFrame(eur_usd_data).reset_index()
-    eur_usd_data.rename(columns={'index':'date',0:'eur_usd'},inplace=True)
-    eur_usd_data = eur_usd_data[eur_usd_data['date']>='2000-01-01']
-    date_range = pd.date_range(start=start_date, end=end_date)
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    eur_usd_data = date_range.merge(eur_usd_data,how='outer',on='date')
-    eur_usd_data = eur_usd_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    eur_usd_data['type'] = 'new'
-    hist['type'] = 'history'
-    eur_usd = pd.concat([eur_usd_data,hist])
-    eur_usd[eur_usd.duplicated(subset=['date'],keep=False)] = eur_usd[(eur_usd.duplicated(subset=['date'],keep=False))&(eur_usd['type']=='new')]
-    eur_usd = eur_usd[eur_usd['date'].isna()==False]
-    eur_usd.drop(columns='type',inplace=True)
-    eur_usd = eur_usd.sort_values(by='date')
-    eur_usd = eur_usd.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "eur_usd.csv", eur_usd)
-
-# GDP
-def create_gdp(key_FRED):
+        hist = read_s3_file(S3_PREFIX + f'{name}.csv')
+    except Exception:
+        return []
+    hist['date'] = pd.to_datetime(hist['date'], format='%Y-%m-%d')
+    labels = sorted(set(partition_labels(hist['date'])))
+    write_partitions(name, hist, labels)
+    return labels
+
+def migrate_csv_objects(prefix):
+    # Rewrite every csv object under prefix in the configured FILE_FORMAT (e.g. 'model-results/').
+    # Reads already fall back to csv, so this is only needed to migrate everything at once.
+    if FILE_FORMAT == 'csv':
+        return
+    for key in storage.list(prefix):
+        if key.endswith('.csv'):
+            write_s3_file(key, read_s3_file(key))
+
+def compact_history(name):
+    # One-off: histories written before native frequency storage hold one forward-filled row per calendar day.
+    # A row repeating the previous one adds nothing to the as-of join of the model frame, so it is dropped.
+    labels = list_partitions(name)
+    if not labels:
+        return 0
+    hist = pd.concat([read_partition(name, label) for label in labels], ignore_index=True)
+    values = hist.drop(columns='date')
+    repeated = (values == values.shift()).all(axis=1)
+    write_partitions(name, hist[~repeated], labels)
+    return int(repeated.sum())
+
+### Extraction ###
+
+AV_URL = 'https://www.alphavantage.co/query'
+FRED_URL = 'https://api.stlouisfed.org/fred/series/observations'
+START_DATE = '2000-01-01'
+
+# Series registry. Adding a series is one entry here:
+#   provider        'alpha_vantage' or 'fred' (selects the API key and the rate budget)
+#   kind            'av_daily' (TIME_SERIES_DAILY), 'av_economic' (economic indicators) or 'fred'
+#   symbol          ticker, economic function or FRED series id
+#   prefix          column name prefix ('sp500' -> 'sp500 open', ...); for single value series the column name
+#   fields          Alpha Vantage daily fields to keep
+#   high_low        add a '<prefix> high-low' column
+#   backfill_start  first date extracted when the series does not exist yet
+#   revision_rows   re-extract from the n-th last stored row (possible updates in recent data);
+#                   None to always extract the whole history
+#   cache_ttl       hours a cached API response stays fresh, following the publication cadence
+#   cadence         release calendar: 'daily', 'weekly' or 'monthly', with release_day the weekday (0 is Monday)
+#                   or the day of the month of the release (see watermarks.py)
+SERIES = {
+    'us_rates': {'provider': 'alpha_vantage', 'kind': 'av_economic', 'symbol': 'FEDERAL_FUNDS_RATE', 'prefix': 'us_rates_%',
+                 'backfill_start': START_DATE, 'revision_rows': 2, 'cache_ttl': 24, 'cadence': 'monthly', 'release_day': 2},
+    'snp': {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'SPY', 'prefix': 'sp500',
+            'fields': ['open', 'high', 'low', 'close', 'volume'], 'high_low': True, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'},
+    'nasdaq': {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'QQQ', 'prefix': 'nasdaq',
+               'fields': ['open', 'high', 'low', 'close', 'volume'], 'high_low': True, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'},
+    'cpi': {'provider': 'fred', 'kind': 'fred', 'symbol': 'CPIAUCSL', 'prefix': 'CPI',
+            'backfill_start': START_DATE, 'revision_rows': 3, 'cache_ttl': 24, 'cadence': 'monthly', 'release_day': 10},
+    'usd_chf': {'provider': 'fred', 'kind': 'fred', 'symbol': 'DEXSZUS', 'prefix': 'usd_chf',
+                'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 12, 'cadence': 'weekly', 'release_day': 0},
+    'eur_usd': {'provider': 'fred', 'kind': 'fred', 'symbol': 'DEXUSEU', 'prefix': 'eur_usd',
+                'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 12, 'cadence': 'weekly', 'release_day': 0},
+    'gdp': {'provider': 'fred', 'kind': 'fred', 'symbol': 'GDP', 'prefix': 'GDP',
+            'backfill_start': START_DATE, 'revision_rows': 2, 'cache_ttl': 24, 'cadence': 'monthly', 'release_day': 25},
+    'silver': {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'SIVR', 'prefix': 'silver',
+               'fields': ['open', 'high', 'low', 'close', 'volume'], 'high_low': True, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'},
+    'oil': {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'USO', 'prefix': 'oil',
+            'fields': ['open', 'high', 'low', 'close', 'volume'], 'high_low': True, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'},
+    'platinum': {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'PPLT', 'prefix': 'platinum',
+                 'fields': ['open', 'high', 'low', 'close', 'volume'], 'high_low': True, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'},
+    'palladium': {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'PALL', 'prefix': 'palladium',
+                  'fields': ['open', 'high', 'low', 'close', 'volume'], 'high_low': True, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'},
+    'gold': {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'GLD', 'prefix': 'gold',
+             'fields': ['open'], 'high_low': False, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'},
+}
+
+# Universe: the registered series plus the daily instruments listed in config/universe.json
+# ({"xle": {"symbol": "XLE"}, ...}); those take DAILY_TEMPLATE for the fields they do not set
+UNIVERSE_KEY = 'config/universe.json'
+DAILY_TEMPLATE = {'provider': 'alpha_vantage', 'kind': 'av_daily', 'fields': ['open', 'high', 'low', 'close', 'volume'],
+                  'high_low': True, 'backfill_start': START_DATE, 'revision_rows': 10, 'cache_ttl': 6, 'cadence': 'daily'}
+
+def load_universe():
     try:
-        hist = read_s3_file(S3_PREFIX + "gdp.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-110]
-        start_date = start_date.strftime('%Y-%m-%d')
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()    
+        extra = json.loads(storage.get(UNIVERSE_KEY))
+    except KeyError:
+        extra = {}
+    return {**SERIES, **{name: {**DAILY_TEMPLATE, 'prefix': name, **spec} for name, spec in extra.items()}}
+
+# Parsers: provider payload -> dataframe with a 'date' column and numeric value columns
+
+# The parsers and the streaming parser (stream_parser.py) share the last step, from the provider's
+# columns (date and 'open', 'high', ... or 'value') to the spec's, oldest first
+
+def av_daily_frame(frame, spec):
+    frame = frame[['date'] + spec['fields']].rename(columns={field: f"{spec['prefix']} {field}" for field in spec['fields']})
+    if spec['high_low']:
+        frame[f"{spec['prefix']} high-low"] = frame[f"{spec['prefix']} high"] - frame[f"{spec['prefix']} low"]
+    return frame.sort_values('date').reset_index(drop=True)
+
+def value_frame(frame, spec):
+    return frame.rename(columns={'value': spec['prefix']}).sort_values('date').reset_index(drop=True)
+
+def parse_av_daily(data, spec):
+    # One vectorized step: the daily dict becomes a float frame directly, no per-day Series objects
+    frame = pd.DataFrame.from_dict(data['Time Series (Daily)'], orient='index', dtype=float)
+    # '1. open' -> 'open'
+    frame.columns = [col.split('. ', 1)[-1] for col in frame.columns]
+    frame.index = pd.to_datetime(frame.index, format='%Y-%m-%d')
+    return av_daily_frame(frame.rename_axis('date').reset_index(), spec)
+
+def parse_av_economic(data, spec):
+    frame = pd.DataFrame(data['data'], columns=['date', 'value'])
+    return value_frame(pd.DataFrame({
+        'date': pd.to_datetime(frame['date'], format='%Y-%m-%d'),
+        'value': pd.to_numeric(frame['value'], errors='coerce'),
+    }), spec)
+
+def parse_fred(data, spec):
+    frame = pd.DataFrame(data['observations'], columns=['date', 'value'])
+    # FRED marks missing observations with '.'
+    return value_frame(pd.DataFrame({
+        'date': pd.to_datetime(frame['date'], format='%Y-%m-%d'),
+        'value': pd.to_numeric(frame['value'], errors='coerce'),
+    }), spec)
+
+# Fetchers: (spec, key, start_date, full history?) -> parsed dataframe
+# All of them go through the shared keep-alive session, which retries throttling and server errors
+
+# Alpha Vantage and FRED have separate quotas, so each provider gets its own
+# concurrency and requests-per-minute budget (overridable through env variables)
+PROVIDER_LIMITS = {
+    'alpha_vantage': {
+        'max_concurrency': int(os.getenv('AV_MAX_CONCURRENCY', 2)),
+        'requests_per_minute': int(os.getenv('AV_REQUESTS_PER_MINUTE', 5)),
+    },
+    'fred': {
+        'max_concurrency': int(os.getenv('FRED_MAX_CONCURRENCY', 4)),
+        'requests_per_minute': int(os.getenv('FRED_REQUESTS_PER_MINUTE', 120)),
+    },
+}
+
+class ProviderBudget:
+    # Caps in-flight calls with a semaphore and spaces calls over a sliding 60s window
+    def __init__(self, max_concurrency, requests_per_minute):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.requests_per_minute = requests_per_minute
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def wait_for_slot(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] >= 60:
+                    self.calls.popleft()
+                if len(self.calls) < self.requests_per_minute:
+                    self.calls.append(now)
+                    return
+                wait = 60 - (now - self.calls[0])
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        self.wait_for_slot()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+# Module level, so the per-minute windows also hold across warm invocations
+BUDGETS = {provider: ProviderBudget(**limits) for provider, limits in PROVIDER_LIMITS.items()}
+
+# Same-day reruns and backfills are served from the response cache (see response_cache.py)
+response_cache = get_response_cache(storage)
+
+def throttled(data):
+    # Alpha Vantage signals throttling with a 200 response carrying a 'Note' / 'Information' message
+    return isinstance(data, dict) and ('Note' in data or 'Information' in data)
+
+# provider messages in place of the records: never cached, so the next run calls the provider again
+PROVIDER_MESSAGES = ('Error Message', 'Note', 'Information')
+
+def cacheable(data, kind):
+    # a stream parsed frame, or a whole (or cached parsed) response that holds the records of its kind
+    if isinstance(data, pd.DataFrame):
+        return True
+    return (isinstance(data, dict) and not any(message in data for message in PROVIDER_MESSAGES)
+            and (LAYOUTS[kind]['key'] in data or 'parsed' in data))
+
+def cached_fetch(spec, request, fetch):
+    # request holds the cache key fields (never the API key), fetch() calls the provider
+    request = {'provider': spec['provider'], 'symbol': None, 'outputsize': None, 'start': None, 'end': None, **request}
+    if response_cache is not None:
+        data = response_cache.get(request, spec['cache_ttl'])
+        # entries cached before error bodies were excluded are ignored
+        if data is not None and cacheable(data, spec['kind']):
+            return data
+    # only actual provider calls count against the provider budget
+    with BUDGETS[spec['provider']]:
+        data = fetch()
+    if response_cache is not None and cacheable(data, spec['kind']):
+        response_cache.put(request, to_cached(data))
+    return data
+
+# Responses are parsed while they download (see stream_parser.py): records before the start date of the
+# fetch are never materialized, and a newest first history stops downloading at the first of them.
+# STREAM_PARSE=false decodes whole JSON responses instead.
+STREAM_PARSE = os.getenv('STREAM_PARSE', 'true') == 'true'
+
+def stream_get(url, params, kind, watermark=None):
+    # parsed records of a response, or the decoded response when it has none (e.g. a throttling note)
+    with http_session().get(url, params=params, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        scanner = Scanner(response.iter_content(STREAM_CHUNK_BYTES))
+        data = parse_stream(scanner, kind, watermark)
+    count(http_bytes=scanner.bytes)
+    return data
+
+def av_get(params, kind=None, watermark=None):
+    # whole JSON responses, or stream parsed ones given the payload kind. Called within the budget of
+    # cached_fetch, which took the slot of the first attempt
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(BACKOFF_FACTOR * 2 ** (attempt - 1) + random.uniform(0, BACKOFF_JITTER))
+            # a retry is another call to the API: it waits for its own slot in the per-minute window
+            BUDGETS['alpha_vantage'].wait_for_slot()
+        if kind is None:
+            response = http_session().get(AV_URL, params=params, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+        else:
+            data = stream_get(AV_URL, params, kind, watermark)
+        if not throttled(data):
+            return data
+    return data
+
+def fetch_av_daily(spec, key, start_date, full):
+    outputsize = 'full' if full else 'compact'
+    params = {'function': 'TIME_SERIES_DAILY', 'symbol': spec['symbol'], 'outputsize': outputsize, 'apikey': key}
+    request = {'function': 'TIME_SERIES_DAILY', 'symbol': spec['symbol'], 'outputsize': outputsize}
+    if STREAM_PARSE:
+        # what is kept depends on the start date, so it is part of the cache key
+        request = {**request, 'start': start_date, 'parsed': True}
+        return av_daily_frame(as_frame(cached_fetch(spec, request, lambda: av_get(params, 'av_daily', start_date))), spec)
+    return parse_av_daily(cached_fetch(spec, request, lambda: av_get(params)), spec)
+
+def fetch_av_economic(spec, key, start_date, full):
+    # Note: there is no way of specifying start date for this security with this API
+    params = {'function': spec['symbol'], 'apikey': key}
+    if STREAM_PARSE:
+        request = {'function': spec['symbol'], 'start': start_date, 'parsed': True}
+        return value_frame(as_frame(cached_fetch(spec, request, lambda: av_get(params, 'av_economic', start_date))), spec)
+    return parse_av_economic(cached_fetch(spec, {'function': spec['symbol']}, lambda: av_get(params)), spec)
+
+def fred_get(params, kind=None):
+    if kind is not None:
+        return stream_get(FRED_URL, params, kind)
+    response = http_session().get(FRED_URL, params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+def fetch_fred(spec, key, start_date, full):
+    # FRED's REST API directly, so the calls share the pooled session. It filters by date itself
     end_date = datetime.now().date().strftime('%Y-%m-%d')
-    key = key_FRED
-    fred = Fred(api_key=key)
-    series_id = 'GDP' # Gross Domestic Product
-    gdp_data = fred.get_series(series_id, observation_start=start_date, observation_end=end_date)
-    gdp_data = pd.DataFrame(gdp_data).reset_index()
-    gdp_data.rename(columns={'index':'date',0:'GDP'},inplace=True)
-    gdp_data = gdp_data[gdp_data['date']>='2000-01-01']
-    date_range = pd.date_range(start=start_date, end=end_date)
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    gdp_data = date_range.merge(gdp_data,how='outer',on='date')
-    gdp_data = gdp_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    gdp_data['type'] = 'new'
-    hist['type'] = 'history'
-    gdp = pd.concat([gdp_data,hist])
-    gdp[gdp.duplicated(subset=['date'],keep=False)] = gdp[(gdp.duplicated(subset=['date'],keep=False))&(gdp['type']=='new')]
-    gdp = gdp[gdp['date'].isna()==False]
-    gdp.drop(columns='type',inplace=True)
-    gdp = gdp.sort_values(by='date')
-    gdp = gdp.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "gdp.csv", gdp)
-
-
-def create_silver(key_AV):
-    function = 'TIME_SERIES_DAILY'
-    symbol = 'SIVR'  # silver 
-    try:
-        hist = read_s3_file(S3_PREFIX + "silver.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}'
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}&outputsize=full'
-    response = requests.get(url)
-    data = response.json()
-    silver_data = pd.DataFrame(data)
-    silver_data = pd.concat([silver_data['Meta Data'],silver_data['Time Series (Daily)'].apply(lambda x: pd.Series(x))],axis=1)
-    silver_data = silver_data.reset_index()
-    silver_data = silver_data.iloc[5:]
-    silver_data.drop(columns=['Meta Data',0],inplace=True)
-    silver_data.rename(columns={'index':'date'},inplace=True)
-    silver_data.columns = [f'silver{col[2:]}' if i >= 1 else col for i, col in enumerate(silver_data.columns)]
-    silver_data['date'] = pd.to_datetime(silver_data['date'],format='%Y-%m-%d')
-    silver_data['silver open'] = pd.to_numeric(silver_data['silver open'], errors='coerce')
-    silver_data['silver high'] = pd.to_numeric(silver_data['silver high'], errors='coerce')
-    silver_data['silver low'] = pd.to_numeric(silver_data['silver low'], errors='coerce')
-    silver_data['silver close'] = pd.to_numeric(silver_data['silver close'], errors='coerce')
-    silver_data['silver volume'] = pd.to_numeric(silver_data['silver volume'], errors='coerce')
-    silver_data['silver high-low'] = silver_data['silver high'] - silver_data['silver low']
-    silver_data = silver_data.sort_values('date')
-    # create date range from 2000 until today and fill gaps
-    end_date = datetime.today().strftime('%Y-%m-%d') 
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    silver_data = date_range.merge(silver_data,how='outer',on='date') # get date range from 2000 until today and fill gaps
-    silver_data = silver_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    silver_data['type'] = 'new'
-    hist['type'] = 'history'
-    silver = pd.concat([silver_data,hist])
-    silver[silver.duplicated(subset=['date'],keep=False)] = silver[(silver.duplicated(subset=['date'],keep=False))&(silver['type']=='new')]
-    silver = silver[silver['date'].isna()==False]
-    silver.drop(columns='type',inplace=True)
-    silver = silver[silver['date']>='2000-01-01']
-    silver = silver[silver['silver open'].isna()==False]
-    silver = silver.sort_values('date')
-    silver = silver.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "silver.csv", silver)
-
-def create_oil(key_AV):    
-    function = 'TIME_SERIES_DAILY'
-    symbol = 'USO'  # Oil ETF
-    try:
-        hist = read_s3_file(S3_PREFIX + "oil.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}'
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}&outputsize=full'
-    response = requests.get(url)
-    data = response.json()
-    oil_data = pd.DataFrame(data)
-    oil_data = pd.concat([oil_data['Meta Data'],oil_data['Time Series (Daily)'].apply(lambda x: pd.Series(x))],axis=1)
-    oil_data = oil_data.reset_index()
-    oil_data = oil_data.iloc[5:]
-    oil_data.drop(columns=['Meta Data',0],inplace=True)
-    oil_data.rename(columns={'index':'date'},inplace=True)
-    oil_data.columns = [f'oil{col[2:]}' if i >= 1 else col for i, col in enumerate(oil_data.columns)]
-    oil_data['date'] = pd.to_datetime(oil_data['date'],format='%Y-%m-%d')
-    oil_data['oil open'] = pd.to_numeric(oil_data['oil open'], errors='coerce')
-    oil_data['oil high'] = pd.to_numeric(oil_data['oil high'], errors='coerce')
-    oil_data['oil low'] = pd.to_numeric(oil_data['oil low'], errors='coerce')
-    oil_data['oil close'] = pd.to_numeric(oil_data['oil close'], errors='coerce')
-    oil_data['oil volume'] = pd.to_numeric(oil_data['oil volume'], errors='coerce')
-    oil_data['oil high-low'] = oil_data['oil high'] - oil_data['oil low']
-    oil_data = oil_data.sort_values('date')
-    # create date range from 2000 until today and fill gaps
-    end_date = datetime.today().strftime('%Y-%m-%d') 
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    oil_data = date_range.merge(oil_data,how='outer',on='date') # get date range from 2000 until today and fill gaps
-    oil_data = oil_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    oil_data['type'] = 'new'
-    hist['type'] = 'history'
-    oil = pd.concat([oil_data,hist])
-    oil[oil.duplicated(subset=['date'],keep=False)] = oil[(oil.duplicated(subset=['date'],keep=False))&(oil['type']=='new')]
-    oil = oil[oil['date'].isna()==False]
-    oil.drop(columns='type',inplace=True)
-    oil = oil[oil['date']>='2000-01-01']
-    oil = oil[oil['oil open'].isna()==False]
-    oil = oil.sort_values('date')
-    oil = oil.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "oil.csv", oil)
-
-def create_platinum(key_AV):
-    function = 'TIME_SERIES_DAILY'
-    symbol = 'PPLT'  # platinum 
-    try:
-        hist = read_s3_file(S3_PREFIX + "platinum.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}'
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}&outputsize=full'
-    response = requests.get(url)
-    data = response.json()
-    platinum_data = pd.DataFrame(data)
-    platinum_data = pd.concat([platinum_data['Meta Data'],platinum_data['Time Series (Daily)'].apply(lambda x: pd.Series(x))],axis=1)
-    platinum_data = platinum_data.reset_index()
-    platinum_data = platinum_data.iloc[5:]
-    platinum_data.drop(columns=['Meta Data',0],inplace=True)
-    platinum_data.rename(columns={'index':'date'},inplace=True)
-    platinum_data.columns = [f'platinum{col[2:]}' if i >= 1 else col for i, col in enumerate(platinum_data.columns)]
-    platinum_data['date'] = pd.to_datetime(platinum_data['date'],format='%Y-%m-%d')
-    platinum_data['platinum open'] = pd.to_numeric(platinum_data['platinum open'], errors='coerce')
-    platinum_data['platinum high'] = pd.to_numeric(platinum_data['platinum high'], errors='coerce')
-    platinum_data['platinum low'] = pd.to_numeric(platinum_data['platinum low'], errors='coerce')
-    platinum_data['platinum close'] = pd.to_numeric(platinum_data['platinum close'], errors='coerce')
-    platinum_data['platinum volume'] = pd.to_numeric(platinum_data['platinum volume'], errors='coerce')
-    platinum_data['platinum high-low'] = platinum_data['platinum high'] - platinum_data['platinum low']
-    platinum_data = platinum_data.sort_values('date')
-    # create date range from 2000 until today and fill gaps
-    end_date = datetime.today().strftime('%Y-%m-%d') 
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    platinum_data = date_range.merge(platinum_data,how='outer',on='date') # get date range from 2000 until today and fill gaps
-    platinum_data = platinum_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    platinum_data['type'] = 'new'
-    hist['type'] = 'history'
-    platinum = pd.concat([platinum_data,hist])
-    platinum[platinum.duplicated(subset=['date'],keep=False)] = platinum[(platinum.duplicated(subset=['date'],keep=False))&(platinum['type']=='new')]
-    platinum = platinum[platinum['date'].isna()==False]
-    platinum.drop(columns='type',inplace=True)
-    platinum = platinum[platinum['date']>='2000-01-01']
-    platinum = platinum[platinum['platinum open'].isna()==False]
-    platinum = platinum.sort_values('date')
-    platinum = platinum.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "platinum.csv", platinum)
-
-def create_palladium(key_AV):
-    function = 'TIME_SERIES_DAILY'
-    symbol = 'PALL'  # palladium 
-    try:
-        hist = read_s3_file(S3_PREFIX + "palladium.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}'
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}&outputsize=full'
-    response = requests.get(url)
-    data = response.json()
-    palladium_data = pd.DataFrame(data)
-    palladium_data = pd.concat([palladium_data['Meta Data'],palladium_data['Time Series (Daily)'].apply(lambda x: pd.Series(x))],axis=1)
-    palladium_data = palladium_data.reset_index()
-    palladium_data = palladium_data.iloc[5:]
-    palladium_data.drop(columns=['Meta Data',0],inplace=True)
-    palladium_data.rename(columns={'index':'date'},inplace=True)
-    palladium_data.columns = [f'palladium{col[2:]}' if i >= 1 else col for i, col in enumerate(palladium_data.columns)]
-    palladium_data['date'] = pd.to_datetime(palladium_data['date'],format='%Y-%m-%d')
-    palladium_data['palladium open'] = pd.to_numeric(palladium_data['palladium open'], errors='coerce')
-    palladium_data['palladium high'] = pd.to_numeric(palladium_data['palladium high'], errors='coerce')
-    palladium_data['palladium low'] = pd.to_numeric(palladium_data['palladium low'], errors='coerce')
-    palladium_data['palladium close'] = pd.to_numeric(palladium_data['palladium close'], errors='coerce')
-    palladium_data['palladium volume'] = pd.to_numeric(palladium_data['palladium volume'], errors='coerce')
-    palladium_data['palladium high-low'] = palladium_data['palladium high'] - palladium_data['palladium low']
-    palladium_data = palladium_data.sort_values('date')
-    # create date range from 2000 until today and fill gaps
-    end_date = datetime.today().strftime('%Y-%m-%d') 
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    palladium_data = date_range.merge(palladium_data,how='outer',on='date') # get date range from 2000 until today and fill gaps
-    palladium_data = palladium_data.ffill()
-    # to keep most recent available values instead of historic ones when removing duplicates
-    palladium_data['type'] = 'new'
-    hist['type'] = 'history'
-    palladium = pd.concat([palladium_data,hist])
-    palladium[palladium.duplicated(subset=['date'],keep=False)] = palladium[(palladium.duplicated(subset=['date'],keep=False))&(palladium['type']=='new')]
-    palladium = palladium[palladium['date'].isna()==False]
-    palladium.drop(columns='type',inplace=True)
-    palladium = palladium[palladium['date']>='2000-01-01']
-    palladium = palladium[palladium['palladium open'].isna()==False]
-    palladium = palladium.sort_values('date')
-    palladium = palladium.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "palladium.csv", palladium)
-
-# ### Gold
-def create_gold(key_AV):
-    function = 'TIME_SERIES_DAILY'
-    symbol = 'GLD'  # Gold
+    params = {'series_id': spec['symbol'], 'api_key': key, 'file_type': 'json',
+              'observation_start': start_date, 'observation_end': end_date}
+    request = {'function': 'series/observations', 'symbol': spec['symbol'], 'start': start_date, 'end': end_date}
+    if STREAM_PARSE:
+        request = {**request, 'parsed': True}
+        return value_frame(as_frame(cached_fetch(spec, request, lambda: fred_get(params, 'fred'))), spec)
+    return parse_fred(cached_fetch(spec, request, lambda: fred_get(params)), spec)
+
+FETCHERS = {
+    'av_daily': fetch_av_daily,
+    'av_economic': fetch_av_economic,
+    'fred': fetch_fred,
+}
+
+def upsert(hist, new):
+    # keep most recent available values instead of historic ones; gaps in the new rows fall back to history
+    if hist.empty:
+        return new.reset_index(drop=True)
+    merged = new.set_index('date').combine_first(hist.set_index('date'))
+    return merged[new.columns.drop('date')].sort_index().reset_index()
+
+def same_rows(hist, series):
+    # same dates and values, whatever the dtypes the history was read with. csv reads can be one ulp off the
+    # written value, so values only need to agree to 1e-12
+    if hist.empty or series.empty:
+        return hist.empty and series.empty
+    if len(hist) != len(series) or list(hist.columns) != list(series.columns):
+        return False
+    hist = hist.sort_values('date').reset_index(drop=True)
+    values = series.columns.drop('date')
+    return hist['date'].equals(series['date']) and np.allclose(hist[values].to_numpy(dtype=float), series[values].to_numpy(dtype=float),
+                                                               rtol=1e-12, atol=0, equal_nan=True)
+
+def extract_series(name, key, spec=None, state=None):
+    spec = spec or SERIES[name]
+    partitions = list_partitions(name) or migrate_legacy_history(name)
+    loaded = {}
+    # if the series does not exist yet (or revision_rows is None), we extract all the data
+    full = spec['revision_rows'] is None or not partitions
+    if full:
+        start_date = spec['backfill_start']
+    elif state is not None and state['revision_window'] == spec['revision_rows'] and state['revision_start']:
+        # the watermark manifest knows where the revision window starts
+        start_date = state['revision_start']
+    else:
+        # read partitions from the most recent one backwards until the revision window is covered
+        rows = 0
+        for label in reversed(partitions):
+            loaded[label] = read_partition(name, label)
+            rows += len(loaded[label])
+            if rows >= spec['revision_rows']:
+                break
+        tail = pd.concat([loaded[label] for label in sorted(loaded)], ignore_index=True)
+        start_date = tail['date'].iloc[-min(spec['revision_rows'], len(tail))].strftime('%Y-%m-%d')
+    with stage('fetch', series=name) as fetch:
+        new = FETCHERS[spec['kind']](spec, key, start_date, full)
+        fetch.rows = len(new)
+    # stored at the native frequency of the series: model_lambda aligns them onto a business-day calendar
+    value_columns = new.columns.drop('date')
+    new = new[new[value_columns].notna().any(axis=1)]
+    cutoff = max(start_date, spec['backfill_start'])
+    earlier = new[new['date'] < cutoff]
+    new = new[new['date'] >= cutoff]
+    if full and not earlier.empty and (new.empty or new['date'].iloc[0] > pd.Timestamp(cutoff)):
+        # a backfill starts with the observation in force on its first day (e.g. last month's rate)
+        new = pd.concat([earlier.iloc[[-1]].assign(date=pd.Timestamp(cutoff)), new], ignore_index=True)
+    touched = set(partition_labels(new['date']))
+    for label in touched:
+        if label in partitions and label not in loaded:
+            loaded[label] = read_partition(name, label)
+    hist = pd.concat(loaded.values(), ignore_index=True) if loaded else pd.DataFrame()
+    series = upsert(hist, new)
+    # a release that revised nothing and added nothing leaves the stored partitions as they are
+    changed = not same_rows(hist, series)
+    if changed:
+        with stage('write', series=name) as write:
+            write_partitions(name, series, touched)
+            write.rows = len(series)
+    # written last, so the manifest never points past the stored rows
+    save_state(storage, name, spec, series, changed, state)
+    return series
+
+### Execution ###
+
+# 'true' skips the series with no release due since their last fetch (see watermarks.py); the event's
+# 'force' extracts everything anyway, e.g. after a backfill
+RELEASE_CALENDAR = os.getenv('RELEASE_CALENDAR', 'true') == 'true'
+
+def run_extractor(series, spec, key, force=False):
+    # Run one extractor and report the outcome instead of raising: 'success', 'skipped' or 'failure'
+    result = {'series': series, 'provider': spec['provider'], 'status': 'success', 'seconds': None, 'error': None, 'reason': None}
+    start = time.perf_counter()
     try:
-        hist = read_s3_file(S3_PREFIX + "gold.csv")
-        hist['date'] = pd.to_datetime(hist['date'],format='%Y-%m-%d')
-        start_date = hist['date'].iloc[-10]
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}'
-    # if the dataframe does not exist yet, we extract all the data
-    except Exception as e: 
-        start_date = '2000-01-01'
-        hist = pd.DataFrame()
-        url = f'https://www.alphavantage.co/query?function={function}&symbol={symbol}&apikey={key_AV}&outputsize=full'
-    end_date = datetime.now().date().strftime('%Y-%m-%d')
-    response = requests.get(url)
-    data = response.json()
-    gold_data = pd.DataFrame(data)
-    gold_data = pd.concat([gold_data['Meta Data'],gold_data['Time Series (Daily)'].apply(lambda x: pd.Series(x))],axis=1)
-    gold_data = gold_data.reset_index()
-    gold_data = gold_data.iloc[5:]
-    gold_data.drop(columns=['Meta Data',0],inplace=True)
-    gold_data.rename(columns={'index':'date'},inplace=True)
-    gold_data.columns = [f'gold{col[2:]}' if i >= 1 else col for i, col in enumerate(gold_data.columns)]
-    gold_data['date'] = pd.to_datetime(gold_data['date'],format='%Y-%m-%d')
-    gold_data = gold_data.sort_values('date').reset_index(drop=True)
-    gold_data = gold_data[['date','gold open']]
-    date_range = pd.date_range(start=start_date, end=end_date)
-    date_range = pd.DataFrame({'date':date_range})
-    date_range['date'] = pd.to_datetime(date_range['date'],format='%Y-%m-%d')
-    gold_data = date_range.merge(gold_data,how='outer',on='date')
-    gold_data = gold_data.ffill()
-    gold_data = gold_data[gold_data['gold open'].isna()==False]
-    gold_data = gold_data.sort_values('date').reset_index(drop=True)
-    # to keep most recent available values instead of historic ones when removing duplicates
-    gold_data['type'] = 'new'
-    hist['type'] = 'history'
-    gold = pd.concat([gold_data,hist])
-    gold[gold.duplicated(subset=['date'],keep=False)] = gold[(gold.duplicated(subset=['date'],keep=False))&(gold['type']=='new')]
-    gold = gold[gold['date'].isna()==False]
-    gold.drop(columns='type',inplace=True)
-    gold = gold.sort_values(by='date')
-    gold = gold.reset_index(drop=True)
-    write_s3_file(S3_PREFIX + "gold.csv", gold)
-
-# Lambda handler
+        state = load_state(storage, series)
+        due, result['reason'] = release_due(spec, state, datetime.now().date())
+        # the reason reports what decided the fetch: the watermark only does when nothing overrides it
+        if force:
+            result['reason'] = 'forced'
+        elif not RELEASE_CALENDAR:
+            result['reason'] = 'release calendar off'
+        if due or force or not RELEASE_CALENDAR:
+            with stage('extract', series=series) as extract:
+                extract.rows = len(extract_series(series, key, spec, state))
+        else:
+            result['status'] = 'skipped'
+    except Exception as e:
+        result['status'] = 'failure'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+def run_extractors(keys, mode='concurrent', universe=None, force=False):
+    jobs = [(series, spec, keys[spec['provider']], force) for series, spec in (universe or SERIES).items()]
+    if mode == 'sequential':
+        return [run_extractor(*job) for job in jobs]
+    # provider calls are bounded by BUDGETS, storage I/O by the connection pool
+    max_workers = min(len(jobs), POOL_SIZE)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_extractor, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+
+# Sharded extraction: {"run_id": ..., "shard": i, "shards": n} in the event extracts the i-th of n slices of
+# the universe. Every shard writes its manifest (see manifest.py), and the shard that completes the fan-in
+# manifest sends the event that starts the model stage. run_id defaults to the day, so the n invocations
+# of a daily schedule belong to the same run.
+def shard_series(universe, shard, shards):
+    return {name: universe[name] for name in sorted(universe)[shard::shards]}
+
+def share_budgets(shards):
+    # the provider quotas are per API key, so n concurrent shards get 1/n of the calls per minute each
+    for provider, budget in BUDGETS.items():
+        budget.requests_per_minute = max(1, PROVIDER_LIMITS[provider]['requests_per_minute'] // shards)
+
+@instrument('extraction', storage)
 def lambda_handler(event, context):
     key_FRED = os.getenv('key_FRED')
     key_AV = os.getenv('key_AV')
-    
-    try:
-        create_us_rates(key_AV)
-    except Exception as e:
-        print(f'Error getting rates: {e}')
-    try:
-        create_snp(key_AV)
-    except Exception as e:
-        print(f'Error getting snp: {e}')
-    try:
-        create_nasdaq(key_AV)
-    except Exception as e:
-        print(f'Error getting nasdaq: {e}')
-    try:
-        create_cpi(key_FRED)
-    except Exception as e:
-        print(f'Error getting cpi: {e}')
-    try:
-        create_usd_chf(key_FRED)
-    except Exception as e:
-        print(f'Error getting usd_chf: {e}')
-    try:
-        create_eur_usd(key_FRED)
-    except Exception as e:
-        print(f'Error getting eur_usd: {e}')
-    try:
-        create_gdp(key_FRED)
-    except Exception as e:
-        print(f'Error getting gdp: {e}')
-    try:
-        create_silver(key_AV)
-    except Exception as e:
-        print(f'Error getting silver: {e}')
-    try:
-        create_oil(key_AV)
-    except Exception as e:
-        print(f'Error getting oil: {e}')
-    try:
-        create_platinum(key_AV)
-    except Exception as e:
-        print(f'Error getting platinum: {e}')
-    try:
-        create_palladium(key_AV)
-    except Exception as e:
-        print(f'Error getting palladium: {e}')
-    try:
-        create_gold(key_AV)
-    except Exception as e:
-        print(f'Error getting gold: {e}')
-        
-        
-    # Send an event to EventBridge
-    eventbridge = boto3.client('events')
-    response = eventbridge.put_events(
-        Entries=[
-            {
-                'Source': 'data_extraction',  
-                'DetailType': 'data_extraction_done',  
-                'Detail': json.dumps({'status': 'success'}),
-                'EventBusName': 'default'  
-            }
-        ]
-    )        
-        
-        
+    keys = {'alpha_vantage': key_AV, 'fred': key_FRED}
+    # 'concurrent' (default) runs the extractors on a thread pool, 'sequential' one after another
+    mode = event.get('mode', os.getenv('EXTRACTION_MODE', 'concurrent'))
+    universe = load_universe()
+    shards = int(event.get('shards', 1))
+    share_budgets(shards)
+    if 'shard' not in event:
+        report = run_extractors(keys, mode, universe, event.get('force', False))
+        failed = [r['series'] for r in report if r['status'] == 'failure']
+        print(json.dumps({'mode': mode, 'report': report}))
+
+        # Send an event to EventBridge
+        storage.put_event('data_extraction', 'data_extraction_done', {'status': 'success', 'failed': failed})
+    else:
+        run_id, shard = event.get('run_id', datetime.now().strftime('%Y-%m-%d')), int(event['shard'])
+        report = run_extractors(keys, mode, shard_series(universe, shard, shards), event.get('force', False))
+        print(json.dumps({'mode': mode, 'run_id': run_id, 'shard': shard, 'shards': shards, 'report': report}))
+        write_shard_manifest(storage, run_id, shard, shards, report)
+        complete = try_complete(storage, run_id, shards)
+        if complete is not None:
+            print(f'Extraction run {run_id} complete: {shards} shards, {len(complete["failed"])} failed series')
+            storage.put_event('data_extraction', 'data_extraction_done',
+                              {'status': 'success', 'failed': complete['failed'], 'run_id': run_id})
     return {
         'statusCode': 200,
-        'body': 'Data extracted successfully'
+        'body': 'Data extracted successfully',
+        'report': report
     }
 
-response = lambda_handler({}, {})
-print(response)
+if __name__ == '__main__':
+    response = lambda_handler({}, {})
+    print(response)
+
@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+# Incremental feature store. Each feature is computed from one column of a staging series, and the store
+# keeps under feature-store/<series>/:
+#   values.parquet  date and every feature column of the series
+#   state.json      the last date, a digest of every input row up to it, the last input rows the
+#                   features need and each feature's state (the EMA accumulator)
+# An update only computes the rows after the last date. It recomputes the series from scratch when
+# there is no state, the feature definitions changed, or any stored input row was revised: the digest
+# covers the whole history, so a revision is caught however far back the extractor rewrote rows.
+FEATURE_PREFIX = 'feature-store/'
+
+# name -> series and column it is computed from, kind and its parameters. Other kinds can be registered
+# the same way, e.g. {'series': 'silver', 'column': 'silver open', 'kind': 'rolling_std', 'window': 20}
+# or {'series': 'oil', 'column': 'oil open', 'kind': 'lag', 'periods': 1}
+FEATURES = {
+    'gold EMA_30': {'series': 'gold', 'column': 'gold open', 'kind': 'ema', 'span': 30},
+}
+
+# 'off', 'exact' (bit for bit) or 'tolerance' (relative FEATURE_TOLERANCE): compare the updated
+# values with a full recompute, and rebuild the series from scratch when they differ. Kinds whose
+# update is not bit for bit the same as their reference are compared with the tolerance in both modes.
+FEATURE_VERIFY = os.getenv('FEATURE_VERIFY', 'off')
+FEATURE_TOLERANCE = float(os.getenv('FEATURE_TOLERANCE', 1e-9))
+
+def ema_update(values, state, spec):
+    # pandas' ewm(span).mean() (adjust=True, ignore_na=False) one row at a time, so the result
+    # is bit for bit the same as a full recompute. The state is the running average and its weight.
+    alpha = 2 / (spec['span'] + 1)
+    weighted, old_wt, nobs = state.get('weighted', np.nan), state.get('old_wt', 1.0), state.get('nobs', 0)
+    out = np.empty(len(values))
+    for i, cur in enumerate(values):
+        is_observation = cur == cur
+        nobs += is_observation
+        if weighted == weighted:
+            old_wt *= 1 - alpha
+            if is_observation:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + cur) / (old_wt + 1.0)
+                old_wt += 1.0
+        elif is_observation:
+            weighted = cur
+        out[i] = weighted if nobs else np.nan
+    return out, {'weighted': float(weighted), 'old_wt': old_wt, 'nobs': int(nobs)}
+
+# kind -> full recompute, number of previous inputs an update needs, the stateful update if any, and
+# whether the update is bit for bit the same as the full recompute. Kinds without an update are updated
+# by recomputing over the previous inputs and the new rows; pandas' rolling std accumulates its sums
+# from the start of the series, so recomputing it over the last window differs in the last bits.
+KINDS = {
+    'ema': {'reference': lambda s, spec: s.ewm(span=spec['span']).mean(), 'history': lambda spec: 0, 'update': ema_update,
+            'exact': True},
+    'rolling_std': {'reference': lambda s, spec: s.rolling(spec['window']).std(), 'history': lambda spec: spec['window'] - 1,
+                    'exact': False},
+    'lag': {'reference': lambda s, spec: s.shift(spec['periods']), 'history': lambda spec: spec['periods'], 'exact': True},
+}
+
+def compute(values, previous, state, spec):
+    # feature values of the new input rows, and the feature's new state
+    kind = KINDS[spec['kind']]
+    if 'update' in kind:
+        return kind['update'](values, state, spec)
+    combined = pd.Series(np.concatenate([previous, values]))
+    return kind['reference'](combined, spec).to_numpy()[len(previous):], {}
+
+def load_state(storage, series):
+    try:
+        return json.loads(storage.get(f'{FEATURE_PREFIX}{series}/state.json'))
+    except KeyError:
+        return None
+
+def load_values(storage, series):
+    return pd.read_parquet(BytesIO(storage.get(f'{FEATURE_PREFIX}{series}/values.parquet')))
+
+def save(storage, series, values, state):
+    buffer = BytesIO()
+    values.to_parquet(buffer, index=False)
+    storage.put(f'{FEATURE_PREFIX}{series}/values.parquet', buffer.getvalue())
+    # written last, so the state never points past the stored values
+    storage.put(f'{FEATURE_PREFIX}{series}/state.json', json.dumps(state))
+
+def input_digest(dates, inputs, rows):
+    # sha256 of the dates and input columns of the first rows rows, every NaN hashed the same way
+    digest = hashlib.sha256(dates[:rows].asi8.tobytes())
+    for column in sorted(inputs):
+        values = np.array(inputs[column][:rows], dtype=float)
+        values[np.isnan(values)] = np.nan
+        digest.update(column.encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+def stale_reason(state, specs, dates, inputs):
+    # why the stored state cannot be continued, or None
+    if state is None:
+        return 'no state'
+    if state['features'].keys() != specs.keys() or any(state['features'][name]['spec'] != spec for name, spec in specs.items()):
+        return 'feature definitions changed'
+    if 'digest' not in state:
+        return 'state without an input digest'
+    last = dates.get_indexer([pd.Timestamp(state['last_date'])])[0]
+    if last < 0:
+        return 'stored rows missing'
+    if input_digest(dates, inputs, last + 1) != state['digest']:
+        return 'stored rows revised'
+    return None
+
+def verify(values, frame, specs, mode):
+    # columns whose updated values differ from a full recompute
+    differ = []
+    for name, spec in specs.items():
+        expected = KINDS[spec['kind']]['reference'](frame[spec['column']].astype(float).reset_index(drop=True), spec).to_numpy()
+        actual = values[name].to_numpy()
+        if mode == 'exact' and KINDS[spec['kind']]['exact']:
+            ok = np.array_equal(actual, expected, equal_nan=True)
+        else:
+            ok = np.allclose(actual, expected, rtol=FEATURE_TOLERANCE, atol=0, equal_nan=True)
+        if not ok:
+            differ.append(name)
+    return differ
+
+def update_series(storage, series, frame, specs, verify_mode=FEATURE_VERIFY, force=False):
+    # feature values of every row of frame (sorted by date), computed only for the rows after the stored state
+    dates = pd.DatetimeIndex(pd.to_datetime(frame['date'], format='%Y-%m-%d'))
+    columns = sorted({spec['column'] for spec in specs.values()})
+    inputs = {column: frame[column].to_numpy(dtype=float) for column in columns}
+    if frame.empty:
+        return pd.DataFrame({'date': dates, **{name: np.empty(0) for name in specs}})
+    state = None if force else load_state(storage, series)
+    reason = 'full recompute requested' if force else stale_reason(state, specs, dates, inputs)
+    if reason is None:
+        values = load_values(storage, series)
+        start = int(dates.get_indexer([pd.Timestamp(state['last_date'])])[0]) + 1
+        if len(values) != start or values['date'].iloc[-1] != dates[start - 1]:
+            reason = 'stored values do not match the series'
+    if reason is None:
+        states = {name: state['features'][name]['state'] for name in specs}
+        previous = {name: state['tail']['values'][spec['column']] for name, spec in specs.items()}
+        if start == len(dates):
+            return values
+    else:
+        start, states, previous = 0, {name: {} for name in specs}, {name: [] for name in specs}
+    new = {'date': dates[start:]}
+    for name, spec in specs.items():
+        history = KINDS[spec['kind']]['history'](spec)
+        previous_inputs = np.asarray(previous[name][-history:] if history else [], dtype=float)
+        new[name], states[name] = compute(inputs[spec['column']][start:], previous_inputs, states[name], spec)
+    values = pd.concat([values, pd.DataFrame(new)], ignore_index=True) if start else pd.DataFrame(new)
+    print(f"Features {series}: {len(dates) - start} rows computed ({reason or 'incremental'})")
+    if verify_mode != 'off':
+        differ = verify(values, frame, specs, verify_mode)
+        if differ and start:
+            # the stored state drifted: rebuild the series from scratch
+            print(f"Features {series}: {differ} differ from a full recompute ({verify_mode}), rebuilding")
+            return update_series(storage, series, frame, specs, 'off', force=True)
+        if differ:
+            raise ValueError(f'Features {series}: {differ} differ from their reference implementation ({verify_mode})')
+    keep = max(max(KINDS[spec['kind']]['history'](spec) for spec in specs.values()), 1)
+    save(storage, series, values, {
+        'last_date': dates[-1].strftime('%Y-%m-%d'),
+        'digest': input_digest(dates, inputs, len(dates)),
+        'features': {name: {'spec': spec, 'state': states[name]} for name, spec in specs.items()},
+        'tail': {
+            'dates': [date.strftime('%Y-%m-%d') for date in dates[-keep:]],
+            'values': {column: inputs[column][-keep:].tolist() for column in columns},
+        },
+    })
+    return values
+
+def add_features(storage, datasets, features=FEATURES, verify_mode=FEATURE_VERIFY):
+    # copies of the series that have features, with the feature columns appended
+    frames = {}
+    for series in sorted({spec['series'] for spec in features.values()}):
+        specs = {name: spec for name, spec in features.items() if spec['series'] == series}
+        frame = datasets[series]
+        values = update_series(storage, series, frame, specs, verify_mode)
+        frames[series] = frame.assign(**{name: values[name].to_numpy() for name in specs})
+    return frames
@@ -0,0 +1,46 @@
+import json
+from datetime import datetime
+
+# Fan-out / fan-in of a sharded extraction run, under extraction-manifests/<run_id>/:
+#   shard-0003-of-0016.json  written by each shard when it finishes: its series and their report
+#   _complete.json           the fan-in manifest, created once by the shard that finds every shard
+#                            manifest present (storage.create, so concurrent shards cannot both win)
+MANIFEST_PREFIX = 'extraction-manifests/'
+
+def shard_key(run_id, shard, shards):
+    return f'{MANIFEST_PREFIX}{run_id}/shard-{shard:04d}-of-{shards:04d}.json'
+
+def complete_key(run_id):
+    return f'{MANIFEST_PREFIX}{run_id}/_complete.json'
+
+def write_shard_manifest(storage, run_id, shard, shards, report):
+    storage.put(shard_key(run_id, shard, shards), json.dumps({
+        'run_id': run_id,
+        'shard': shard,
+        'shards': shards,
+        'series': [r['series'] for r in report],
+        'failed': [r['series'] for r in report if r['status'] == 'failure'],
+        'report': report,
+        'finished': datetime.now().isoformat(),
+    }))
+
+def try_complete(storage, run_id, shards):
+    # the fan-in manifest if this call created it, None if shards are missing or another shard created it
+    done = [key for key in storage.list(f'{MANIFEST_PREFIX}{run_id}/shard-') if key.endswith(f'-of-{shards:04d}.json')]
+    if len(done) < shards:
+        return None
+    manifests = [json.loads(storage.get(key)) for key in sorted(done)]
+    complete = {
+        'run_id': run_id,
+        'shards': shards,
+        'series': sum(len(m['series']) for m in manifests),
+        'failed': [name for m in manifests for name in m['failed']],
+        'completed': datetime.now().isoformat(),
+    }
+    return complete if storage.create(complete_key(run_id), json.dumps(complete)) else None
+
+def load_complete(storage, run_id):
+    try:
+        return json.loads(storage.get(complete_key(run_id)))
+    except KeyError:
+        return None
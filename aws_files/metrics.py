@@ -0,0 +1,210 @@
+import os
+import io
+import sys
+import json
+import time
+import resource
+import functools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# Per-stage instrumentation shared by both lambdas.
+# - stage(name, **dimensions) times a block and records its row count (stage.rows = ...), the peak RSS
+#   of the process, and the HTTP and storage I/O done by its thread while it ran (count(), called by
+#   the shared HTTP session and the storage backend). Nested stages add their I/O to the enclosing one.
+# - instrument(service) wraps a lambda handler: a 'handler' stage with the run's I/O totals, the opt-in
+#   profiler, and one structured line per stage printed at the end of the invocation.
+# METRICS_FORMAT: 'emf' (CloudWatch Embedded Metric Format, turned into metrics from the logs), 'json' or 'off'.
+# With profiling off the cost is a few perf_counter calls and dict updates per stage and I/O call.
+METRICS_FORMAT = os.getenv('METRICS_FORMAT', 'emf')
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'FinancialProject')
+# 'off', 'cprofile' or 'sampling' (or the event's 'profile' key): profile one invocation, print the
+# top of the profile and store it under profiles/<service>/ in the storage backend. cProfile only sees
+# the handler's thread; the sampling profiler also covers the worker threads.
+PROFILE = os.getenv('PROFILE', 'off')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', 30))
+
+UNITS = {
+    'duration_ms': 'Milliseconds',
+    'rows': 'Count',
+    'http_requests': 'Count',
+    'http_bytes': 'Bytes',
+    'http_ms': 'Milliseconds',
+    'storage_reads': 'Count',
+    'storage_read_bytes': 'Bytes',
+    'storage_writes': 'Count',
+    'storage_write_bytes': 'Bytes',
+    'storage_ms': 'Milliseconds',
+    'peak_rss_mb': 'Megabytes',
+}
+
+_local = threading.local()
+_lock = threading.Lock()
+_records = []
+_totals = Counter()
+
+class Stage:
+    def __init__(self, name, dimensions):
+        self.name = name
+        self.dimensions = dimensions
+        self.rows = None
+        self.io = Counter()
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def count(**values):
+    # add I/O counters to the innermost stage of this thread and to the totals of the run
+    stack = _stack()
+    if stack:
+        stack[-1].io.update(values)
+    with _lock:
+        _totals.update(values)
+
+@contextmanager
+def stage(name, **dimensions):
+    current = Stage(name, dimensions)
+    stack = _stack()
+    stack.append(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        stack.pop()
+        if stack:
+            stack[-1].io.update(current.io)
+        record = {'stage': name, **dimensions, 'duration_ms': round(duration_ms, 3), **current.io, 'peak_rss_mb': peak_rss_mb()}
+        if current.rows is not None:
+            record['rows'] = int(current.rows)
+        with _lock:
+            _records.append(record)
+
+def emf(service, record):
+    dimensions = ['Service', 'Stage'] + [key.capitalize() for key in record if key not in UNITS and key != 'stage']
+    line = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [dimensions],
+                'Metrics': [{'Name': key, 'Unit': UNITS[key]} for key in record if key in UNITS],
+            }],
+        },
+        'Service': service,
+        'Stage': record['stage'],
+    }
+    for key, value in record.items():
+        if key in UNITS:
+            line[key] = value
+        elif key != 'stage':
+            line[key.capitalize()] = str(value)
+    return line
+
+def flush(service, metrics_format=None):
+    # print the records of the invocation and start over
+    global _records
+    metrics_format = metrics_format or METRICS_FORMAT
+    with _lock:
+        records, _records = _records, []
+        _totals.clear()
+    if metrics_format == 'off':
+        return records
+    for record in records:
+        record = {key: round(value, 3) if isinstance(value, float) else value for key, value in record.items()}
+        line = emf(service, record) if metrics_format == 'emf' else {'service': service, **record}
+        print(json.dumps(line))
+    return records
+
+class SamplingProfiler:
+    # Samples the stacks of every thread each PROFILE_INTERVAL seconds; the result is in folded format
+    # ('frame;frame;frame count' per line), ready for flamegraph tools
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        # the functions the samples were taken in
+        leaves = Counter()
+        for stack, n in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += n
+        for leaf, n in leaves.most_common(PROFILE_TOP):
+            print(f'{n:>8} {leaf}')
+        return '\n'.join(f'{stack} {n}' for stack, n in self.samples.most_common()).encode(), 'folded'
+
+class CProfiler:
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        import pstats
+        self.profile.disable()
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        print(out.getvalue())
+        path = f'/tmp/profile-{os.getpid()}.prof'
+        self.profile.dump_stats(path)
+        with open(path, 'rb') as f:
+            return f.read(), 'prof'
+
+PROFILERS = {
+    'cprofile': CProfiler,
+    'sampling': lambda: SamplingProfiler(PROFILE_INTERVAL),
+}
+
+def instrument(service, storage=None):
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            profile = (event or {}).get('profile', PROFILE)
+            profiler = PROFILERS[profile]() if profile in PROFILERS else None
+            if profiler:
+                profiler.start()
+            try:
+                with stage('handler'):
+                    return handler(event, context)
+            finally:
+                with _lock:
+                    # the run's totals include the I/O of worker threads
+                    _records[-1].update(_totals)
+                if profiler:
+                    body, extension = profiler.stop()
+                    if storage is not None:
+                        key = f"profiles/{service}/{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.{extension}"
+                        storage.put(key, body)
+                        print(f'Profile saved to {key}')
+                flush(service)
+        return wrapper
+    return decorator
@@ -1,52 +1,135 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 from datetime import datetime
-import xgboost as xgb
-from sklearn.metrics import accuracy_score
-from xgboost import XGBRegressor
-from sklearn.metrics import mean_squared_error
-from sklearn.model_selection import TimeSeriesSplit, GridSearchCV, KFold
-from sklearn.preprocessing import StandardScaler
-from sklearn.multioutput import MultiOutputRegressor
-from sklearn.model_selection import cross_val_score
-import string
-import boto3
-from io import StringIO
 import json
+from concurrent.futures import ThreadPoolExecutor
+from clients import POOL_SIZE
+from storage import get_storage
+from codec import read_frame, write_frame
+from model_registry import load_metadata, load_version, save_version
+from search import calendar_folds, search
+from features import add_features
+from metrics import instrument, stage, peak_rss_mb
+from manifest import load_complete
+from executor import effective_cpus
 
 
 # AWS S3 configuration
-S3_BUCKET = 'financial-project-1'
+S3_BUCKET = os.getenv('S3_BUCKET', 'financial-project-1')
 S3_PREFIX_1 = 'extraction-staging/'
 S3_PREFIX_2 = 'complete-dataset/'
 S3_PREFIX_3 = 'model-results/'
 
-def read_s3_file(key):
-    s3 = boto3.client('s3')
-    obj = s3.get_object(Bucket=S3_BUCKET, Key=key)
-    return pd.read_csv(obj['Body'])
+# S3, a local directory or memory depending on STORAGE_BACKEND (see storage.py)
+storage = get_storage(S3_BUCKET)
+
+# csv or parquet objects depending on FILE_FORMAT (see codec.py)
+def read_s3_file(key, columns=None):
+    return read_frame(storage, key, columns)
 
 def write_s3_file(key, df):
-    s3 = boto3.client('s3')
-    csv_buffer = StringIO()
-    df.to_csv(csv_buffer)
-    s3.put_object(Bucket=S3_BUCKET, Key=key, Body=csv_buffer.getvalue())
-
-# Read csv files from S3
-def read_and_assign_datasets():
-    file_names = [
-        'usd_chf.csv', 'cpi.csv', 'us_rates.csv', 'nasdaq.csv', 'snp.csv', 
-        'eur_usd.csv', 'gdp.csv', 'silver.csv', 'oil.csv', 'platinum.csv', 
-        'palladium.csv', 'gold.csv'
-    ]
-    for file_name in file_names:
-        # Create a variable name by stripping '.csv' from the file name
-        dataset_name = file_name.split('.')[0]
-        # Read the CSV file
-        df = read_s3_file(S3_PREFIX_1 + file_name)
-        # Assign the DataFrame to a variable with the name of the dataset
-        globals()[dataset_name] = df
+    write_frame(storage, key, df, index=True)
+
+# Staging series are partitioned by year (or month) under extraction-staging/<series>/
+PARTITION_FREQ = os.getenv('PARTITION_FREQ', 'year')  # 'year' or 'month'
+
+def staging_objects():
+    # series name -> {object key: signature} for every partition (or legacy single file), in one listing
+    objects = {}
+    for key, signature in storage.signatures(S3_PREFIX_1).items():
+        rest = key[len(S3_PREFIX_1):]
+        name = rest.split('/')[0] if '/' in rest else rest.rsplit('.', 1)[0]
+        objects.setdefault(name, {})[key] = signature
+    return objects
+
+def read_history(name, start=None, objects=None):
+    # Read only the partitions at or after start (all of them when start is None)
+    if objects is None:
+        objects = staging_objects().get(name, {})
+    labels = [key.split('/')[-2] for key in objects if f'/{PARTITION_FREQ}=' in key]
+    # series not migrated to partitions yet
+    if not labels:
+        return read_s3_file(S3_PREFIX_1 + f'{name}.csv')
+    if start is not None:
+        first = pd.Timestamp(start).strftime('%Y-%m' if PARTITION_FREQ == 'month' else '%Y')
+        labels = [label for label in labels if label.split('=')[1] >= first]
+    frames = [read_s3_file(f'{S3_PREFIX_1}{name}/{label}/{name}.csv') for label in sorted(set(labels))]
+    return pd.concat(frames, ignore_index=True)
+
+# Staging series and the value columns each one must provide
+DATASET_COLUMNS = {
+    'usd_chf': ['usd_chf'],
+    'cpi': ['CPI'],
+    'us_rates': ['us_rates_%'],
+    'nasdaq': ['nasdaq open', 'nasdaq high', 'nasdaq low', 'nasdaq close', 'nasdaq volume', 'nasdaq high-low'],
+    'snp': ['sp500 open', 'sp500 high', 'sp500 low', 'sp500 close', 'sp500 volume', 'sp500 high-low'],
+    'eur_usd': ['eur_usd'],
+    'gdp': ['GDP'],
+    'silver': ['silver open', 'silver high', 'silver low', 'silver close', 'silver volume', 'silver high-low'],
+    'oil': ['oil open', 'oil high', 'oil low', 'oil close', 'oil volume', 'oil high-low'],
+    'platinum': ['platinum open', 'platinum high', 'platinum low', 'platinum close', 'platinum volume', 'platinum high-low'],
+    'palladium': ['palladium open', 'palladium high', 'palladium low', 'palladium close', 'palladium volume', 'palladium high-low'],
+    'gold': ['gold open'],
+}
+
+# Compact schema of the loaded series and of the model frame: datetime64 dates, int64 volumes and MODEL_FLOAT
+# values. XGBoost trains on float32 anyway, so float32 values lose nothing the model sees and take half the
+# memory of float64. MODEL_FLOAT=float64 keeps the full precision.
+MODEL_FLOAT = os.getenv('MODEL_FLOAT', 'float32')
+
+def compact_schema(df):
+    dtypes = {}
+    for col in df.columns:
+        if col == 'date':
+            continue
+        # a volume with gaps stays a float, NaN has no integer representation
+        dtypes[col] = 'int64' if col.endswith('volume') and not df[col].isna().any() else MODEL_FLOAT
+    return df.astype(dtypes)
+
+def validate_dataset(name, df):
+    # A 'date' column of unique, increasing dates and numeric value columns
+    missing = [col for col in ['date'] + DATASET_COLUMNS[name] if col not in df.columns]
+    if missing:
+        raise ValueError(f'{name}: missing columns {missing}')
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    not_numeric = [col for col in DATASET_COLUMNS[name] if not pd.api.types.is_numeric_dtype(df[col])]
+    if not_numeric:
+        raise ValueError(f'{name}: non numeric columns {not_numeric}')
+    if not df['date'].is_monotonic_increasing or df['date'].duplicated().any():
+        raise ValueError(f'{name}: dates are not unique and sorted')
+    return compact_schema(df)
+
+class Datasets:
+    # Loaded staging series by name, with what each one was read from (start date and object signatures).
+    # Kept at module level, so warm invocations only reload the series that changed.
+    def __init__(self):
+        self.frames = {}
+        self.sources = {}
+
+    def __getitem__(self, name):
+        return self.frames[name]
+
+    def __contains__(self, name):
+        return name in self.frames
+
+DATASETS = Datasets()
+
+def load_datasets(names=None, start=None):
+    # Read the changed series concurrently into DATASETS and return it
+    names = names or list(DATASET_COLUMNS)
+    objects = staging_objects()
+    sources = {name: (start, objects.get(name, {})) for name in names}
+    changed = [name for name in names if DATASETS.sources.get(name) != sources[name]]
+    if changed:
+        def load(name):
+            return validate_dataset(name, read_history(name, start, sources[name][1]))
+        with ThreadPoolExecutor(max_workers=min(len(changed), POOL_SIZE)) as executor:
+            for name, df in zip(changed, executor.map(load, changed)):
+                DATASETS.frames[name] = df
+                DATASETS.sources[name] = sources[name]
+    return DATASETS
 
 # Dataframe preperation
 # We will use gold's opening price's 30 day exponential moving average as a feature 
@@ -54,137 +137,335 @@ def EMA30(gold):
     gold['gold EMA_30'] = gold['gold open'].ewm(span=30).mean()
     return gold
 
-# dfs start at different dates. find which one has the most recent start date and trim the dataframes
-def most_recent_start_date(*dfs):
-    most_recent_date = None
-    for df in dfs:
-        if not df.empty:
-            df['date'] = pd.to_datetime(df['date'],format='%Y-%m-%d')
-            start_date = df.iloc[0]['date'] 
-            if most_recent_date is None or start_date > most_recent_date:
-                most_recent_date = start_date
-    # Trim the dataframes based on the most recent start date
-    trimmed_dfs = []
+# dfs are stored at their native frequency (daily, monthly, quarterly) and start at different dates. find which one
+# has the most recent start date: the model frame has one row per business day from that date to the last observation,
+# and every series is as-of joined onto that calendar (each day takes the last observation on or before it).
+# The join is a vectorized searchsorted per series and only the selected rows are copied, so time and peak memory grow
+# linearly with the number of series. lean=True fills one preallocated array instead of concatenating per series blocks.
+# merged.attrs['alignment'] reports the common start date and the series that bounded it.
+ALIGNMENT_LEAN = os.getenv('ALIGNMENT_LEAN', 'false') == 'true'
+
+def most_recent_start_date(*dfs, names=None, lean=ALIGNMENT_LEAN):
+    if not dfs:
+        return pd.DataFrame()
+    names = names or [f'df_{i}' for i in range(len(dfs))]
+    dates, rows = [], []
     for df in dfs:
-        trimmed_df = df[df['date'] >= most_recent_date]  
-        trimmed_dfs.append(trimmed_df) 
-    # Merge all dataframes on the 'date' column
-    if trimmed_dfs:
-        merged_df = trimmed_dfs[0]
-        for df in trimmed_dfs[1:]:
-            merged_df = pd.merge(merged_df, df, on='date', how='inner')
-        merged_df = merged_df.drop_duplicates(subset='date', keep='last')
-        return merged_df
+        index = pd.DatetimeIndex(pd.to_datetime(df['date'], format='%Y-%m-%d')) if not df.empty else pd.DatetimeIndex([])
+        # keep the last row of a repeated date; rows maps the sorted unique dates back to positions in df
+        unique = np.flatnonzero(~index.duplicated(keep='last'))
+        order = np.argsort(index[unique], kind='stable')
+        dates.append(index[unique][order])
+        rows.append(unique[order])
+    starts = [index.min() for index in dates if len(index)]
+    most_recent_date = max(starts) if starts else None
+    bounded_by = [name for name, index in zip(names, dates) if len(index) and index.min() == most_recent_date]
+    # the shared trading-day calendar (empty when a series has no rows)
+    if len(starts) == len(dfs):
+        calendar = pd.bdate_range(most_recent_date, max(index.max() for index in dates))
+    else:
+        calendar = pd.DatetimeIndex([])
+    # as-of join: position of each series' last observation on or before every calendar day
+    positions = [row[index.searchsorted(calendar, side='right') - 1] for row, index in zip(rows, dates)]
+    value_columns = [[col for col in df.columns if col != 'date'] for df in dfs]
+    # gaps inside a series (missing observations) carry its previous value, like the as-of join between rows
+    if lean:
+        block = np.empty((len(calendar), sum(len(cols) for cols in value_columns)), dtype=MODEL_FLOAT)
+        col = 0
+        for df, cols, position in zip(dfs, value_columns, positions):
+            for name in cols:
+                block[:, col] = df[name].ffill().to_numpy(dtype=MODEL_FLOAT)[position]
+                col += 1
+        merged_df = pd.DataFrame(block, index=calendar, columns=[name for cols in value_columns for name in cols])
     else:
-        return pd.DataFrame() 
-    
-def model_dataset(model, S3_PREFIX_2):
+        merged_df = pd.concat([df[cols].ffill().iloc[position].set_axis(calendar) for df, cols, position in zip(dfs, value_columns, positions)], axis=1)
+    merged_df = merged_df.rename_axis('date').reset_index()
+    merged_df.attrs['alignment'] = {
+        'start_date': None if most_recent_date is None else most_recent_date.strftime('%Y-%m-%d'),
+        'bounded_by': bounded_by,
+        'rows': len(merged_df),
+    }
+    return merged_df
+
+def model_dataset(model, S3_PREFIX_2, save=True):
     # Set index as date index since we are working with a time series dataframe 
     model.set_index('date', inplace=True)
+    # the aligned frame is on the business-day calendar already, so there are no weekends to remove
     model = model.loc[:, ~model.columns.str.contains('high|low|close|volume', regex=True)]
-    # Remove weekends
-    model['is_weekend'] = model.index.weekday >= 5
-    model = model[model['is_weekend']==False]
-    model.drop(columns='is_weekend',inplace=True)
     model = model[[col for col in model.columns if col != 'gold open'] + ['gold open']]
-    write_s3_file(S3_PREFIX_2 + "model_dataset.csv", model)
+    if save:
+        write_s3_file(S3_PREFIX_2 + "model_dataset.csv", model)
     return model
 
-def data_limits(model):
-    # XGBoost does not handle extrapolation well. We need to know if we are extrapolating
-    model_range = model.copy()
-    model_range['max_range'] = model_range['gold open'].expanding().max()
-    model_range['min_range'] = model_range['gold open'].expanding().min()
-    model_range['min_range'] = model_range['min_range'].shift(1)
-    model_range['max_range'] = model_range['max_range'].shift(1)
-    return model_range
+# XGBoost does not handle extrapolation well. We need to know if we are extrapolating:
+# each row gets the min / max of the target over all the rows before it
+def data_limits(model, target='gold open'):
+    return pd.DataFrame({
+        'min_range': model[target].expanding().min().shift(1),
+        'max_range': model[target].expanding().max().shift(1),
+    }, index=model.index)
+
+def ema30(frame, target):
+    # gold has its EMA_30 feature, the other targets get it from the model frame
+    column = target.replace('open', 'EMA_30')
+    return frame[column] if column in frame else frame[target].ewm(span=30).mean()
+
+# Predictors used instead of the model where it would extrapolate, computed from the model frame
+RANGE_FALLBACKS = {
+    'ema30': ema30,
+    # last known value of the target
+    'previous': lambda frame, target: frame[target].shift(1),
+}
+RANGE_FALLBACK = os.getenv('RANGE_FALLBACK', 'ema30')
+
+def range_guard(pred, check, limits, fallback, trained_until=None):
+    # Vectorized guard: where check is not strictly inside the row's (min_range, max_range), use the fallback.
+    # check is the actual target when evaluating a test set, and the last known value when scoring live.
+    # A model only knows the range of the rows it was trained on, so rows after trained_until keep
+    # the limits of the first row after it.
+    if trained_until is not None:
+        after = limits.index > trained_until
+        if after.any():
+            limits = limits.copy()
+            limits.loc[after] = limits.loc[after].iloc[0].to_numpy()
+    limits = limits.reindex(pred.index)
+    outside = ~((check > limits['min_range']) & (check < limits['max_range']))
+    return pred.where(~outside, fallback.reindex(pred.index)), outside
+
+# Grid Search results
+PARAM_GRID = {
+    'max_depth': [2],  
+    'learning_rate': [0.1],  
+    'n_estimators': [100],  
+    'subsample': [0.7],  
+    'colsample_bytree': [0.9],  
+    'colsample_bylevel': [0.9],  
+    'min_child_weight': [1],  
+    'reg_alpha': [0.1],  
+    'reg_lambda': [0.5],  
+}
+
+# Model registry and warm start (see model_registry.py)
+MODEL_NAME = 'gold_open'
+# 'warm' continues the registered model when the policy below allows it, 'full' always retrains from scratch
+TRAINING_MODE = os.getenv('TRAINING_MODE', 'warm')
+# trees added by a warm start, fitted on the rows added since the registered version
+WARM_START_TREES = int(os.getenv('WARM_START_TREES', 10))
+# below this many new rows the registered model is reused as is
+WARM_MIN_ROWS = int(os.getenv('WARM_MIN_ROWS', 20))
+# a full retrain is forced after this many warm starts or days since the last full training,
+# which also picks up revisions of rows the model was already trained on
+WARM_MAX_UPDATES = int(os.getenv('WARM_MAX_UPDATES', 10))
+FULL_RETRAIN_DAYS = int(os.getenv('FULL_RETRAIN_DAYS', 30))
+# fit budget of the hyperparameter search (unbounded when unset)
+SEARCH_MAX_FITS = int(os.environ['SEARCH_MAX_FITS']) if os.getenv('SEARCH_MAX_FITS') else None
+
+# Multi-target mode: every opening price of the merged dataset can be forecast from the others.
+# TARGETS (comma separated, or 'all') selects them; the default keeps the single gold model.
+FORECAST_TARGETS = ['gold open', 'silver open', 'platinum open', 'palladium open', 'oil open']
+TARGETS = os.getenv('TARGETS', 'gold open')
+
+def model_name(target):
+    # registry name of a target's model, 'gold open' -> 'gold_open'
+    return target.replace(' ', '_')
+
+# rows at the end of the model frame held out as test set
+TEST_ROWS = int(os.getenv('TEST_ROWS', 300))
+
+def training_plan(metadata, feature_columns, train_index, training_mode):
+    # ('full' | 'warm' | 'reuse', reason)
+    if training_mode == 'full':
+        return 'full', 'full training requested'
+    if metadata is None:
+        return 'full', 'no registered model'
+    if metadata['feature_columns'] != feature_columns:
+        return 'full', 'feature columns changed'
+    if metadata['warm_updates'] >= WARM_MAX_UPDATES:
+        return 'full', f"{metadata['warm_updates']} warm starts since the last full training"
+    days = (datetime.now() - datetime.fromisoformat(metadata['full_trained_at'])).days
+    if days >= FULL_RETRAIN_DAYS:
+        return 'full', f'{days} days since the last full training'
+    new_rows = int((train_index > pd.Timestamp(metadata['trained_until'])).sum())
+    if new_rows < WARM_MIN_ROWS:
+        return 'reuse', f'{new_rows} new rows'
+    return 'warm', f'{new_rows} new rows'
 
 # XGBoost implementation
-def model_implementation(model, model_range, S3_PREFIX_3):
-    # Feature matrix and target vector
-    X = model.iloc[:,:-1]
-    y = model.iloc[:,-1:]
-    # last 300 days as test set
-    # Create column to divide into train and test
-    X['split'] = 'train'
-    mask = X.index.isin(X.index[-300:])
-    X.loc[mask, 'split'] = 'test'
-    y['split'] = 'train'
-    mask = y.index.isin(y.index[-300:])
-    y.loc[mask, 'split'] = 'test'
-    X_train = X[X['split']=='train']
-    X_test = X[X['split']=='test']
-    y_train = y[y['split']=='train']
-    y_test = y[y['split']=='test']
-    X_train.drop(columns='split',inplace=True)
-    X_test.drop(columns='split',inplace=True)
-    y_test.drop(columns='split',inplace=True)
-    y_train.drop(columns='split',inplace=True)
-    # Scale the features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    # Grid Search results
-    param_grid = {
-        'max_depth': [2],  
-        'learning_rate': [0.1],  
-        'n_estimators': [100],  
-        'subsample': [0.7],  
-        'colsample_bytree': [0.9],  
-        'colsample_bylevel': [0.9],  
-        'min_child_weight': [1],  
-        'reg_alpha': [0.1],  
-        'reg_lambda': [0.5],  
+def model_implementation(model, model_range, S3_PREFIX_3, training_mode=TRAINING_MODE, target='gold open',
+                         results_key=None, threads=None):
+    # The ML stack is imported on first use instead of at cold start
+    from xgboost import XGBRegressor
+    from sklearn.metrics import mean_squared_error
+    from sklearn.preprocessing import StandardScaler
+    name = model_name(target)
+    # CPUs of this training: its share when targets are trained side by side, else all the effective ones
+    cpus = threads or effective_cpus()
+    # Feature matrix and target vector: the other columns are the features of the target
+    X = model.drop(columns=target)
+    y = model[target]
+    # last TEST_ROWS days as test set: the model frame is sorted by date, so the split is a slice of rows
+    # (views of X and y, no tagged copies)
+    X_train, X_test = X.iloc[:-TEST_ROWS], X.iloc[-TEST_ROWS:]
+    y_train, y_test = y.iloc[:-TEST_ROWS], y.iloc[-TEST_ROWS:]
+    with stage('train', target=target) as train:
+        train.rows = len(X_train)
+        metadata = load_metadata(storage, name)
+        plan, reason = training_plan(metadata, list(X_train.columns), X_train.index, training_mode)
+        print(f'{name} training plan: {plan} ({reason})')
+        if plan == 'full':
+            # Grid Search results
+            param_grid = PARAM_GRID
+            xgb_model = XGBRegressor(objective='reg:squarederror', n_jobs=cpus)
+            # folds of whole calendar periods, so the cached fold scores of earlier periods stay valid as rows are added
+            folds = calendar_folds(X_train.index)
+            # a single configuration is fitted once, real grids are searched with cached successive halving.
+            # The features are scaled inside the search: per fold for the scores, on all training rows for the refit
+            grid_search = search(xgb_model, param_grid, X_train, y_train, folds, storage=storage,
+                                 cache_name=name, max_fits=SEARCH_MAX_FITS, cpus=cpus, preprocess=StandardScaler())
+            scaler = grid_search.preprocess_
+            print(f"{name} search: {grid_search.n_fits} fits, {grid_search.cache_hits} cached fold scores, {cpus} CPUs")
+            print(f"{name} best reg parameters found: ", grid_search.best_params_)
+            best_model = grid_search.best_estimator_
+            params = grid_search.best_params_
+            lineage = {'kind': 'full', 'warm_updates': 0, 'full_trained_at': datetime.now().isoformat()}
+        else:
+            best_model, scaler, metadata = load_version(storage, name, metadata['version'])
+            params = metadata['params']
+            if plan == 'warm':
+                # continue boosting on the new rows; the registered scaler is kept so the existing trees stay valid
+                new_rows = X_train.index > pd.Timestamp(metadata['trained_until'])
+                warm_model = XGBRegressor(objective='reg:squarederror', n_jobs=cpus, **{**params, 'n_estimators': WARM_START_TREES})
+                best_model = warm_model.fit(scaler.transform(X_train[new_rows]), y_train[new_rows], xgb_model=best_model.get_booster())
+                lineage = {'kind': 'warm', 'warm_updates': metadata['warm_updates'] + 1, 'full_trained_at': metadata['full_trained_at']}
+        if plan == 'reuse':
+            trained_until = pd.Timestamp(metadata['trained_until'])
+        else:
+            trained_until = X_train.index[-1]
+            metadata = save_version(storage, name, best_model, scaler, {
+                'target': target,
+                'feature_columns': list(X_train.columns),
+                'trained_until': trained_until.strftime('%Y-%m-%d'),
+                # range of the target the model was trained on, for the extrapolation guard when scoring
+                'target_min': float(y_train.min()),
+                'target_max': float(y_train.max()),
+                'params': params,
+                **lineage,
+            })
+            print(f"Registered {name} version {metadata['version']} ({metadata['kind']}, {metadata['n_trees']} trees)")
+    with stage('evaluate', target=target) as evaluate:
+        evaluate.rows = len(X_test)
+        X_test_scaled = scaler.transform(X_test)
+        y_pred_test = best_model.predict(X_test_scaled)
+        test_df = X_test.copy()
+        test_df[target] = y_test
+        test_df[f'{target} pred'] = y_pred_test
+        # check the limits of each test row to avoid bad results in case of extrapolation
+        fallback = RANGE_FALLBACKS[RANGE_FALLBACK](model, target)
+        test_df[f'{target} pred'], outside_range = range_guard(test_df[f'{target} pred'], test_df[target], model_range, fallback,
+                                                               trained_until=trained_until)
+        # Test performance
+        test2_rmse = np.sqrt(mean_squared_error(test_df[[target]], test_df[f'{target} pred']))
+        # To monitor performance
+        print(f'{name} test RMSE: {test2_rmse} ({int(outside_range.sum())} rows outside the range)')
+        # add error to the test dataframe
+        test_df['Error'] = test_df[target] - test_df[f'{target} pred']
+        test_df = test_df[~test_df.index.duplicated(keep='last')]
+        write_s3_file(results_key or S3_PREFIX_3 + "results.csv", test_df)
+    return {'target': target, 'plan': plan, 'version': metadata['version'], 'rmse': test2_rmse,
+            'outside_range': int(outside_range.sum())}
+
+# Multi-target training: the aligned model frame is built once and shared, and one model per target is
+# trained on a thread pool (XGBoost releases the GIL). The effective CPUs (see executor.py) are split between
+# the targets so that workers x threads never exceeds them. Results go to model-results/targets/<model name>/results.csv
+# and the per-target test metrics to model-results/target-metrics/metrics.csv.
+def train_targets(model, targets, training_mode=TRAINING_MODE, workers=None):
+    cpus = effective_cpus()
+    workers = min(workers or cpus, len(targets))
+    threads = max(1, cpus // workers)
+    print(f'Training {len(targets)} targets: {workers} workers x {threads} threads')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(model_implementation, model, data_limits(model, target), S3_PREFIX_3, training_mode,
+                            target=target, threads=threads,
+                            results_key=S3_PREFIX_3 + f'targets/{model_name(target)}/results.csv')
+            for target in targets
+        ]
+        metrics = pd.DataFrame([future.result() for future in futures]).set_index('target')
+    write_s3_file(S3_PREFIX_3 + 'target-metrics/metrics.csv', metrics)
+    return metrics
+
+
+# Order of the series in the merged model dataset
+MODEL_SERIES = ['snp', 'nasdaq', 'us_rates', 'cpi', 'usd_chf', 'eur_usd', 'gdp', 'silver', 'oil', 'platinum', 'palladium', 'gold']
+
+# Memory budget mode (MEMORY_BUDGET_MB, or the event's 'memory_budget_mb'): the model frame is aligned into one
+# preallocated block and the run reports its peak memory against the budget, with the smallest memory size
+# that would have fitted it. Without a budget the report is printed too, against the function's memory size.
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', 0))
+
+def memory_report(model, budget_mb=None):
+    budget_mb = budget_mb or int(os.getenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', 0))
+    peak = peak_rss_mb()
+    report = {
+        'model_frame_mb': round(float(model.memory_usage(deep=True).sum()) / 2 ** 20, 1),
+        'model_frame_shape': list(model.shape),
+        'peak_rss_mb': peak,
+        # 25% over the peak, rounded up to 64 MB (Lambda's minimum is 128 MB)
+        'suggested_memory_mb': max(128, int(np.ceil(peak * 1.25 / 64)) * 64),
     }
-    xgb_model = XGBRegressor(objective='reg:squarederror')
-    splits = 11
-    # Initialize TimeSeriesSplit with the number of splits
-    tscv = TimeSeriesSplit(n_splits=splits) 
-    grid_search = GridSearchCV(estimator=xgb_model, param_grid=param_grid, 
-                            scoring='neg_root_mean_squared_error', cv=tscv, verbose=1, n_jobs=-1)
-    grid_search.fit(X_train_scaled, y_train)
-    print("Best reg parameters found: ", grid_search.best_params_)
-    best_model = grid_search.best_estimator_
-    y_pred_test = best_model.predict(X_test_scaled)
-    test_df = X_test.copy()
-    test_df['gold open'] = y_test
-    test_df['gold open pred'] = y_pred_test
-    # get first test row
-    first_test_row = test_df.index[0] 
-    # check what were the limits before the test set to avoid bad results in case of extrapolation
-    model_range_limits = model_range[model_range.index == first_test_row]
-    lower_limit = model_range_limits['min_range'][0]
-    higher_limit = model_range_limits['max_range'][0]
-    test_df['min_range'] = lower_limit
-    test_df['max_range'] = higher_limit
-    test_df['outside_range'] = test_df.apply( lambda x: False if x['gold open']>x['min_range'] and x['gold open']<x['max_range'] else True, axis = 1)
-    test_df['gold open pred'] = test_df.apply(lambda x: x['gold EMA_30'] if x['outside_range']==True else x['gold open pred'], axis = 1)
-    # Test performance
-    test2_rmse = np.sqrt(mean_squared_error(test_df[['gold open']], test_df['gold open pred']))
-    # To monitor performance
-    print(f'Test RMSE: {test2_rmse}')
-    test_df.drop(columns={'min_range', 'max_range', 'outside_range'}, inplace=True)
-    # add error to the test dataframe
-    test_df['Error'] = test_df['gold open'] - test_df['gold open pred']
-    test_df = test_df[~test_df.index.duplicated(keep='last')]
-    write_s3_file(S3_PREFIX_3 + "results.csv", test_df)
-
-
-read_and_assign_datasets()
-gold = EMA30(gold)
+    if budget_mb:
+        report['budget_mb'] = budget_mb
+        report['headroom_mb'] = round(budget_mb - peak, 1)
+    print(f'Memory: {report}')
+    if budget_mb and peak > budget_mb:
+        print(f'Warning: peak memory {peak} MB is over the budget of {budget_mb} MB')
+    return report
 
+def build_model_frame(save=True, lean=ALIGNMENT_LEAN):
+    with stage('load_datasets') as load:
+        datasets = load_datasets(MODEL_SERIES)
+        load.rows = sum(len(datasets[name]) for name in MODEL_SERIES)
+    # the feature store appends the feature columns (gold EMA_30) to copies of their series,
+    # computing only the rows added since the previous run
+    with stage('features'):
+        featured = add_features(storage, datasets)
+    # feature values are computed in float64 and stored in the compact schema like the series
+    frames = [compact_schema(featured[name]) if name in featured else datasets[name] for name in MODEL_SERIES]
+    with stage('align') as align:
+        model = most_recent_start_date(*frames, names=MODEL_SERIES, lean=lean)
+        align.rows = len(model)
+    print(f"Alignment: {model.attrs['alignment']}")
+    with stage('model_dataset') as dataset:
+        model = model_dataset(model, S3_PREFIX_2, save)
+        dataset.rows = len(model)
+    return model
+
+# Nothing runs at import: the datasets are read by the invocation itself
+@instrument('model', storage)
 def lambda_handler(event, context):
-    model = most_recent_start_date(snp, nasdaq, us_rates, cpi, usd_chf, eur_usd, gdp, silver, oil, platinum, palladium, gold)
-    model = model_dataset(model, S3_PREFIX_2)
-    model_range = data_limits(model)
-    model_implementation(model, model_range, S3_PREFIX_3)
+    # after a sharded extraction the EventBridge event carries the run: train only on a complete fan-in
+    run_id = event.get('detail', {}).get('run_id')
+    if run_id is not None and load_complete(storage, run_id) is None:
+        return {
+            'statusCode': 409,
+            'body': json.dumps(f'Extraction run {run_id} is not complete')
+        }
+    budget_mb = event.get('memory_budget_mb', MEMORY_BUDGET_MB)
+    model = build_model_frame(lean=ALIGNMENT_LEAN or bool(budget_mb))
+    training_mode = event.get('training_mode', TRAINING_MODE)
+    targets = event.get('targets', TARGETS)
+    targets = FORECAST_TARGETS if targets == 'all' else targets.split(',') if isinstance(targets, str) else targets
+    if targets == ['gold open']:
+        model_range = data_limits(model)
+        model_implementation(model, model_range, S3_PREFIX_3, training_mode)
+    else:
+        print(train_targets(model, targets, training_mode, event.get('workers')))
+    memory_report(model, budget_mb)
 
-    # Initialize a Glue client
-    glue_client = boto3.client('glue')
     crawler_name = 'financial-project-1-crawler'
     try:
         # Start the Glue Crawler
-        response = glue_client.start_crawler(Name=crawler_name)
+        response = storage.start_crawler(crawler_name)
         return {
             'statusCode': 200,
             'body': json.dumps(f"Crawler '{crawler_name}' started; Model implemented successfully")
@@ -197,5 +478,32 @@ def lambda_handler(event, context):
         }
 
 
-response = lambda_handler({}, {})
-print(response)
+# Walk-forward backtest (see backtest.py). It runs windows on a process pool, so it is meant for a multi-core
+# box or container: Lambda has no /dev/shm for multiprocessing. Event keys (all optional): horizons, min_train,
+# step, train_window (rows, expanding when missing) and workers.
+@instrument('backtest', storage)
+def backtest_handler(event, context):
+    from backtest import backtest
+    model = build_model_frame(save=False)
+    # parameters of the registered model, or the grid's when there is none
+    metadata = load_metadata(storage, MODEL_NAME)
+    params = metadata['params'] if metadata else {key: values[0] for key, values in PARAM_GRID.items()}
+    options = {key: event[key] for key in ['min_train', 'step', 'train_window', 'workers'] if key in event}
+    metrics = backtest(model, params, horizons=tuple(event.get('horizons', (1, 5, 20, 60))), **options)
+    run = datetime.now().strftime('%Y-%m-%d')
+    write_s3_file(S3_PREFIX_3 + f'backtest/{run}/metrics.csv', metrics.set_index('date'))
+    summary = metrics.groupby('horizon')[['rmse', 'mae']].mean().round(4)
+    print(summary)
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'windows': int(metrics['date'].nunique()), 'rmse_by_horizon': summary['rmse'].to_dict()})
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'backtest':
+        response = backtest_handler({}, {})
+    else:
+        response = lambda_handler({}, {})
+    print(response)
+
@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+import numpy as np
+
+# Versioned models in the storage backend, under model-registry/<name>/:
+#   v0001/booster.ubj    XGBoost booster in its native binary (UBJSON) format
+#   v0001/metadata.json  scaler statistics, feature columns, training window, parameters and lineage
+#   latest.json          the current version
+REGISTRY_PREFIX = 'model-registry/'
+
+def version_prefix(name, version):
+    return f'{REGISTRY_PREFIX}{name}/v{version:04d}/'
+
+def latest_version(storage, name):
+    try:
+        return json.loads(storage.get(f'{REGISTRY_PREFIX}{name}/latest.json'))['version']
+    except KeyError:
+        return None
+
+def scaler_state(scaler):
+    return {
+        'mean': scaler.mean_.tolist(),
+        'scale': scaler.scale_.tolist(),
+        'var': scaler.var_.tolist(),
+        'n_samples_seen': int(scaler.n_samples_seen_),
+    }
+
+def restore_scaler(state, feature_columns):
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler()
+    scaler.mean_ = np.array(state['mean'])
+    scaler.scale_ = np.array(state['scale'])
+    scaler.var_ = np.array(state['var'])
+    scaler.n_samples_seen_ = state['n_samples_seen']
+    scaler.n_features_in_ = len(feature_columns)
+    scaler.feature_names_in_ = np.array(feature_columns, dtype=object)
+    return scaler
+
+def save_version(storage, name, regressor, scaler, metadata):
+    # Store a new version and point latest.json at it; returns the stored metadata
+    version = (latest_version(storage, name) or 0) + 1
+    prefix = version_prefix(name, version)
+    metadata = {
+        **metadata,
+        'version': version,
+        'created': datetime.now().isoformat(),
+        'n_trees': regressor.get_booster().num_boosted_rounds(),
+        'scaler': scaler_state(scaler),
+    }
+    storage.put(prefix + 'booster.ubj', bytes(regressor.get_booster().save_raw(raw_format='ubj')))
+    storage.put(prefix + 'metadata.json', json.dumps(metadata))
+    # written last, so readers never see a version without its files
+    storage.put(f'{REGISTRY_PREFIX}{name}/latest.json', json.dumps({'version': version}))
+    return metadata
+
+def load_metadata(storage, name, version=None):
+    version = version or latest_version(storage, name)
+    if version is None:
+        return None
+    return json.loads(storage.get(version_prefix(name, version) + 'metadata.json'))
+
+def load_version(storage, name, version=None):
+    # (regressor, scaler, metadata) of a version (the latest one by default), or None when there is none
+    from xgboost import XGBRegressor
+    metadata = load_metadata(storage, name, version)
+    if metadata is None:
+        return None
+    regressor = XGBRegressor()
+    regressor.load_model(bytearray(storage.get(version_prefix(name, metadata['version']) + 'booster.ubj')))
+    return regressor, restore_scaler(metadata['scaler'], metadata['feature_columns']), metadata
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from storage import LocalStorage
+
+# Cache of provider API responses, so reruns and backfills of the same day are served locally
+# instead of spending API quota. RESPONSE_CACHE selects where entries live:
+#   'storage' (default) under api-cache/ in the storage backend, so it survives across invocations
+#   'disk'    in RESPONSE_CACHE_DIR (e.g. /tmp of a warm container)
+#   'off'     no caching
+# Entries are keyed by (provider, function, symbol, outputsize, start, end), expire after the TTL
+# of their series, and the oldest ones are evicted once the cache is larger than RESPONSE_CACHE_MAX_MB.
+# Each entry object holds the time it was stored next to the response, so it is served on its own. The
+# index (object key -> stored time and size) only saves reading every entry to evict. Concurrent shards
+# write it too, so it is re-read and reconciled with the listing of the cache before every write: an entry
+# another process wrote, or whose index update was lost, is added back instead of being orphaned.
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', 'storage')
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '/tmp/api-cache')
+RESPONSE_CACHE_MAX_MB = float(os.getenv('RESPONSE_CACHE_MAX_MB', 200))
+CACHE_PREFIX = 'api-cache/'
+INDEX_KEY = CACHE_PREFIX + 'index.json'
+
+class ResponseCache:
+    def __init__(self, store, max_bytes):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = {}  # object key -> {'stored': epoch seconds, 'bytes': size}, as of the last write
+
+    def read_index(self):
+        try:
+            return json.loads(self.store.get(INDEX_KEY))
+        except KeyError:
+            return {}
+
+    def reconcile(self, index):
+        # the index of the entries in the cache: listed entries it lacks are read, missing ones dropped
+        listed = set(self.store.list(CACHE_PREFIX)) - {INDEX_KEY}
+        for key in set(index) - listed:
+            del index[key]
+        for key in listed - set(index):
+            try:
+                body = self.store.get(key)
+            except KeyError:
+                continue
+            index[key] = {'stored': stored_time(json.loads(body)), 'bytes': len(body)}
+        return index
+
+    def object_key(self, request):
+        digest = hashlib.sha1(json.dumps(request, sort_keys=True).encode()).hexdigest()[:16]
+        return f"{CACHE_PREFIX}{request['provider']}/{request['symbol'] or request['function']}-{digest}.json"
+
+    def get(self, request, ttl_hours):
+        key = self.object_key(request)
+        with self.lock:
+            known = self.index.get(key)
+        # expired as of this process' last look at the index: skip the download
+        if known is not None and time.time() - known['stored'] > ttl_hours * 3600:
+            return None
+        try:
+            entry = json.loads(self.store.get(key))
+        except KeyError:
+            return None
+        if time.time() - stored_time(entry) > ttl_hours * 3600:
+            return None
+        return entry['response']
+
+    def put(self, request, data):
+        key = self.object_key(request)
+        stored = time.time()
+        body = json.dumps({'stored': stored, 'response': data}).encode()
+        self.store.put(key, body)
+        with self.lock:
+            index = self.reconcile(self.read_index())
+            index[key] = {'stored': stored, 'bytes': len(body)}
+            self.evict(index)
+            self.store.put(INDEX_KEY, json.dumps(index))
+            self.index = index
+
+    def evict(self, index):
+        # oldest entries first until the cache fits in max_bytes
+        total = sum(entry['bytes'] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]['stored']):
+            if total <= self.max_bytes:
+                break
+            total -= index.pop(key)['bytes']
+            self.store.delete(key)
+
+def stored_time(entry):
+    # entries written before they carried their stored time count as expired
+    return entry.get('stored', 0) if 'response' in entry else 0
+
+def get_response_cache(storage):
+    if RESPONSE_CACHE == 'off':
+        return None
+    store = LocalStorage(RESPONSE_CACHE_DIR) if RESPONSE_CACHE == 'disk' else storage
+    return ResponseCache(store, RESPONSE_CACHE_MAX_MB * 1024 * 1024)
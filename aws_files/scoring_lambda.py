@@ -0,0 +1,83 @@
+import os
+import json
+import pandas as pd
+from model_lambda import (storage, read_s3_file, write_s3_file, S3_PREFIX_3, MODEL_NAME, MODEL_SERIES,
+                          RANGE_FALLBACKS, RANGE_FALLBACK, load_datasets, EMA30, most_recent_start_date,
+                          model_dataset, range_guard)
+from model_registry import latest_version, load_version
+from metrics import instrument, stage
+
+# Low latency scoring: predicts gold open for the dates not scored yet with the registered model, and
+# appends them to model-results/predictions.csv. Training (model_lambda.lambda_handler) runs on its own schedule.
+# Deploy it from the same image with the command 'scoring_lambda.lambda_handler'.
+
+PREDICTIONS_KEY = S3_PREFIX_3 + 'predictions.csv'
+# Calendar days of history read before the first date to score. It has to cover the warm-up of the
+# EMA30 feature: after ~300 rows the weight of older prices is below 1e-8.
+FEATURE_LOOKBACK_DAYS = int(os.getenv('FEATURE_LOOKBACK_DAYS', 450))
+
+# Registered model kept between warm invocations, reloaded only when a new version is registered
+_model = {}
+
+def registered_model():
+    version = latest_version(storage, MODEL_NAME)
+    if version is None:
+        return None
+    if _model.get('version') != version:
+        regressor, scaler, metadata = load_version(storage, MODEL_NAME, version)
+        _model.update(version=version, regressor=regressor, scaler=scaler, metadata=metadata)
+    return _model
+
+def read_predictions():
+    try:
+        predictions = read_s3_file(PREDICTIONS_KEY)
+    except KeyError:
+        return pd.DataFrame()
+    predictions['date'] = pd.to_datetime(predictions['date'], format='%Y-%m-%d')
+    return predictions
+
+@instrument('scoring', storage)
+def lambda_handler(event, context):
+    with stage('load_model'):
+        model = registered_model()
+    if model is None:
+        return {'statusCode': 500, 'body': json.dumps(f'Error: no registered {MODEL_NAME} model')}
+    metadata = model['metadata']
+    predictions = read_predictions()
+    # score the dates after the last prediction, or after the training data the first time
+    last_scored = predictions['date'].max() if not predictions.empty else pd.Timestamp(metadata['trained_until'])
+    with stage('features') as features:
+        datasets = load_datasets(MODEL_SERIES, start=last_scored - pd.Timedelta(days=FEATURE_LOOKBACK_DAYS))
+        frames = [datasets[name] for name in MODEL_SERIES[:-1]] + [EMA30(datasets['gold'].copy())]
+        frame = model_dataset(most_recent_start_date(*frames, names=MODEL_SERIES), None, save=False)
+        new = frame[frame.index > last_scored]
+        features.rows = len(new)
+    if new.empty:
+        return {'statusCode': 200, 'body': json.dumps('No new dates to score')}
+    with stage('predict') as predict:
+        X_new = model['scaler'].transform(new[metadata['feature_columns']])
+        pred = pd.Series(model['regressor'].predict(X_new), index=new.index)
+        predict.rows = len(pred)
+    # live guard: the last known gold open against the range the model was trained on
+    limits = pd.DataFrame({'min_range': metadata['target_min'], 'max_range': metadata['target_max']}, index=new.index)
+    check = frame['gold open'].shift(1).reindex(new.index)
+    fallback = RANGE_FALLBACKS[RANGE_FALLBACK](frame, 'gold open')
+    pred, outside_range = range_guard(pred, check, limits, fallback)
+    scored = pd.DataFrame({
+        'gold open': new['gold open'],
+        'gold open pred': pred,
+        'outside_range': outside_range,
+        'model_version': metadata['version'],
+    }, index=new.index).rename_axis('date').reset_index()
+    with stage('write') as write:
+        write_s3_file(PREDICTIONS_KEY, pd.concat([predictions, scored], ignore_index=True).set_index('date'))
+        write.rows = len(scored)
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f"Scored {len(scored)} dates up to {scored['date'].iloc[-1]:%Y-%m-%d} with version {metadata['version']}")
+    }
+
+
+if __name__ == '__main__':
+    response = lambda_handler({}, {})
+    print(response)
@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from executor import effective_cpus, plan, run, with_threads
+
+# Hyperparameter search used by model_implementation instead of GridSearchCV.
+# - A grid with a single configuration is fitted once, without cross validation.
+# - Real grids use successive halving over the time series folds: every candidate is scored on the
+#   most recent folds, the best 1/factor of them move on to factor times more folds, until all folds
+#   are used or one candidate is left. max_fits stops the search early at the last completed rung.
+# - The folds are calendar periods (calendar_folds): each test set is one complete period and its training
+#   set every row before it. A new row only adds a fold once its period is complete, and the others keep
+#   their rows, so yesterday's fold scores still apply today.
+# - Fold scores are cached in the storage backend by a hash of the parameters and of the fold's raw data.
+#   Preprocessing (the scaler) is fitted on each fold's training rows, so it does not depend on later rows
+#   either. A repeated search only fits new configurations or folds whose data changed.
+# - The fits of a rung share cpus (see executor.py): fold level when there are enough of them, tree level
+#   threads for the rest, and all of them for the single fits (one configuration, the final refit).
+SEARCH_CACHE_PREFIX = 'search-cache/'
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 5000))
+# cross validation folds: the last SEARCH_FOLDS complete periods of SEARCH_FOLD_FREQ (a pandas period alias)
+SEARCH_FOLDS = int(os.getenv('SEARCH_FOLDS', 11))
+SEARCH_FOLD_FREQ = os.getenv('SEARCH_FOLD_FREQ', 'Y')
+
+class SearchResult:
+    # Same attribute names as GridSearchCV for the parts model_implementation uses
+    def __init__(self, best_params, best_estimator, cv_results, n_fits, cache_hits, preprocess=None):
+        self.best_params_ = best_params
+        self.best_estimator_ = best_estimator
+        # the preprocessing fitted on all rows, which best_estimator_ expects its inputs through
+        self.preprocess_ = preprocess
+        self.cv_results_ = cv_results
+        self.n_fits = n_fits
+        self.cache_hits = cache_hits
+
+def calendar_folds(dates, n_folds=SEARCH_FOLDS, freq=SEARCH_FOLD_FREQ):
+    # (train, test) row positions of the last n_folds complete periods of the sorted dates. The period of the
+    # last date may still get rows, so it is never a test set.
+    periods = pd.DatetimeIndex(dates).to_period(freq)
+    folds = []
+    for period in periods.unique()[:-1][-n_folds:]:
+        test = np.flatnonzero(periods == period)
+        if test[0] > 0:
+            folds.append((np.arange(test[0]), test))
+    return folds
+
+def fold_key(params, X, y, train, test, preprocess=None):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode())
+    if preprocess is not None:
+        digest.update(repr(preprocess).encode())
+    for part in (X[train], y[train], X[test], y[test]):
+        digest.update(np.ascontiguousarray(part).tobytes())
+    return digest.hexdigest()
+
+def fit_score(estimator, X, y, train, test, preprocess=None):
+    # RMSE of one candidate on one fold, the preprocessing fitted on the fold's training rows
+    X_train, X_test = X[train], X[test]
+    if preprocess is not None:
+        from sklearn.base import clone
+        preprocess = clone(preprocess).fit(X_train)
+        X_train, X_test = preprocess.transform(X_train), preprocess.transform(X_test)
+    estimator.fit(X_train, y[train])
+    return float(np.sqrt(np.mean((y[test] - estimator.predict(X_test)) ** 2)))
+
+def load_cache(storage, cache_name):
+    if storage is None or cache_name is None:
+        return {}
+    try:
+        return json.loads(storage.get(f'{SEARCH_CACHE_PREFIX}{cache_name}.json'))
+    except KeyError:
+        return {}
+
+def save_cache(storage, cache_name, cache):
+    if storage is None or cache_name is None:
+        return
+    # dicts keep insertion order, so the oldest scores are dropped first
+    entries = list(cache.items())[-SEARCH_CACHE_MAX_ENTRIES:]
+    storage.put(f'{SEARCH_CACHE_PREFIX}{cache_name}.json', json.dumps(dict(entries)))
+
+def search(estimator, param_grid, X, y, cv, storage=None, cache_name=None, factor=3, min_folds=2, max_fits=None, cpus=None,
+           preprocess=None):
+    # cv is a list of (train, test) row positions (see calendar_folds) or a scikit-learn splitter. preprocess is
+    # an unfitted transformer applied to the inputs of every fit, fitted on that fit's training rows.
+    from sklearn.base import clone
+    from sklearn.model_selection import ParameterGrid
+    # the refit's preprocessing sees X as given, e.g. with its column names
+    fitted = clone(preprocess).fit(X) if preprocess is not None else None
+    X_all = np.asarray(fitted.transform(X) if fitted is not None else X)
+    X = np.asarray(X)
+    y = np.asarray(y).ravel()
+    cpus = cpus or effective_cpus()
+    candidates = list(ParameterGrid(param_grid))
+    if len(candidates) == 1:
+        # nothing to compare: skip cross validation
+        params = candidates[0]
+        return SearchResult(params, with_threads(clone(estimator).set_params(**params), cpus).fit(X_all, y), [], n_fits=1,
+                            cache_hits=0, preprocess=fitted)
+    folds = list(cv.split(X)) if hasattr(cv, 'split') else list(cv)
+    cache = load_cache(storage, cache_name)
+    scores = [{} for _ in candidates]  # candidate -> {fold: rmse}
+    alive = list(range(len(candidates)))
+    n_folds = min(min_folds, len(folds))
+    fits = hits = 0
+    rung_means = None
+    while True:
+        rung_folds = range(len(folds) - n_folds, len(folds))
+        todo = []
+        for c in alive:
+            for f in rung_folds:
+                if f in scores[c]:
+                    continue
+                key = fold_key(candidates[c], X, y, *folds[f], preprocess)
+                if key in cache:
+                    scores[c][f] = cache[key]
+                    hits += 1
+                else:
+                    todo.append((c, f, key))
+        # out of budget: keep the ranking of the last completed rung
+        if rung_means is not None and max_fits is not None and fits + len(todo) > max_fits:
+            break
+        rung = plan(len(todo), cpus, rows=len(folds[-1][0]))
+        results = run(fit_score, [
+            (with_threads(clone(estimator).set_params(**candidates[c]), rung.threads), X, y, *folds[f], preprocess)
+            for c, f, _ in todo
+        ], rung)
+        fits += len(todo)
+        for (c, f, key), score in zip(todo, results):
+            scores[c][f] = score
+            cache[key] = score
+        rung_means = {c: float(np.mean([scores[c][f] for f in rung_folds])) for c in alive}
+        if n_folds == len(folds):
+            break
+        alive = sorted(alive, key=rung_means.get)[:max(1, len(alive) // factor)]
+        # a single candidate left has nothing to be compared with on more folds
+        if len(alive) == 1:
+            break
+        n_folds = min(len(folds), n_folds * factor)
+    best = min(alive, key=rung_means.get)
+    save_cache(storage, cache_name, cache)
+    cv_results = [
+        {'params': params, 'folds': len(scores[c]), 'mean_rmse': float(np.mean(list(scores[c].values())))}
+        for c, params in enumerate(candidates)
+    ]
+    best_estimator = with_threads(clone(estimator).set_params(**candidates[best]), cpus).fit(X_all, y)
+    return SearchResult(candidates[best], best_estimator, cv_results, n_fits=fits + 1, cache_hits=hits, preprocess=fitted)
@@ -0,0 +1,36 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Runs every shard of a sharded extraction locally, one lambda invocation per shard on a process pool,
+# to test the fan-out / fan-in without deploying. The shards only share the storage backend, so
+# STORAGE_BACKEND has to be 'local' (or 's3'), not 'memory'.
+#
+#   STORAGE_BACKEND=local python shard_runner.py --shards 8 --workers 4
+
+def run_shard(event):
+    import extraction_lambda
+    return extraction_lambda.lambda_handler(event, {})
+
+def run_local(shards, workers=None, run_id=None, mode='concurrent'):
+    from storage import STORAGE_BACKEND, get_storage
+    from manifest import load_complete
+    if STORAGE_BACKEND == 'memory':
+        raise ValueError("Shards run in separate processes: use STORAGE_BACKEND='local' or 's3'")
+    run_id = run_id or datetime.now().strftime('local-%Y-%m-%dT%H-%M-%S')
+    events = [{'run_id': run_id, 'shard': shard, 'shards': shards, 'mode': mode} for shard in range(shards)]
+    with ProcessPoolExecutor(max_workers=workers or min(shards, os.cpu_count() or 1)) as executor:
+        responses = list(executor.map(run_shard, events))
+    return run_id, responses, load_complete(get_storage(os.getenv('S3_BUCKET', 'financial-project-1')), run_id)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, required=True)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--run-id')
+    args = parser.parse_args(sys.argv[1:])
+    run_id, responses, complete = run_local(args.shards, args.workers, args.run_id)
+    print(json.dumps({'run_id': run_id, 'complete': complete}, indent=2))
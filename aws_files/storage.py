@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from clients import aws_client
+from metrics import count
+
+# Storage backends used by the S3 helpers and the Glue / EventBridge calls of both lambdas.
+# STORAGE_BACKEND selects one of:
+#   's3'     (default) the bucket, Glue and EventBridge
+#   'local'  a directory (STORAGE_ROOT) that mirrors the bucket keys; events and crawler runs are
+#            appended to _events.jsonl in that directory
+#   'memory' a process wide dict, so an extraction and a model run in one process share their data
+# All backends raise KeyError when getting a missing key. signatures(prefix) maps each key to a value
+# that changes whenever the object is rewritten (ETag, mtime), to detect changes without downloading.
+# create(key, body) writes only if the key does not exist yet and returns whether it did, so exactly one
+# of several concurrent writers wins (S3 conditional writes, an exclusive link, a lock).
+# get_storage wraps the backend so the bytes and latency of gets and puts are counted by metrics.py.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 's3')
+STORAGE_ROOT = os.getenv('STORAGE_ROOT', 'storage')
+
+class S3Storage:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.s3 = aws_client('s3')
+
+    def get(self, key):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except self.s3.exceptions.NoSuchKey:
+            raise KeyError(key)
+
+    def put(self, key, body):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+
+    def create(self, key, body):
+        from botocore.exceptions import ClientError
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, IfNoneMatch='*')
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+
+    def delete(self, key):
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
+
+    def signatures(self, prefix):
+        signatures = {}
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            signatures.update({obj['Key']: obj['ETag'] for obj in page.get('Contents', [])})
+        return signatures
+
+    def list(self, prefix):
+        return sorted(self.signatures(prefix))
+
+    def put_event(self, source, detail_type, detail):
+        return aws_client('events').put_events(
+            Entries=[
+                {
+                    'Source': source,
+                    'DetailType': detail_type,
+                    'Detail': json.dumps(detail),
+                    'EventBusName': 'default'
+                }
+            ]
+        )
+
+    def start_crawler(self, name):
+        return aws_client('glue').start_crawler(Name=name)
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def put(self, key, body):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so concurrent readers never see a partial file. Thread ids repeat across
+        # processes (shard runners), so the temporary name has the process id too
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(body.encode() if isinstance(body, str) else body)
+        os.replace(tmp_path, path)
+
+    def create(self, key, body):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(body.encode() if isinstance(body, str) else body)
+        # link fails if the key exists, and readers never see a partial file
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def signatures(self, prefix):
+        # only the directory of the prefix is walked, not the whole backend
+        signatures = {}
+        directory, _, start = prefix.rpartition('/')
+        top = self.path(directory) if directory else self.root
+        for dirpath, dirnames, filenames in os.walk(top):
+            if dirpath == top:
+                # the rest of the prefix filters the entries of its directory
+                dirnames[:] = [name for name in dirnames if name.startswith(start)]
+                filenames = [name for name in filenames if name.startswith(start)]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix) and not key.endswith('.tmp') and key != '_events.jsonl':
+                    stat = os.stat(path)
+                    signatures[key] = f'{stat.st_mtime_ns}-{stat.st_size}'
+        return signatures
+
+    def list(self, prefix):
+        return sorted(self.signatures(prefix))
+
+    def record(self, entry):
+        os.makedirs(self.root, exist_ok=True)
+        entry['time'] = datetime.now().isoformat()
+        with self.lock, open(os.path.join(self.root, '_events.jsonl'), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def put_event(self, source, detail_type, detail):
+        self.record({'event': detail_type, 'source': source, 'detail': detail})
+
+    def start_crawler(self, name):
+        self.record({'crawler': name})
+
+class MemoryStorage:
+    def __init__(self):
+        self.objects = {}
+        self.versions = {}
+        self.events = []
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.objects[key]
+
+    def put(self, key, body):
+        with self.lock:
+            self.objects[key] = body.encode() if isinstance(body, str) else bytes(body)
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+    def create(self, key, body):
+        with self.lock:
+            if key in self.objects:
+                return False
+            self.objects[key] = body.encode() if isinstance(body, str) else bytes(body)
+            self.versions[key] = self.versions.get(key, 0) + 1
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.objects.pop(key, None)
+
+    def signatures(self, prefix):
+        with self.lock:
+            return {key: self.versions[key] for key in self.objects if key.startswith(prefix)}
+
+    def list(self, prefix):
+        return sorted(self.signatures(prefix))
+
+    def put_event(self, source, detail_type, detail):
+        self.events.append({'event': detail_type, 'source': source, 'detail': detail})
+
+    def start_crawler(self, name):
+        self.events.append({'crawler': name})
+
+class InstrumentedStorage:
+    # Counts the gets and puts of a backend in the current metrics stage; everything else is passed through
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key):
+        start = time.perf_counter()
+        body = self.backend.get(key)
+        count(storage_reads=1, storage_read_bytes=len(body), storage_ms=(time.perf_counter() - start) * 1000)
+        return body
+
+    def put(self, key, body):
+        start = time.perf_counter()
+        self.backend.put(key, body)
+        count(storage_writes=1, storage_write_bytes=len(body), storage_ms=(time.perf_counter() - start) * 1000)
+
+    def create(self, key, body):
+        start = time.perf_counter()
+        created = self.backend.create(key, body)
+        count(storage_writes=1, storage_write_bytes=len(body), storage_ms=(time.perf_counter() - start) * 1000)
+        return created
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+_storages = {}
+_lock = threading.Lock()
+
+def get_storage(bucket, backend=None):
+    # One backend instance per (backend, bucket) and process, shared by both lambdas
+    backend = backend or STORAGE_BACKEND
+    with _lock:
+        if (backend, bucket) not in _storages:
+            if backend == 's3':
+                instance = S3Storage(bucket)
+            elif backend == 'local':
+                instance = LocalStorage(os.path.join(STORAGE_ROOT, bucket))
+            elif backend == 'memory':
+                instance = MemoryStorage()
+            else:
+                raise ValueError(f'Unknown storage backend: {backend}')
+            _storages[backend, bucket] = InstrumentedStorage(instance)
+        return _storages[backend, bucket]
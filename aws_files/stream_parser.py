@@ -0,0 +1,200 @@
+import os
+import json
+import codecs
+import numpy as np
+import pandas as pd
+
+# Streaming parser of provider responses. The JSON body is read chunk by chunk while it downloads and only
+# the records container of the payload is decoded, one record at a time:
+#   av_daily     "Time Series (Daily)": {"<date>": {"1. open": "...", ...}, ...}    newest first
+#   av_economic  "data": [{"date": "...", "value": "..."}, ...]                     newest first
+#   fred         "observations": [{"date": "...", "value": "..."}, ...]             oldest first
+# Records become typed columnar batches (datetime64 dates, float values) of STREAM_BATCH_ROWS rows, so the
+# whole response never exists as one dict of strings. With a watermark (the first date the series needs),
+# records before it are skipped except the last one (the value in force on the watermark), and a newest
+# first payload stops being read at that record: the rest of a full history is never downloaded.
+STREAM_CHUNK_BYTES = int(os.getenv('STREAM_CHUNK_BYTES', 64 * 1024))
+STREAM_BATCH_ROWS = int(os.getenv('STREAM_BATCH_ROWS', 4096))
+
+# kind -> key of the records container, whether it is an object keyed by date, and the provider's order
+LAYOUTS = {
+    'av_daily': {'key': 'Time Series (Daily)', 'by_date': True, 'newest_first': True},
+    'av_economic': {'key': 'data', 'by_date': False, 'newest_first': True},
+    'fred': {'key': 'observations', 'by_date': False, 'newest_first': False},
+}
+
+WHITESPACE = ' \t\n\r'
+DECODER = json.JSONDecoder()
+
+class Scanner:
+    # The text of a JSON document read from an iterator of byte chunks. Only the unread part is kept,
+    # except while looking for a key (see find).
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+        self.keep = False
+        self.bytes = 0
+
+    def fill(self):
+        # read one more chunk, False once the document is exhausted
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            text = self.decoder.decode(b'', final=True)
+        else:
+            self.bytes += len(chunk)
+            text = self.decoder.decode(chunk)
+        drop = 0 if self.keep else self.pos
+        self.text = self.text[drop:] + text
+        self.pos -= drop
+        return True
+
+    def peek(self):
+        # next significant character ('' at the end of the document)
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} at {self.bytes} bytes, found {self.peek()!r}')
+        self.pos += 1
+
+    def value(self):
+        # decode the next JSON value; a value ending with the text read so far may be cut, so it needs more
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            self.fill()
+
+    def find(self, key):
+        # move past '"key":' and return True, or False at the end of the document. The text is kept until
+        # then, so a document without the key (a throttling note, an error message) can still be decoded.
+        token = json.dumps(key)
+        self.keep = True
+        try:
+            offset = self.pos
+            while True:
+                found = self.text.find(token, offset)
+                if found < 0:
+                    offset = max(self.pos, len(self.text) - len(token))
+                    if not self.fill():
+                        return False
+                    continue
+                self.pos = found + len(token)
+                if self.peek() == ':':
+                    self.pos += 1
+                    return True
+                offset = self.pos
+        finally:
+            self.keep = False
+
+def elements(scanner, by_date):
+    # (key, value) of each member of an object, or (None, value) of each item of an array
+    close = '}' if by_date else ']'
+    scanner.expect('{' if by_date else '[')
+    if scanner.peek() == close:
+        scanner.pos += 1
+        return
+    while True:
+        if by_date:
+            key = scanner.value()
+            scanner.expect(':')
+            yield key, scanner.value()
+        else:
+            yield None, scanner.value()
+        separator = scanner.peek()
+        scanner.pos += 1
+        if separator == close:
+            return
+        if separator != ',':
+            raise ValueError(f'Expected {close!r} or \',\' at {scanner.bytes} bytes, found {separator!r}')
+
+def to_float(value):
+    # numbers are strings in both providers' payloads, FRED marks missing observations with '.'
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def batch(dates, rows, columns):
+    return pd.DataFrame(np.array(rows, dtype=float).reshape(len(rows), len(columns)), columns=columns).assign(
+        date=np.array(dates, dtype='datetime64[ns]'))[['date'] + columns]
+
+def batches(scanner, kind, watermark=None):
+    # typed batches of the records after the container key; av_daily columns are its field names
+    # ('1. open' -> 'open'), the other kinds have one 'value' column
+    layout = LAYOUTS[kind]
+    newest_first = layout['newest_first']
+    columns, fields = None, None
+    dates, rows = [], []
+    previous, before = None, None
+    for key, record in elements(scanner, layout['by_date']):
+        if layout['by_date']:
+            if fields is None:
+                fields = list(record)
+                columns = [field.split('. ', 1)[-1] for field in fields]
+            date, row = key, [to_float(record[field]) for field in fields]
+        else:
+            columns = ['value']
+            date, row = record['date'], [to_float(record['value'])]
+        # not in the provider's usual order: read all of it
+        if newest_first and previous is not None and date > previous:
+            newest_first = False
+        previous = date
+        if watermark is not None and date < watermark:
+            if before is None or date > before[0]:
+                before = (date, row)
+            if newest_first:
+                break
+            continue
+        dates.append(date)
+        rows.append(row)
+        if len(rows) == STREAM_BATCH_ROWS:
+            yield batch(dates, rows, columns)
+            dates, rows = [], []
+    if before is not None:
+        dates.append(before[0])
+        rows.append(before[1])
+    if rows or columns is None:
+        yield batch(dates, rows, columns or ['value'])
+
+def parse_stream(scanner, kind, watermark=None):
+    # dataframe of 'date' and the record values, or the decoded document when it has no records container
+    if not scanner.find(LAYOUTS[kind]['key']):
+        return json.loads(scanner.text)
+    return pd.concat(list(batches(scanner, kind, watermark)), ignore_index=True)
+
+# Parsed frames go through the response cache as {'parsed': {'columns': [...], 'data': [[...], ...]}}
+
+def to_cached(data):
+    if isinstance(data, pd.DataFrame):
+        return {'parsed': json.loads(data.to_json(orient='split', index=False, date_format='iso', double_precision=15))}
+    return data
+
+def as_frame(data):
+    # the frame of a parse_stream result, fresh or cached
+    if isinstance(data, pd.DataFrame):
+        return data
+    if 'parsed' not in data:
+        raise ValueError(f'No records in the response: {json.dumps(data)[:200]}')
+    columns = data['parsed']['columns']
+    frame = pd.DataFrame(data['parsed']['data'], columns=columns)
+    return frame.astype({col: float for col in columns if col != 'date'}).assign(date=pd.to_datetime(frame['date']))
@@ -0,0 +1,86 @@
+import os
+import json
+from datetime import date, datetime, timedelta
+import pandas as pd
+
+# Per-series extraction state, one object per series under extraction-state/<series>.json:
+#   last_observation  date of the last stored row
+#   revision_start    first date of the revision window (the revision_rows-th last stored row): the next
+#                     fetch starts there, with no need to read the history to find it
+#   last_fetch        when the provider was last called, and whether that call changed any stored row
+#   next_fetch        first day the next release can be out; the extractor skips the series before it
+# Series are released on a calendar (the spec's 'cadence'):
+#   'daily'    a new row every business day: due the business day after the last observation
+#   'weekly'   one release a week on the weekday release_day (0 is Monday), e.g. the FRED H.10 exchange rates
+#   'monthly'  one release a month on day release_day, e.g. CPI, or GDP and its revised estimates
+# Release days are approximate: a weekly or monthly fetch that changes nothing is retried the next day,
+# for up to RELEASE_GRACE_DAYS after the scheduled day.
+STATE_PREFIX = 'extraction-state/'
+RELEASE_GRACE_DAYS = int(os.getenv('RELEASE_GRACE_DAYS', 7))
+
+# registry fields the state was recorded with: when one changes, the schedule no longer applies
+SOURCE_FIELDS = ['kind', 'symbol', 'backfill_start', 'revision_rows', 'fields', 'cadence', 'release_day']
+
+def state_key(series):
+    return f'{STATE_PREFIX}{series}.json'
+
+def load_state(storage, series):
+    try:
+        return json.loads(storage.get(state_key(series)))
+    except KeyError:
+        return None
+
+def scheduled_release(spec, after):
+    # first scheduled release strictly after the date `after`
+    if spec['cadence'] == 'daily':
+        return (pd.Timestamp(after) + pd.offsets.BDay(1)).date()
+    if spec['cadence'] == 'weekly':
+        return after + timedelta(days=(spec['release_day'] - after.weekday() - 1) % 7 + 1)
+    month = pd.Timestamp(after).to_period('M')
+    for period in (month, month + 1):
+        # release_day 31 means the last day of shorter months
+        release = period.to_timestamp().date().replace(day=min(spec['release_day'], period.days_in_month))
+        if release > after:
+            return release
+
+def release_due(spec, state, today):
+    # (due?, reason)
+    if state is None:
+        return True, 'no state'
+    if state['source'] != {field: spec.get(field) for field in SOURCE_FIELDS}:
+        return True, 'registry entry changed'
+    if today >= date.fromisoformat(state['next_fetch']):
+        return True, f"release due since {state['next_fetch']}"
+    return False, f"next release due {state['next_fetch']}"
+
+def save_state(storage, series, spec, stored, changed, state, now=None):
+    # state after a fetch; stored is the tail of the stored series, changed whether the fetch changed it
+    now = now or datetime.now()
+    today = now.date()
+    previous = state if state is not None and state['source'] == {field: spec.get(field) for field in SOURCE_FIELDS} else None
+    if stored.empty:
+        last_observation = previous['last_observation'] if previous else None
+        revision_start = previous['revision_start'] if previous else None
+    else:
+        last_observation = stored['date'].iloc[-1].strftime('%Y-%m-%d')
+        revision_start = stored['date'].iloc[-min(spec['revision_rows'] or len(stored), len(stored))].strftime('%Y-%m-%d')
+    if spec['cadence'] == 'daily':
+        scheduled = next_fetch = scheduled_release(spec, date.fromisoformat(last_observation) if last_observation else today)
+    elif previous is None or changed or (today - date.fromisoformat(previous['scheduled_release'])).days >= RELEASE_GRACE_DAYS:
+        scheduled = next_fetch = scheduled_release(spec, today)
+    else:
+        # the release is late: keep waiting for it, one fetch a day
+        scheduled, next_fetch = date.fromisoformat(previous['scheduled_release']), today + timedelta(days=1)
+    state = {
+        'series': series,
+        'last_observation': last_observation,
+        'revision_start': revision_start,
+        'revision_window': spec['revision_rows'],
+        'last_fetch': now.isoformat(timespec='seconds'),
+        'last_fetch_changed': bool(changed),
+        'scheduled_release': scheduled.isoformat(),
+        'next_fetch': next_fetch.isoformat(),
+        'source': {field: spec.get(field) for field in SOURCE_FIELDS},
+    }
+    storage.put(state_key(series), json.dumps(state))
+    return state
@@ -0,0 +1,60 @@
+# Cold start of the lambda modules: import time measured in fresh interpreters, plus the deferred
+# ML stack import that model_lambda now pays on its first training invocation.
+# Use --output to append the results (tagged with the git revision) to a JSON lines file and
+# track them across releases.
+#
+#   python benchmarks/bench_cold_start.py --runs 5 --output benchmarks/cold_start.jsonl
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+AWS_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'aws_files')
+
+TARGETS = {
+    'extraction_lambda': 'import extraction_lambda',
+    'model_lambda': 'import model_lambda',
+    'ml_stack (deferred)': 'from xgboost import XGBRegressor; from sklearn.model_selection import GridSearchCV',
+}
+
+TIMER = 'import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)'
+
+
+def import_seconds(statement):
+    # a fresh interpreter per run, so nothing is already in sys.modules
+    env = dict(os.environ, STORAGE_BACKEND='memory', RESPONSE_CACHE='off', AWS_DEFAULT_REGION='us-east-1')
+    out = subprocess.run([sys.executable, '-c', TIMER.format(statement=statement)],
+                         cwd=AWS_FILES, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=AWS_FILES,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='JSON lines file to append the results to')
+    args = parser.parse_args()
+    results = {}
+    for name, statement in TARGETS.items():
+        samples = [import_seconds(statement) for _ in range(args.runs)]
+        results[name] = {'median_ms': round(statistics.median(samples) * 1000, 1),
+                         'max_ms': round(max(samples) * 1000, 1)}
+        print(f"{name:<22}median {results[name]['median_ms']:>8.1f} ms   max {results[name]['max_ms']:>8.1f} ms")
+    if args.output:
+        record = {'time': datetime.now().isoformat(), 'revision': git_revision(), 'runs': args.runs, 'results': results}
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
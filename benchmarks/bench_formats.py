@@ -0,0 +1,72 @@
+# Compare the csv and parquet codecs of the lambdas' S3 helpers (aws_files/codec.py) on a synthetic staging
+# series: bytes stored/transferred, write time, full read time and single column (projected) read time.
+#
+#   python benchmarks/bench_formats.py --years 25 --columns 6
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'aws_files'))
+
+from codec import decode, encode  # noqa: E402
+
+
+def synthetic_series(years, columns):
+    dates = pd.date_range('2000-01-01', periods=int(years * 365.25), freq='D')
+    rng = np.random.default_rng(0)
+    values = 100 + rng.standard_normal((len(dates), columns)).cumsum(axis=0)
+    df = pd.DataFrame(values, columns=[f'series col_{i}' for i in range(columns)])
+    df.insert(0, 'date', dates)
+    return df
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_csv(df, repeat):
+    write_s, body = timed(lambda: encode(df, 'csv', index=False).encode(), repeat)
+    # csv readers also have to re-parse the dates
+    def read():
+        out = decode(body, 'csv')
+        out['date'] = pd.to_datetime(out['date'], format='%Y-%m-%d')
+        return out
+    read_s, _ = timed(read, repeat)
+    project_s, _ = timed(lambda: decode(body, 'csv', columns=['date', df.columns[1]]), repeat)
+    return len(body), write_s, read_s, project_s
+
+
+def bench_parquet(df, repeat, compression):
+    write_s, body = timed(lambda: encode(df, 'parquet', index=False, compression=compression), repeat)
+    read_s, _ = timed(lambda: decode(body, 'parquet'), repeat)
+    project_s, _ = timed(lambda: decode(body, 'parquet', columns=['date', df.columns[1]]), repeat)
+    return len(body), write_s, read_s, project_s
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=float, default=25)
+    parser.add_argument('--columns', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    df = synthetic_series(args.years, args.columns)
+    rows = [('csv',) + bench_csv(df, args.repeat)]
+    for compression in ['snappy', 'zstd']:
+        rows.append((f'parquet/{compression}',) + bench_parquet(df, args.repeat, compression))
+    print(f'{len(df)} rows x {args.columns} value columns')
+    print(f"{'format':<16}{'bytes':>12}{'write ms':>10}{'read ms':>10}{'1-col ms':>10}")
+    for name, size, write_s, read_s, project_s in rows:
+        print(f'{name:<16}{size:>12}{write_s * 1000:>10.1f}{read_s * 1000:>10.1f}{project_s * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# Time and peak memory of each pipeline stage on recorded fixtures, with no network and in-memory storage:
+#   extract        extraction_lambda.run_extractors end to end, served by a FixtureSession
+#   parse          the provider payload parsers, from decoded JSON
+#   stream_parse   the streaming parser (stream_parser.py), from the response bytes in STREAM_CHUNK_BYTES chunks
+#   upsert         merging a revision window into each staged history
+#   align          most_recent_start_date over the staged series
+#   model_dataset  model_lambda.model_dataset
+#   train, predict an XGBRegressor with the first values of PARAM_GRID
+# Times are the median of --repeat runs, memory the peak traced by tracemalloc in one more run (Python and
+# numpy allocations, not XGBoost's native ones). The fixture of a scale is generated by synthetic.py the
+# first time and reused after that.
+#
+#   python benchmarks/bench_pipeline.py --scale small --save-baseline
+#   python benchmarks/bench_pipeline.py --scale small --check     # exits 1 on a regression
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+AWS_FILES = os.path.join(BENCHMARKS, '..', 'aws_files')
+BASELINES_DIR = os.path.join(BENCHMARKS, 'baselines')
+
+# In-memory storage, no response cache and no provider rate limits: only the pipeline's own work is measured
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('RESPONSE_CACHE', 'off')
+for provider in ['AV', 'FRED']:
+    os.environ.setdefault(f'{provider}_REQUESTS_PER_MINUTE', '1000000')
+sys.path.insert(0, AWS_FILES)
+sys.path.insert(0, BENCHMARKS)
+
+import pandas as pd  # noqa: E402
+
+import extraction_lambda as extraction  # noqa: E402
+import model_lambda  # noqa: E402
+from storage import MemoryStorage  # noqa: E402
+from stream_parser import STREAM_CHUNK_BYTES, Scanner, parse_stream  # noqa: E402
+from fixtures import FIXTURES_DIR, FixtureSession, load, save  # noqa: E402
+from synthetic import generate  # noqa: E402
+
+# symbols: daily symbols in total (None: the registered ones)
+SCALES = {
+    'small': {'years': 5, 'symbols': None, 'freq': 'B'},
+    'medium': {'years': 15, 'symbols': None, 'freq': 'B'},
+    'large': {'years': 25, 'symbols': 36, 'freq': 'B'},
+}
+PARSERS = {'av_daily': extraction.parse_av_daily, 'av_economic': extraction.parse_av_economic, 'fred': extraction.parse_fred}
+FINISHERS = {'av_daily': extraction.av_daily_frame, 'av_economic': extraction.value_frame, 'fred': extraction.value_frame}
+# rows of the revision window merged by the upsert stage
+UPSERT_ROWS = 110
+# slower or bigger than the baseline by this ratio is a regression; times also need NOISE_MS more
+TOLERANCE = 1.3
+NOISE_MS = 5.0
+
+
+def fixture(scale, path=None):
+    path = path or os.path.join(FIXTURES_DIR, f'{scale}.json.gz')
+    if not os.path.exists(path):
+        save(path, generate(extraction.SERIES, **SCALES[scale]))
+    return load(path)
+
+
+def extract(entries):
+    # a fresh store per run, so every run is a full backfill
+    session = FixtureSession(entries)
+    extraction.storage = MemoryStorage()
+    extraction.http_session = lambda: session
+    report = extraction.run_extractors({'alpha_vantage': None, 'fred': None})
+    failed = [r for r in report if r['status'] == 'failure']
+    if failed:
+        raise RuntimeError(f'Extraction failed: {failed}')
+
+
+def chunks(body):
+    return (body[start:start + STREAM_CHUNK_BYTES] for start in range(0, len(body), STREAM_CHUNK_BYTES))
+
+
+def stream_parse(bodies):
+    return [FINISHERS[kind](parse_stream(Scanner(chunks(body)), kind), spec) for kind, spec, body in bodies]
+
+
+def stages(entries):
+    # stage name -> callable, each one with its inputs prepared in advance
+    parsed = {name: PARSERS[entry['spec']['kind']](entry['payload'], entry['spec']) for name, entry in entries.items()}
+    bodies = [(entry['spec']['kind'], entry['spec'], json.dumps(entry['payload']).encode()) for entry in entries.values()]
+    # staged at their native frequency, like extract_series writes them
+    staged = parsed
+    revisions = {name: (df.iloc[:-UPSERT_ROWS // 2], df.iloc[-UPSERT_ROWS:]) for name, df in staged.items()}
+    names = [name for name in model_lambda.MODEL_SERIES if name in staged] + [name for name in staged if name not in model_lambda.MODEL_SERIES]
+    frames = [model_lambda.EMA30(staged[name].copy()) if name == 'gold' else staged[name] for name in names]
+    merged = model_lambda.most_recent_start_date(*frames, names=names)
+    model = model_lambda.model_dataset(merged.copy(), None, save=False)
+    from xgboost import XGBRegressor
+    X, y = model.iloc[:, :-1].to_numpy(), model.iloc[:, -1].to_numpy()
+    X_train, y_train, X_test = X[:-300], y[:-300], X[-300:]
+    params = {key: values[0] for key, values in model_lambda.PARAM_GRID.items()}
+    regressor = XGBRegressor(objective='reg:squarederror', **params).fit(X_train, y_train)
+    return {
+        'extract': lambda: extract(entries),
+        'parse': lambda: [PARSERS[entry['spec']['kind']](entry['payload'], entry['spec']) for entry in entries.values()],
+        'stream_parse': lambda: stream_parse(bodies),
+        'upsert': lambda: [extraction.upsert(hist, new) for hist, new in revisions.values()],
+        'align': lambda: model_lambda.most_recent_start_date(*frames, names=names),
+        'model_dataset': lambda: model_lambda.model_dataset(merged.copy(), None, save=False),
+        'train': lambda: XGBRegressor(objective='reg:squarederror', **params).fit(X_train, y_train),
+        'predict': lambda: regressor.predict(X_test),
+    }, {'series': len(entries), 'model_rows': len(model), 'model_columns': model.shape[1],
+        'model_mib': round(model.memory_usage(deep=True).sum() / 2 ** 20, 2)}
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'median_ms': round(statistics.median(samples) * 1000, 2), 'peak_mib': round(peak / 2 ** 20, 2)}
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for stage, result in results.items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            continue
+        if result['median_ms'] > base['median_ms'] * tolerance and result['median_ms'] - base['median_ms'] > NOISE_MS:
+            found.append(f"{stage}: {result['median_ms']} ms vs {base['median_ms']} ms")
+        if result['peak_mib'] > base['peak_mib'] * tolerance:
+            found.append(f"{stage}: {result['peak_mib']} MiB vs {base['peak_mib']} MiB")
+    return found
+
+
+def git_revision():
+    import subprocess
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--fixture', help='fixture file (default: benchmarks/fixtures/<scale>.json.gz)')
+    parser.add_argument('--stages', help='comma separated stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the baseline of the scale')
+    parser.add_argument('--check', action='store_true', help='compare with the baseline and exit 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+    entries = fixture(args.scale, args.fixture)
+    funcs, shape = stages(entries)
+    selected = args.stages.split(',') if args.stages else list(funcs)
+    print(f"{args.scale}: {shape['series']} series, model frame {shape['model_rows']} x {shape['model_columns']} ({shape['model_mib']} MiB)")
+    print(f"{'stage':<16}{'median ms':>12}{'peak MiB':>12}")
+    results = {}
+    for stage in selected:
+        results[stage] = measure(funcs[stage], args.repeat)
+        print(f"{stage:<16}{results[stage]['median_ms']:>12.2f}{results[stage]['peak_mib']:>12.2f}")
+    baseline_path = os.path.join(BASELINES_DIR, f'{args.scale}.json')
+    if args.save_baseline:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump({
+                'time': datetime.now().isoformat(), 'revision': git_revision(), 'scale': SCALES[args.scale],
+                'shape': shape, 'repeat': args.repeat,
+                'host': {'machine': platform.machine(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+                         'pandas': pd.__version__},
+                'stages': results,
+            }, f, indent=2)
+        print(f'Baseline saved to {baseline_path}')
+    if args.check:
+        with open(baseline_path) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f'REGRESSION {line}')
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Training throughput (fold fits per second) at the vCPU sizes of Lambda memory settings, for three ways of
+# running the same fits:
+#   visible   the previous setup: a pool of one fit per visible core, each fit on all visible cores
+#   folds     executor.plan fold level: one fit per effective CPU
+#   trees     executor.plan tree level: one fit at a time on all effective CPUs
+# A size is emulated by setting AWS_LAMBDA_FUNCTION_MEMORY_SIZE (what executor.effective_cpus reads on Lambda)
+# and pinning the process to that many cores. Sizes with more vCPUs than this machine has run on the cores
+# there are, and are flagged in the report. Times are the median of --repeat runs.
+#
+#   python benchmarks/bench_training.py --sizes 1769,3538,10240 --visible 6
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, '..', 'aws_files'))
+
+import numpy as np  # noqa: E402
+
+from executor import LAMBDA_MB_PER_VCPU, Plan, affinity_cpus, effective_cpus, plan, run, with_threads  # noqa: E402
+from search import fit_score  # noqa: E402
+
+# Lambda memory sizes (MB): 1 vCPU at 1769 MB, 6 at 10240 MB
+SIZES_MB = [1769, 3538, 5307, 7076, 10240]
+# the single configuration of model_lambda.PARAM_GRID
+PARAMS = {'max_depth': 2, 'learning_rate': 0.1, 'n_estimators': 100, 'subsample': 0.7, 'colsample_bytree': 0.9,
+          'colsample_bylevel': 0.9, 'min_child_weight': 1, 'reg_alpha': 0.1, 'reg_lambda': 0.5}
+
+
+def dataset(rows, columns):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((rows, columns)).cumsum(axis=0).astype(np.float32)
+    y = X @ rng.standard_normal(columns) + rng.standard_normal(rows)
+    return X, y.astype(np.float32)
+
+
+def folds(rows, fits):
+    # expanding windows, like TimeSeriesSplit
+    from sklearn.model_selection import TimeSeriesSplit
+    return list(TimeSeriesSplit(n_splits=fits).split(np.arange(rows)))
+
+
+def fit_all(X, y, splits, strategy):
+    from xgboost import XGBRegressor
+    estimators = [with_threads(XGBRegressor(objective='reg:squarederror', **PARAMS), strategy.threads) for _ in splits]
+    return run(fit_score, [(estimator, X, y, train, test) for estimator, (train, test) in zip(estimators, splits)], strategy)
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES_MB)), help='comma separated Lambda memory sizes (MB)')
+    parser.add_argument('--visible', type=int, default=6, help='cores an unaware pool sees (default: 6, the most Lambda has)')
+    parser.add_argument('--rows', type=int, default=3000)
+    parser.add_argument('--columns', type=int, default=12)
+    parser.add_argument('--fits', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the results as json')
+    args = parser.parse_args()
+    X, y = dataset(args.rows, args.columns)
+    splits = folds(args.rows, args.fits)
+    cores = sorted(os.sched_getaffinity(0))
+    results = []
+    print(f"{args.fits} fits of up to {args.rows} rows x {args.columns} columns, {len(cores)} cores on this machine")
+    print(f"{'memory MB':>10}{'vCPUs':>7}{'cores':>7}  {'strategy':<9}{'plan':>8}{'seconds':>10}{'fits/s':>9}{'vs visible':>12}")
+    try:
+        for size in map(int, args.sizes.split(',')):
+            os.environ['AWS_LAMBDA_FUNCTION_MEMORY_SIZE'] = str(size)
+            vcpus = max(1, round(size / LAMBDA_MB_PER_VCPU))
+            os.sched_setaffinity(0, cores[:vcpus])
+            cpus = effective_cpus()
+            strategies = {
+                'visible': Plan(args.visible, args.visible),
+                'folds': plan(len(splits), cpus, parallelism='folds'),
+                'trees': plan(len(splits), cpus, parallelism='trees'),
+            }
+            baseline = None
+            for name, strategy in strategies.items():
+                seconds = measure(lambda: fit_all(X, y, splits, strategy), args.repeat)
+                baseline = baseline or seconds
+                flag = '' if affinity_cpus() == vcpus else '*'
+                print(f"{size:>10}{vcpus:>7}{affinity_cpus():>6}{flag:1}  {name:<9}{f'{strategy.workers}x{strategy.threads}':>8}"
+                      f"{seconds:>10.3f}{len(splits) / seconds:>9.1f}{baseline / seconds:>11.2f}x")
+                results.append({'memory_mb': size, 'vcpus': vcpus, 'cores': affinity_cpus(), 'strategy': name,
+                                'workers': strategy.workers, 'threads': strategy.threads, 'seconds': round(seconds, 4),
+                                'fits_per_second': round(len(splits) / seconds, 2)})
+    finally:
+        os.sched_setaffinity(0, cores)
+        os.environ.pop('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', None)
+    if any(result['cores'] < result['vcpus'] for result in results):
+        print('* fewer cores on this machine than the size has vCPUs: run on a bigger machine for those sizes')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
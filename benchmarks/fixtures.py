@@ -0,0 +1,130 @@
+# Recorded provider responses, so benchmarks (and local runs) need no network.
+# A fixture is a gzipped JSON file of {name: {'spec', 'request', 'payload'}} entries, either generated by
+# synthetic.py or recorded from the live APIs (--live, with key_AV / key_FRED set). FixtureSession serves
+# the entries in place of the HTTP session used by extraction_lambda, and answers like the providers do:
+# 'compact' daily requests get the last 100 days, FRED requests the observations between their dates.
+#
+#   python benchmarks/fixtures.py --years 25 --symbols 24 --output benchmarks/fixtures/large.json.gz
+#   python benchmarks/fixtures.py --live --output benchmarks/fixtures/live.json.gz
+import argparse
+import gzip
+import json
+import os
+import sys
+
+AWS_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'aws_files')
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def save(path, entries):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with gzip.open(path, 'wt') as f:
+        json.dump(entries, f)
+
+
+def load(path):
+    with gzip.open(path, 'rt') as f:
+        return json.load(f)
+
+
+def request_of(params):
+    # the fields a fixture is looked up by, from the query parameters of a provider call
+    if 'series_id' in params:
+        return {'series_id': params['series_id']}
+    if params['function'] == 'TIME_SERIES_DAILY':
+        return {'function': 'TIME_SERIES_DAILY', 'symbol': params['symbol']}
+    return {'function': params['function']}
+
+
+class FixtureResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        body = json.dumps(self.payload).encode()
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FixtureSession:
+    def __init__(self, entries):
+        self.responses = {json.dumps(entry['request'], sort_keys=True): entry['payload'] for entry in entries.values()}
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        key = json.dumps(request_of(params), sort_keys=True)
+        if key not in self.responses:
+            raise KeyError(f'No fixture for {key}')
+        self.calls += 1
+        payload = self.responses[key]
+        if params.get('outputsize') == 'compact':
+            days = list(payload['Time Series (Daily)'].items())[:100]
+            payload = {**payload, 'Time Series (Daily)': dict(days)}
+        elif 'observations' in payload:
+            start, end = params.get('observation_start', ''), params.get('observation_end', '9999')
+            payload = {**payload, 'observations': [obs for obs in payload['observations'] if start <= obs['date'] <= end]}
+        return FixtureResponse(payload)
+
+
+def record_live(series):
+    # one full-history call per registered series, through the lambda's own session and limits
+    import extraction_lambda as extraction
+    entries = {}
+    for name, spec in series.items():
+        with extraction.BUDGETS[spec['provider']]:
+            if spec['kind'] == 'av_daily':
+                request = {'function': 'TIME_SERIES_DAILY', 'symbol': spec['symbol']}
+                payload = extraction.av_get({**request, 'outputsize': 'full', 'apikey': os.getenv('key_AV')})
+            elif spec['kind'] == 'av_economic':
+                request = {'function': spec['symbol']}
+                payload = extraction.av_get({**request, 'apikey': os.getenv('key_AV')})
+            else:
+                request = {'series_id': spec['symbol']}
+                payload = extraction.fred_get({**request, 'api_key': os.getenv('key_FRED'), 'file_type': 'json',
+                                               'observation_start': spec['backfill_start']})
+        entries[name] = {'spec': spec, 'request': request, 'payload': payload}
+        print(f'Recorded {name}')
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--symbols', type=int, default=None, help='daily symbols in total (default: the registered ones)')
+    parser.add_argument('--freq', default='B', help='bar frequency of the daily symbols')
+    parser.add_argument('--live', action='store_true', help='record the live APIs instead of synthetic payloads')
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    # the registry only: nothing is read from or written to the lambdas' storage
+    os.environ.setdefault('STORAGE_BACKEND', 'memory')
+    os.environ.setdefault('RESPONSE_CACHE', 'off')
+    sys.path.insert(0, AWS_FILES)
+    from extraction_lambda import SERIES
+    if args.live:
+        entries = record_live(SERIES)
+    else:
+        from synthetic import generate
+        entries = generate(SERIES, args.years, args.symbols, args.freq)
+    save(args.output, entries)
+    print(f'{len(entries)} series saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
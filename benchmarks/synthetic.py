@@ -0,0 +1,102 @@
+# Synthetic Alpha Vantage and FRED payloads, shaped like the providers' JSON responses, at a configurable
+# scale: number of daily symbols x years of history x bar frequency. Prices are seeded random walks, so
+# the same arguments always produce the same payloads.
+#
+#   payloads = generate(years=25, symbols=24)
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Native frequency of the synthetic economic series (the daily symbols use the freq argument)
+ECONOMIC_FREQ = {
+    'FEDERAL_FUNDS_RATE': 'MS',
+    'CPIAUCSL': 'MS',
+    'GDP': 'QS',
+    'DEXSZUS': 'B',
+    'DEXUSEU': 'B',
+}
+
+
+def seed(symbol):
+    return zlib.crc32(symbol.encode())
+
+
+def random_walk(symbol, periods, start=100.0, scale=1.0):
+    rng = np.random.default_rng(seed(symbol))
+    return np.abs(start + scale * rng.standard_normal(periods).cumsum()) + 1
+
+
+def av_daily_payload(symbol, start, end, freq='B'):
+    # TIME_SERIES_DAILY: newest day first, every value a string
+    dates = pd.date_range(start, end, freq=freq)[::-1]
+    opens = random_walk(symbol, len(dates))
+    rng = np.random.default_rng(seed(symbol) + 1)
+    spread = rng.uniform(0.1, 2.0, len(dates))
+    closes = opens + rng.standard_normal(len(dates)) * spread / 2
+    volumes = rng.integers(10_000, 10_000_000, len(dates))
+    series = {
+        date: {'1. open': f'{o:.4f}', '2. high': f'{max(o, c) + s / 2:.4f}', '3. low': f'{min(o, c) - s / 2:.4f}',
+               '4. close': f'{c:.4f}', '5. volume': str(v)}
+        for date, o, c, s, v in zip(dates.strftime('%Y-%m-%d'), opens, closes, spread, volumes)
+    }
+    return {
+        'Meta Data': {'1. Information': 'Daily Prices (open, high, low, close) and Volumes', '2. Symbol': symbol,
+                      '3. Last Refreshed': dates[0].strftime('%Y-%m-%d'), '4. Output Size': 'Full size',
+                      '5. Time Zone': 'US/Eastern'},
+        'Time Series (Daily)': series,
+    }
+
+
+def av_economic_payload(function, start, end):
+    # economic indicators: newest first, {'date', 'value'} records
+    dates = pd.date_range(start, end, freq=ECONOMIC_FREQ.get(function, 'MS'))[::-1]
+    values = random_walk(function, len(dates), start=5.0, scale=0.1)
+    return {
+        'name': function, 'interval': 'monthly', 'unit': 'percent',
+        'data': [{'date': date, 'value': f'{value:.2f}'} for date, value in zip(dates.strftime('%Y-%m-%d'), values)],
+    }
+
+
+def fred_payload(series_id, start, end, missing=0.01):
+    # series/observations: oldest first, '.' marks a missing observation
+    dates = pd.date_range(start, end, freq=ECONOMIC_FREQ.get(series_id, 'MS'))
+    values = random_walk(series_id, len(dates), start=100.0, scale=0.5)
+    gaps = np.random.default_rng(seed(series_id) + 2).random(len(dates)) < missing
+    return {
+        'observation_start': dates[0].strftime('%Y-%m-%d') if len(dates) else start,
+        'observation_end': end, 'units': 'lin', 'count': len(dates),
+        'observations': [
+            {'realtime_start': end, 'realtime_end': end, 'date': date, 'value': '.' if gap else f'{value:.4f}'}
+            for date, value, gap in zip(dates.strftime('%Y-%m-%d'), values, gaps)
+        ],
+    }
+
+
+def extra_symbol_specs(series, symbols):
+    # daily series beyond the registered ones, cloned from the first registered daily spec
+    daily = [name for name, spec in series.items() if spec['kind'] == 'av_daily']
+    template = series[daily[0]]
+    return {f'sym_{i}': {**template, 'symbol': f'SYM{i}', 'prefix': f'sym_{i}'} for i in range(max(0, symbols - len(daily)))}
+
+
+def generate(series, years=10, symbols=None, freq='B', end=None):
+    # {name: {'spec': spec, 'request': provider request, 'payload': json}} for every registered series, plus
+    # extra daily symbols up to symbols in total
+    end = end or datetime.now().strftime('%Y-%m-%d')
+    start = (pd.Timestamp(end) - pd.DateOffset(years=years)).strftime('%Y-%m-%d')
+    specs = {**series, **extra_symbol_specs(series, symbols or 0)}
+    payloads = {}
+    for name, spec in specs.items():
+        if spec['kind'] == 'av_daily':
+            payload = av_daily_payload(spec['symbol'], start, end, freq)
+            request = {'function': 'TIME_SERIES_DAILY', 'symbol': spec['symbol']}
+        elif spec['kind'] == 'av_economic':
+            payload = av_economic_payload(spec['symbol'], start, end)
+            request = {'function': spec['symbol']}
+        else:
+            payload = fred_payload(spec['symbol'], start, end)
+            request = {'series_id': spec['symbol']}
+        payloads[name] = {'spec': spec, 'request': request, 'payload': payload}
+    return payloads
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules are deployed flat (the lambda zip and the container image), so they import each other by name.
+# The tests run them on the in-memory storage backend, without AWS.
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('METRICS_FORMAT', 'off')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'aws_files'))
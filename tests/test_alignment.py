@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from model_lambda import most_recent_start_date
+
+
+def daily():
+    dates = pd.bdate_range('2024-01-02', '2024-03-29')
+    return pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'gold open': np.arange(len(dates), dtype=float)})
+
+
+def monthly():
+    return pd.DataFrame({'date': ['2023-12-01', '2024-01-01', '2024-02-01', '2024-03-01'], 'cpi': [1.0, 2.0, 3.0, 4.0]})
+
+
+def quarterly():
+    return pd.DataFrame({'date': ['2024-01-15', '2024-04-01'], 'gdp': [10.0, 20.0]})
+
+
+def test_every_day_takes_the_last_observation_on_or_before_it():
+    merged = most_recent_start_date(daily(), monthly(), names=['gold', 'cpi'])
+    merged = merged.set_index('date')
+    assert merged.index[0] == pd.Timestamp('2024-01-02')
+    assert merged.index[-1] == pd.Timestamp('2024-03-29')
+    assert (merged.index.dayofweek < 5).all()
+    assert merged.loc['2024-01-31', 'cpi'] == 2.0
+    assert merged.loc['2024-02-01', 'cpi'] == 3.0
+    assert merged.loc['2024-03-29', 'cpi'] == 4.0
+
+
+def test_the_calendar_starts_at_the_most_recent_first_observation():
+    merged = most_recent_start_date(daily(), monthly(), quarterly(), names=['gold', 'cpi', 'gdp'])
+    assert merged.attrs['alignment'] == {'start_date': '2024-01-15', 'bounded_by': ['gdp'], 'rows': len(merged)}
+    assert merged['date'].iloc[0] == pd.Timestamp('2024-01-15')
+    # the calendar runs to the last observation of any series
+    assert merged['date'].iloc[-1] == pd.Timestamp('2024-04-01')
+    assert merged['gdp'].iloc[-1] == 20.0
+    assert merged.loc[merged['date'] == '2024-03-29', 'gdp'].item() == 10.0
+
+
+def test_repeated_and_unsorted_dates():
+    df = pd.DataFrame({'date': ['2024-01-03', '2024-01-02', '2024-01-03'], 'value': [1.0, 2.0, 3.0]})
+    merged = most_recent_start_date(df)
+    # the last row of a repeated date wins
+    assert merged['value'].tolist() == [2.0, 3.0]
+
+
+def test_gaps_carry_the_previous_value():
+    df = daily()
+    df.loc[5, 'gold open'] = np.nan
+    merged = most_recent_start_date(df)
+    assert merged['gold open'].iloc[5] == merged['gold open'].iloc[4]
+
+
+def test_lean_alignment_matches():
+    frames = [daily(), monthly(), quarterly()]
+    regular = most_recent_start_date(*frames)
+    lean = most_recent_start_date(*frames, lean=True)
+    np.testing.assert_allclose(lean.drop(columns='date').to_numpy(), regular.drop(columns='date').to_numpy(), rtol=1e-6)
+    assert lean['date'].equals(regular['date'])
+
+
+def test_an_empty_series_gives_an_empty_frame():
+    empty = pd.DataFrame({'date': pd.Series(dtype=str), 'cpi': pd.Series(dtype=float)})
+    merged = most_recent_start_date(daily(), empty, names=['gold', 'cpi'])
+    assert merged.empty
+    assert list(merged.columns) == ['date', 'gold open', 'cpi']
+    assert merged.attrs['alignment']['bounded_by'] == ['gold']
@@ -0,0 +1,53 @@
+import pytest
+
+import executor
+from executor import Plan, effective_cpus, plan
+
+
+@pytest.fixture
+def cpus(monkeypatch):
+    # a machine with 8 cores and no cgroup quota, outside Lambda
+    monkeypatch.setattr(executor, 'affinity_cpus', lambda: 8)
+    monkeypatch.setattr(executor, 'cgroup_quota', lambda: None)
+    monkeypatch.setattr(executor, 'CPU_QUOTA', None)
+    monkeypatch.delenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', raising=False)
+    return monkeypatch
+
+
+def test_effective_cpus_is_the_smallest_limit(cpus):
+    assert effective_cpus() == 8
+    cpus.setattr(executor, 'cgroup_quota', lambda: 4.0)
+    assert effective_cpus() == 4
+    # 3538 MB of Lambda memory is two vCPUs
+    cpus.setenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '3538')
+    assert effective_cpus() == 2
+    cpus.setattr(executor, 'CPU_QUOTA', '1')
+    assert effective_cpus() == 1
+
+
+def test_effective_cpus_rounds_fractional_quotas_and_keeps_one(cpus):
+    cpus.setattr(executor, 'cgroup_quota', lambda: 1.7)
+    assert effective_cpus() == 2
+    cpus.setenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '128')
+    assert effective_cpus() == 1
+
+
+@pytest.mark.parametrize('tasks, cpus, rows, parallelism, expected', [
+    (24, 6, 3000, 'auto', Plan(6, 1)),
+    (4, 6, 3000, 'auto', Plan(4, 1)),
+    (2, 6, 3000, 'auto', Plan(2, 3)),
+    (24, 6, 200000, 'auto', Plan(1, 6)),
+    (24, 6, 3000, 'trees', Plan(1, 6)),
+    (24, 6, 200000, 'folds', Plan(6, 1)),
+    (1, 6, 3000, 'folds', Plan(1, 6)),
+])
+def test_plan_never_exceeds_the_cpus(tasks, cpus, rows, parallelism, expected):
+    result = plan(tasks, cpus, rows, parallelism)
+    assert result == expected
+    assert result.workers * result.threads <= cpus
+
+
+def test_run_keeps_the_order_of_the_tasks():
+    tasks = [(i,) for i in range(20)]
+    assert executor.run(lambda i: i * i, tasks, Plan(4, 1)) == [i * i for i in range(20)]
+    assert executor.run(lambda i: i * i, tasks, Plan(1, 4)) == [i * i for i in range(20)]
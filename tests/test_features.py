@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import update_series
+from storage import MemoryStorage
+
+EMA = {'gold EMA_30': {'series': 'gold', 'column': 'gold open', 'kind': 'ema', 'span': 30}}
+ALL_KINDS = {
+    **EMA,
+    'gold std_20': {'series': 'gold', 'column': 'gold open', 'kind': 'rolling_std', 'window': 20},
+    'gold lag_1': {'series': 'gold', 'column': 'gold open', 'kind': 'lag', 'periods': 1},
+}
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2020-01-01', periods=400)
+    values = 1500 + rng.standard_normal(len(dates)).cumsum()
+    values[50] = np.nan
+    return pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'gold open': values})
+
+
+def reference(frame):
+    column = frame['gold open']
+    return {'gold EMA_30': column.ewm(span=30).mean(), 'gold std_20': column.rolling(20).std(), 'gold lag_1': column.shift(1)}
+
+
+def test_incremental_updates_match_a_full_recompute(frame, capsys):
+    storage = MemoryStorage()
+    for rows in (300, 301, 350, 400):
+        values = update_series(storage, 'gold', frame.iloc[:rows], ALL_KINDS, verify_mode='off')
+    assert 'rows computed (incremental)' in capsys.readouterr().out
+    expected = reference(frame)
+    np.testing.assert_array_equal(values['gold EMA_30'].to_numpy(), expected['gold EMA_30'].to_numpy())
+    np.testing.assert_array_equal(values['gold lag_1'].to_numpy(), expected['gold lag_1'].to_numpy())
+    np.testing.assert_allclose(values['gold std_20'].to_numpy(), expected['gold std_20'].to_numpy(), rtol=1e-9)
+
+
+def test_a_revision_beyond_the_last_rows_is_recomputed(frame, capsys):
+    storage = MemoryStorage()
+    update_series(storage, 'gold', frame.iloc[:390], EMA, verify_mode='off')
+    # the extractor rewrites up to revision_rows (10) rows back
+    revised = frame.copy()
+    revised.loc[382, 'gold open'] += 5
+    values = update_series(storage, 'gold', revised.iloc[:395], EMA, verify_mode='off')
+    assert '(stored rows revised)' in capsys.readouterr().out
+    np.testing.assert_array_equal(values['gold EMA_30'].to_numpy(), reference(revised.iloc[:395])['gold EMA_30'].to_numpy())
+
+
+def test_a_revision_at_the_start_of_the_history_is_recomputed(frame, capsys):
+    storage = MemoryStorage()
+    update_series(storage, 'gold', frame.iloc[:390], EMA, verify_mode='off')
+    revised = frame.copy()
+    revised.loc[0, 'gold open'] += 5
+    update_series(storage, 'gold', revised, EMA, verify_mode='off')
+    assert '(stored rows revised)' in capsys.readouterr().out
+
+
+def test_a_changed_definition_is_recomputed(frame, capsys):
+    storage = MemoryStorage()
+    update_series(storage, 'gold', frame.iloc[:390], EMA, verify_mode='off')
+    update_series(storage, 'gold', frame, {'gold EMA_30': {**EMA['gold EMA_30'], 'span': 20}}, verify_mode='off')
+    assert '(feature definitions changed)' in capsys.readouterr().out
+
+
+def test_exact_verification_does_not_rebuild_rolling_std(frame, capsys):
+    storage = MemoryStorage()
+    update_series(storage, 'gold', frame.iloc[:390], ALL_KINDS, verify_mode='exact')
+    update_series(storage, 'gold', frame, ALL_KINDS, verify_mode='exact')
+    out = capsys.readouterr().out
+    assert 'rows computed (incremental)' in out
+    assert 'rebuilding' not in out
+
+
+def test_nothing_new_returns_the_stored_values(frame, capsys):
+    storage = MemoryStorage()
+    first = update_series(storage, 'gold', frame, EMA, verify_mode='off')
+    capsys.readouterr()
+    second = update_series(storage, 'gold', frame, EMA, verify_mode='off')
+    assert capsys.readouterr().out == ''
+    pd.testing.assert_frame_equal(first, second)
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from manifest import complete_key, load_complete, try_complete, write_shard_manifest
+from storage import LocalStorage, MemoryStorage
+
+
+def report(*series, failed=()):
+    return [{'series': name, 'status': 'failure' if name in failed else 'success'} for name in series]
+
+
+@pytest.fixture(params=['memory', 'local'])
+def storage(request, tmp_path):
+    return MemoryStorage() if request.param == 'memory' else LocalStorage(str(tmp_path))
+
+
+def test_fan_in_waits_for_every_shard(storage):
+    write_shard_manifest(storage, 'run', 0, 3, report('gold', 'oil'))
+    write_shard_manifest(storage, 'run', 1, 3, report('cpi', failed={'cpi'}))
+    assert try_complete(storage, 'run', 3) is None
+    assert load_complete(storage, 'run') is None
+    write_shard_manifest(storage, 'run', 2, 3, report('gdp'))
+    complete = try_complete(storage, 'run', 3)
+    assert complete['series'] == 4
+    assert complete['failed'] == ['cpi']
+    assert load_complete(storage, 'run') == complete
+
+
+def test_only_one_shard_completes_the_run(storage):
+    for shard in range(4):
+        write_shard_manifest(storage, 'run', shard, 4, report(f'series_{shard}'))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: try_complete(storage, 'run', 4), range(8)))
+    assert sum(result is not None for result in results) == 1
+    assert storage.list(complete_key('run')) == [complete_key('run')]
+
+
+def test_manifests_of_other_runs_and_shard_counts_are_ignored(storage):
+    write_shard_manifest(storage, 'other', 0, 1, report('gold'))
+    # a rerun of the same day with a different number of shards
+    write_shard_manifest(storage, 'run', 0, 1, report('gold'))
+    write_shard_manifest(storage, 'run', 0, 2, report('gold'))
+    assert try_complete(storage, 'run', 2) is None
+    write_shard_manifest(storage, 'run', 1, 2, report('oil'))
+    assert try_complete(storage, 'run', 2)['series'] == 2
@@ -0,0 +1,89 @@
+import pandas as pd
+import pytest
+
+import extraction_lambda
+from extraction_lambda import (list_partitions, migrate_legacy_history, partition_key, read_partition, upsert,
+                               write_partitions)
+from storage import MemoryStorage
+
+GOLD = {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'GLD', 'backfill_start': '2023-01-01', 'revision_rows': 2,
+        'fields': ['open'], 'cadence': 'daily'}
+
+
+def frame(rows):
+    return pd.DataFrame({'date': pd.to_datetime([day for day, _ in rows]), 'open': [float(value) for _, value in rows]})
+
+
+HISTORY = frame([('2023-12-28', 1), ('2023-12-29', 2), ('2024-01-02', 3), ('2024-01-03', 4)])
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = MemoryStorage()
+    monkeypatch.setattr(extraction_lambda, 'storage', storage)
+    return storage
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    # the rows the provider returns from the requested start date on
+    calls = []
+
+    def fetch(spec, key, start_date, full):
+        calls.append(start_date)
+        return fetched.rows[fetched.rows['date'] >= start_date].reset_index(drop=True)
+
+    fetched.rows = HISTORY
+    fetched.calls = calls
+    monkeypatch.setitem(extraction_lambda.FETCHERS, 'av_daily', fetch)
+    return fetched
+
+
+def test_upsert_replaces_revised_rows_and_appends_new_ones():
+    new = frame([('2024-01-03', 40), ('2024-01-04', 5)])
+    assert upsert(HISTORY, new).equals(frame([('2023-12-28', 1), ('2023-12-29', 2), ('2024-01-02', 3), ('2024-01-03', 40),
+                                              ('2024-01-04', 5)]))
+
+
+def test_upsert_keeps_history_where_the_new_rows_have_gaps():
+    new = frame([('2024-01-03', float('nan'))])
+    assert upsert(HISTORY, new)['open'].tolist() == [1, 2, 3, 4]
+
+
+def test_a_legacy_history_file_is_split_into_partitions_once(storage):
+    extraction_lambda.write_s3_file('extraction-staging/gold.csv', HISTORY.assign(date=HISTORY['date'].dt.strftime('%Y-%m-%d')))
+    assert migrate_legacy_history('gold') == ['year=2023', 'year=2024']
+    assert list_partitions('gold') == ['year=2023', 'year=2024']
+    assert read_partition('gold', 'year=2023').equals(HISTORY.iloc[:2].reset_index(drop=True))
+    assert read_partition('gold', 'year=2024').equals(HISTORY.iloc[2:].reset_index(drop=True))
+
+
+def test_a_series_without_history_or_legacy_file_has_nothing_to_migrate(storage):
+    assert migrate_legacy_history('gold') == []
+    assert list_partitions('gold') == []
+
+
+def test_the_first_extraction_migrates_the_legacy_file_instead_of_backfilling(storage, fetched):
+    extraction_lambda.write_s3_file('extraction-staging/gold.csv', HISTORY)
+    extraction_lambda.extract_series('gold', 'key', GOLD)
+    # the revision window of the migrated history, not the backfill start
+    assert fetched.calls == ['2024-01-02']
+    assert list_partitions('gold') == ['year=2023', 'year=2024']
+
+
+def test_only_the_partitions_touched_by_the_revision_window_are_rewritten(storage, fetched):
+    write_partitions('gold', HISTORY, {'year=2023', 'year=2024'})
+    fetched.rows = pd.concat([HISTORY.iloc[:3], frame([('2024-01-03', 40), ('2025-01-02', 5)])], ignore_index=True)
+    series = extraction_lambda.extract_series('gold', 'key', GOLD)
+    assert series['open'].tolist() == [3, 40, 5]
+    assert {label: storage.versions[partition_key('gold', label)] for label in list_partitions('gold')} == \
+        {'year=2023': 1, 'year=2024': 2, 'year=2025': 1}
+    assert read_partition('gold', 'year=2024')['open'].tolist() == [3, 40]
+    assert read_partition('gold', 'year=2023').equals(HISTORY.iloc[:2].reset_index(drop=True))
+
+
+def test_a_release_that_changes_nothing_rewrites_no_partition(storage, fetched):
+    write_partitions('gold', HISTORY, {'year=2023', 'year=2024'})
+    extraction_lambda.extract_series('gold', 'key', GOLD)
+    assert storage.versions[partition_key('gold', 'year=2023')] == 1
+    assert storage.versions[partition_key('gold', 'year=2024')] == 1
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+import extraction_lambda
+from extraction_lambda import ProviderBudget
+
+
+class Response:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    budget = ProviderBudget(max_concurrency=1, requests_per_minute=100)
+    monkeypatch.setitem(extraction_lambda.BUDGETS, 'alpha_vantage', budget)
+    monkeypatch.setattr(extraction_lambda, 'BACKOFF_FACTOR', 0)
+    monkeypatch.setattr(extraction_lambda, 'BACKOFF_JITTER', 0)
+    return budget
+
+
+def session(bodies, monkeypatch):
+    responses = iter(bodies)
+    monkeypatch.setattr(extraction_lambda, 'http_session', lambda: SimpleNamespace(get=lambda *a, **k: Response(next(responses))))
+
+
+def test_every_throttled_retry_takes_a_slot(budget, monkeypatch):
+    note = {'Note': 'Thank you for using Alpha Vantage!'}
+    session([note, note, {'data': []}], monkeypatch)
+    with budget:
+        assert extraction_lambda.av_get({}) == {'data': []}
+    assert len(budget.calls) == 3
+
+
+def test_an_unthrottled_call_takes_one_slot(budget, monkeypatch):
+    session([{'data': []}], monkeypatch)
+    with budget:
+        extraction_lambda.av_get({})
+    assert len(budget.calls) == 1
+
+
+def test_the_last_throttled_response_is_returned(budget, monkeypatch):
+    note = {'Information': 'rate limit'}
+    session([note] * (extraction_lambda.MAX_RETRIES + 1), monkeypatch)
+    with budget:
+        assert extraction_lambda.av_get({}) == note
+    assert len(budget.calls) == extraction_lambda.MAX_RETRIES + 1
@@ -0,0 +1,111 @@
+import json
+
+import pandas as pd
+import pytest
+
+import response_cache
+from response_cache import INDEX_KEY, ResponseCache
+from storage import LocalStorage, MemoryStorage
+
+
+def request(symbol):
+    return {'provider': 'fred', 'function': 'series/observations', 'symbol': symbol, 'outputsize': None,
+            'start': '2024-01-01', 'end': '2024-06-30'}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {'time': 1_000_000.0}
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now['time'])
+    return now
+
+
+def test_round_trip_until_the_ttl_expires(clock):
+    cache = ResponseCache(MemoryStorage(), 10 ** 6)
+    cache.put(request('CPI'), {'observations': [1, 2]})
+    assert cache.get(request('CPI'), ttl_hours=1) == {'observations': [1, 2]}
+    assert cache.get(request('GDP'), ttl_hours=1) is None
+    clock['time'] += 3601
+    assert cache.get(request('CPI'), ttl_hours=1) is None
+
+
+def test_entries_of_concurrent_writers_are_kept(clock):
+    # two shards, each with its own view of the index
+    store = MemoryStorage()
+    first, second = ResponseCache(store, 10 ** 6), ResponseCache(store, 10 ** 6)
+    first.put(request('A'), {'value': 'a'})
+    second.put(request('B'), {'value': 'b'})
+    index = json.loads(store.get(INDEX_KEY))
+    assert set(index) == {first.object_key(request('A')), first.object_key(request('B'))}
+    assert second.get(request('A'), ttl_hours=1) == {'value': 'a'}
+    assert first.get(request('B'), ttl_hours=1) == {'value': 'b'}
+
+
+def test_lost_index_update_is_reconciled_and_evicted(clock):
+    store = MemoryStorage()
+    cache = ResponseCache(store, 10 ** 6)
+    cache.put(request('A'), {'value': 'a' * 100})
+    # another shard overwrote the index without A
+    store.put(INDEX_KEY, json.dumps({}))
+    clock['time'] += 1
+    small = ResponseCache(store, 150)
+    small.put(request('B'), {'value': 'b' * 100})
+    # A was adopted back into the index, then evicted as the oldest entry
+    assert store.list('api-cache/') == sorted([INDEX_KEY, cache.object_key(request('B'))])
+    assert list(json.loads(store.get(INDEX_KEY))) == [cache.object_key(request('B'))]
+
+
+def test_entries_without_their_stored_time_are_expired(clock):
+    store = MemoryStorage()
+    cache = ResponseCache(store, 10 ** 6)
+    store.put(cache.object_key(request('A')), json.dumps({'observations': []}))
+    assert cache.get(request('A'), ttl_hours=24) is None
+
+
+def test_local_storage_leaves_no_temporary_files(tmp_path):
+    store = LocalStorage(str(tmp_path))
+    store.put('api-cache/a.json', b'{}')
+    assert store.create('api-cache/b.json', b'{}')
+    assert not store.create('api-cache/b.json', b'{}')
+    assert sorted(p.name for p in (tmp_path / 'api-cache').iterdir()) == ['a.json', 'b.json']
+
+
+@pytest.fixture
+def extraction(monkeypatch):
+    import extraction_lambda
+    monkeypatch.setattr(extraction_lambda, 'response_cache', ResponseCache(MemoryStorage(), 10 ** 6))
+    for provider in ('alpha_vantage', 'fred'):
+        monkeypatch.setitem(extraction_lambda.BUDGETS, provider, extraction_lambda.ProviderBudget(1, 1000))
+    return extraction_lambda
+
+
+@pytest.mark.parametrize('error', [
+    {'Error Message': 'Invalid API call. Please retry or visit the documentation for TIME_SERIES_DAILY.'},
+    {'Information': 'The standard API rate limit is 25 requests per day.'},
+    {'Meta Data': {}},
+])
+def test_an_error_payload_is_not_cached(extraction, error):
+    spec = {'provider': 'alpha_vantage', 'kind': 'av_daily', 'cache_ttl': 6}
+    request = {'function': 'TIME_SERIES_DAILY', 'symbol': 'GLD', 'outputsize': 'compact'}
+    calls = []
+    good = {'Time Series (Daily)': {'2024-05-10': {'1. open': '1'}}}
+
+    def fetch():
+        calls.append(1)
+        return error if len(calls) == 1 else good
+
+    assert extraction.cached_fetch(spec, request, fetch) == error
+    # the rerun goes to the provider, and its good response is served from the cache afterwards
+    assert extraction.cached_fetch(spec, request, fetch) == good
+    assert extraction.cached_fetch(spec, request, fetch) == good
+    assert len(calls) == 2
+
+
+def test_a_parsed_frame_is_cached(extraction):
+    spec = {'provider': 'fred', 'kind': 'fred', 'cache_ttl': 24}
+    frame = pd.DataFrame({'date': pd.to_datetime(['2024-05-01']), 'value': [1.0]})
+    calls = []
+    extraction.cached_fetch(spec, {'function': 'series/observations', 'parsed': True}, lambda: calls.append(1) or frame)
+    cached = extraction.cached_fetch(spec, {'function': 'series/observations', 'parsed': True}, lambda: calls.append(1) or frame)
+    assert len(calls) == 1
+    assert 'parsed' in cached
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+from search import calendar_folds, search
+from storage import MemoryStorage
+
+GRID = {'max_depth': [1, 2, 3, 4, 5, 6, 7, 8, 9]}
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2015-01-01', '2021-03-31')
+    X = pd.DataFrame(rng.standard_normal((len(dates), 3)).cumsum(axis=0), index=dates, columns=['a', 'b', 'c'])
+    y = pd.Series(X.to_numpy() @ [1.0, -2.0, 0.5] + rng.standard_normal(len(dates)), index=dates)
+    return X, y
+
+
+def test_calendar_folds_are_complete_periods():
+    dates = pd.bdate_range('2018-01-01', '2021-03-31')
+    folds = calendar_folds(dates, n_folds=11, freq='Y')
+    # the current year is not complete, the first one has nothing to train on
+    assert [dates[test[0]].year for _, test in folds] == [2019, 2020]
+    for train, test in folds:
+        assert train[-1] + 1 == test[0]
+        assert (dates[test].year == dates[test[0]].year).all()
+    assert len(calendar_folds(dates, n_folds=1, freq='Y')) == 1
+
+
+def test_calendar_folds_keep_their_rows_when_rows_are_added():
+    dates = pd.bdate_range('2018-01-01', '2021-03-31')
+    before = calendar_folds(dates[:-5])
+    after = calendar_folds(dates)
+    assert len(before) == len(after)
+    for (train_a, test_a), (train_b, test_b) in zip(before, after):
+        assert np.array_equal(train_a, train_b) and np.array_equal(test_a, test_b)
+
+
+def test_fold_scores_are_reused_the_next_day(data):
+    X, y = data
+    storage = MemoryStorage()
+    first = search(DecisionTreeRegressor(random_state=0), GRID, X.iloc[:-1], y.iloc[:-1], calendar_folds(X.index[:-1]),
+                   storage=storage, cache_name='test', preprocess=StandardScaler(), cpus=1)
+    assert first.cache_hits == 0
+    # one more row, a new scaler fit on all rows: every fold score is served from the cache
+    second = search(DecisionTreeRegressor(random_state=0), GRID, X, y, calendar_folds(X.index),
+                    storage=storage, cache_name='test', preprocess=StandardScaler(), cpus=1)
+    assert second.n_fits == 1
+    assert second.cache_hits == first.n_fits - 1
+    assert second.best_params_ == first.best_params_
+
+
+def test_revised_fold_data_is_refitted(data):
+    X, y = data
+    storage = MemoryStorage()
+    folds = calendar_folds(X.index)
+    first = search(DecisionTreeRegressor(random_state=0), GRID, X, y, folds, storage=storage, cache_name='test', cpus=1)
+    revised = y.copy()
+    revised.iloc[folds[-1][1][0]] += 10
+    second = search(DecisionTreeRegressor(random_state=0), GRID, X, revised, folds, storage=storage, cache_name='test', cpus=1)
+    # only the folds that hold the revised row are fitted again
+    assert 1 < second.n_fits < first.n_fits
+
+
+def test_halving_stops_when_one_candidate_is_left(data):
+    X, y = data
+    folds = calendar_folds(X.index)
+    result = search(DecisionTreeRegressor(random_state=0), {'max_depth': [1, 2, 3]}, X, y, folds, factor=3, min_folds=2, cpus=1)
+    # three candidates on the two most recent folds, then the refit of the one left
+    assert result.n_fits == 3 * 2 + 1
+    assert max(row['folds'] for row in result.cv_results_) == 2
+
+
+def test_refit_uses_the_preprocessing_of_all_rows(data):
+    X, y = data
+    result = search(DecisionTreeRegressor(random_state=0), {'max_depth': [3]}, X, y, calendar_folds(X.index),
+                    preprocess=StandardScaler(), cpus=1)
+    assert result.n_fits == 1
+    np.testing.assert_allclose(result.preprocess_.mean_, X.mean().to_numpy())
+    assert result.best_estimator_.predict(result.preprocess_.transform(X)).shape == (len(X),)
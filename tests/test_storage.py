@@ -0,0 +1,15 @@
+from storage import LocalStorage
+
+
+def test_local_listing_matches_the_prefix(tmp_path):
+    store = LocalStorage(str(tmp_path))
+    for key in ('staging/gold/year=2024/gold.csv', 'staging/gold/year=2025/gold.csv', 'staging/golden/x.csv',
+                'staging/oil/year=2024/oil.csv', 'api-cache/index.json', 'top.json'):
+        store.put(key, b'x')
+    assert store.list('staging/gold/') == ['staging/gold/year=2024/gold.csv', 'staging/gold/year=2025/gold.csv']
+    assert store.list('staging/gold') == ['staging/gold/year=2024/gold.csv', 'staging/gold/year=2025/gold.csv',
+                                          'staging/golden/x.csv']
+    assert store.list('staging/gold/year=2025') == ['staging/gold/year=2025/gold.csv']
+    assert store.list('missing/') == []
+    assert store.list('t') == ['top.json']
+    assert len(store.list('')) == 6
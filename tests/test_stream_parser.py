@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import stream_parser
+from stream_parser import Scanner, as_frame, parse_stream, to_cached
+
+DATES = [d.strftime('%Y-%m-%d') for d in pd.bdate_range('2024-01-01', periods=40)]
+
+
+def chunks(document, size=7):
+    body = json.dumps(document).encode()
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def av_daily(dates=DATES):
+    records = {date: {'1. open': str(i), '2. high': str(i + 1), '5. volume': '100'} for i, date in enumerate(dates)}
+    return {'Meta Data': {'2. Symbol': 'GLD'}, 'Time Series (Daily)': dict(reversed(list(records.items())))}
+
+
+def observations(dates=DATES):
+    return [{'realtime_start': '2024-06-01', 'date': date, 'value': str(i) if i % 10 else '.'} for i, date in enumerate(dates)]
+
+
+def test_chunked_av_daily_matches_the_whole_document():
+    frame = parse_stream(Scanner(chunks(av_daily())), 'av_daily')
+    assert list(frame.columns) == ['date', 'open', 'high', 'volume']
+    assert frame['date'].dt.strftime('%Y-%m-%d').tolist() == DATES[::-1]
+    assert frame['open'].tolist() == list(range(len(DATES)))[::-1]
+
+
+def test_small_batches_are_concatenated(monkeypatch):
+    monkeypatch.setattr(stream_parser, 'STREAM_BATCH_ROWS', 3)
+    frame = parse_stream(Scanner(chunks({'observations': observations()})), 'fred')
+    assert len(frame) == len(DATES)
+    # FRED marks missing observations with '.'
+    assert np.isnan(frame['value'].iloc[0]) and frame['value'].iloc[1] == 1.0
+
+
+def test_newest_first_stops_reading_at_the_watermark():
+    document = {'name': 'Federal Funds Rate', 'data': [{'date': d, 'value': str(i)} for i, d in enumerate(DATES)][::-1]}
+    scanner = Scanner(chunks(document))
+    frame = parse_stream(scanner, 'av_economic', watermark=DATES[30])
+    # the rows from the watermark on, and the one in force on it
+    assert frame['date'].dt.strftime('%Y-%m-%d').tolist() == DATES[30:][::-1] + [DATES[29]]
+    assert scanner.bytes < len(json.dumps(document))
+
+
+def test_oldest_first_keeps_the_last_record_before_the_watermark():
+    frame = parse_stream(Scanner(chunks({'observations': observations()})), 'fred', watermark=DATES[25])
+    assert frame['date'].dt.strftime('%Y-%m-%d').tolist() == DATES[25:] + [DATES[24]]
+
+
+def test_a_payload_out_of_order_is_read_whole():
+    shuffled = DATES[20:] + DATES[:20]
+    frame = parse_stream(Scanner(chunks({'data': [{'date': d, 'value': '1'} for d in shuffled]})), 'av_economic',
+                         watermark=DATES[10])
+    assert sorted(frame['date'].dt.strftime('%Y-%m-%d')) == [DATES[9]] + DATES[10:]
+
+
+def test_a_document_without_records_is_returned_decoded():
+    note = {'Information': 'Thank you for using Alpha Vantage! Please consider spreading out your free API requests.'}
+    assert parse_stream(Scanner(chunks(note, size=5)), 'av_daily') == note
+
+
+def test_multibyte_characters_split_across_chunks():
+    document = {'Meta Data': {'1. Information': 'Prix de l’or — café'}, **av_daily(DATES[:3])}
+    for size in (1, 2, 3):
+        frame = parse_stream(Scanner(chunks(document, size)), 'av_daily')
+        assert len(frame) == 3
+
+
+def test_empty_records():
+    frame = parse_stream(Scanner(chunks({'observations': []})), 'fred')
+    assert frame.empty and list(frame.columns) == ['date', 'value']
+
+
+def test_truncated_document_raises():
+    body = json.dumps({'observations': observations()}).encode()[:-20]
+    with pytest.raises(ValueError):
+        parse_stream(Scanner([body]), 'fred')
+
+
+def test_cached_frames_round_trip():
+    frame = parse_stream(Scanner(chunks(av_daily())), 'av_daily')
+    restored = as_frame(json.loads(json.dumps(to_cached(frame))))
+    pd.testing.assert_frame_equal(restored, frame, check_dtype=False)
+    assert restored['date'].dtype.kind == 'M'
+    with pytest.raises(ValueError):
+        as_frame({'Note': 'throttled'})
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import model_lambda
+from model_lambda import FULL_RETRAIN_DAYS, WARM_MAX_UPDATES, WARM_MIN_ROWS, WARM_START_TREES, range_guard, training_plan
+from storage import MemoryStorage
+
+FEATURES = ['silver open', 'EMA_30']
+
+
+def metadata(**changes):
+    return {'feature_columns': FEATURES, 'warm_updates': 0, 'full_trained_at': (datetime.now() - timedelta(days=1)).isoformat(),
+            'trained_until': '2024-03-01', **changes}
+
+
+def train_index(new_rows):
+    # business days up to trained_until, then new_rows more
+    return pd.bdate_range('2024-01-02', '2024-03-01').append(pd.bdate_range('2024-03-04', periods=new_rows))
+
+
+@pytest.mark.parametrize('stored, columns, new_rows, mode, expected', [
+    (metadata(), FEATURES, 0, 'full', ('full', 'full training requested')),
+    (None, FEATURES, 0, 'warm', ('full', 'no registered model')),
+    (metadata(), FEATURES + ['cpi'], 0, 'warm', ('full', 'feature columns changed')),
+    (metadata(warm_updates=WARM_MAX_UPDATES), FEATURES, WARM_MIN_ROWS, 'warm',
+     ('full', f'{WARM_MAX_UPDATES} warm starts since the last full training')),
+    (metadata(full_trained_at=(datetime.now() - timedelta(days=FULL_RETRAIN_DAYS)).isoformat()), FEATURES, WARM_MIN_ROWS, 'warm',
+     ('full', f'{FULL_RETRAIN_DAYS} days since the last full training')),
+    (metadata(), FEATURES, 0, 'warm', ('reuse', '0 new rows')),
+    (metadata(), FEATURES, WARM_MIN_ROWS - 1, 'warm', ('reuse', f'{WARM_MIN_ROWS - 1} new rows')),
+    (metadata(), FEATURES, WARM_MIN_ROWS, 'warm', ('warm', f'{WARM_MIN_ROWS} new rows')),
+])
+def test_training_plan(stored, columns, new_rows, mode, expected):
+    assert training_plan(stored, columns, train_index(new_rows), mode) == expected
+
+
+def test_rows_after_trained_until_keep_the_limits_of_the_first_row_after_it():
+    index = pd.bdate_range('2024-03-01', periods=4)
+    limits = pd.DataFrame({'min_range': [1.0, 1.0, 1.0, 1.0], 'max_range': [10.0, 10.0, 12.0, 14.0]}, index=index)
+    pred = pd.Series([5.0, 5.0, 5.0, 5.0], index=index)
+    fallback = pd.Series([0.0, 0.0, 0.0, 0.0], index=index)
+    check = pd.Series([5.0, 9.0, 11.0, 13.0], index=index)
+    # unbounded, the widening limits of the later rows accept every check
+    assert not range_guard(pred, check, limits, fallback)[1].any()
+    # a model trained until the first row only knows the range of that row, (1, 10) for the rows after it
+    guarded, outside = range_guard(pred, check, limits, fallback, trained_until=index[0])
+    assert outside.tolist() == [False, False, True, True]
+    assert guarded.tolist() == [5.0, 5.0, 0.0, 0.0]
+
+
+def frame(rows):
+    # a gold open that follows the features, on business days
+    rng = np.random.default_rng(0)
+    index = pd.bdate_range('2022-01-03', periods=rows, name='date')
+    silver = 20 + rng.normal(size=rows).cumsum()
+    ema = pd.Series(silver, index=index).ewm(span=30).mean()
+    return pd.DataFrame({'silver open': silver, 'EMA_30': ema, 'gold open': 80 * silver + rng.normal(size=rows)}, index=index)
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = MemoryStorage()
+    monkeypatch.setattr(model_lambda, 'storage', storage)
+    monkeypatch.setattr(model_lambda, 'TEST_ROWS', 20)
+    return storage
+
+
+def train(model, mode='warm'):
+    return model_lambda.model_implementation(model, model_lambda.data_limits(model), 'model-results/', mode)
+
+
+def test_no_new_rows_reuse_the_registered_model_and_new_rows_warm_start_it(storage):
+    first = train(frame(600))
+    assert (first['plan'], first['version']) == ('full', 1)
+    full = model_lambda.load_metadata(storage, 'gold_open')
+
+    reused = train(frame(600))
+    assert (reused['plan'], reused['version']) == ('reuse', 1)
+    assert reused['rmse'] == first['rmse']
+
+    warm = train(frame(600 + WARM_MIN_ROWS))
+    assert (warm['plan'], warm['version']) == ('warm', 2)
+    metadata = model_lambda.load_metadata(storage, 'gold_open')
+    # boosting continued from version 1: its trees plus the warm start ones, with its parameters and lineage
+    assert metadata['n_trees'] == full['n_trees'] + WARM_START_TREES
+    assert (metadata['kind'], metadata['warm_updates'], metadata['full_trained_at']) == ('warm', 1, full['full_trained_at'])
+    assert metadata['params'] == full['params']
+    assert metadata['trained_until'] > full['trained_until']
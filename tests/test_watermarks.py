@@ -0,0 +1,108 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+import extraction_lambda
+from storage import MemoryStorage
+from watermarks import RELEASE_GRACE_DAYS, load_state, release_due, save_state, scheduled_release
+
+DAILY = {'provider': 'alpha_vantage', 'kind': 'av_daily', 'symbol': 'GLD', 'backfill_start': '2015-01-01', 'revision_rows': 3, 'fields': ['open'],
+         'cadence': 'daily'}
+WEEKLY = {'provider': 'fred', 'kind': 'fred', 'symbol': 'DEXUSEU', 'backfill_start': '2015-01-01', 'revision_rows': 10, 'cadence': 'weekly',
+          'release_day': 0}
+MONTHLY = {'provider': 'fred', 'kind': 'fred', 'symbol': 'CPIAUCSL', 'backfill_start': '2015-01-01', 'revision_rows': 3, 'cadence': 'monthly',
+           'release_day': 10}
+
+
+def stored(*dates):
+    return pd.DataFrame({'date': pd.to_datetime(list(dates)), 'value': range(len(dates))})
+
+
+@pytest.mark.parametrize('spec, after, expected', [
+    (DAILY, date(2024, 5, 9), date(2024, 5, 10)),
+    # Friday -> Monday
+    (DAILY, date(2024, 5, 10), date(2024, 5, 13)),
+    (WEEKLY, date(2024, 5, 10), date(2024, 5, 13)),
+    # strictly after: a Monday's next release is the following Monday
+    (WEEKLY, date(2024, 5, 13), date(2024, 5, 20)),
+    (MONTHLY, date(2024, 5, 9), date(2024, 5, 10)),
+    (MONTHLY, date(2024, 5, 10), date(2024, 6, 10)),
+    (MONTHLY, date(2024, 12, 15), date(2025, 1, 10)),
+    # day 31 is the last day of shorter months
+    ({**MONTHLY, 'release_day': 31}, date(2024, 2, 1), date(2024, 2, 29)),
+    ({**MONTHLY, 'release_day': 31}, date(2024, 2, 29), date(2024, 3, 31)),
+])
+def test_scheduled_release(spec, after, expected):
+    assert scheduled_release(spec, after) == expected
+
+
+def test_daily_series_are_due_the_business_day_after_their_last_observation():
+    storage = MemoryStorage()
+    state = save_state(storage, 'gold', DAILY, stored('2024-05-08', '2024-05-09', '2024-05-10'), True, None,
+                       now=datetime(2024, 5, 10, 22))
+    assert state['next_fetch'] == '2024-05-13'
+    # the first date of the revision window: the revision_rows-th last row
+    assert state['revision_start'] == '2024-05-08'
+    assert load_state(storage, 'gold') == state
+    assert release_due(DAILY, state, date(2024, 5, 11)) == (False, 'next release due 2024-05-13')
+    assert release_due(DAILY, state, date(2024, 5, 13))[0]
+
+
+def test_a_late_monthly_release_is_retried_daily_within_the_grace_period():
+    storage = MemoryStorage()
+    state = save_state(storage, 'cpi', MONTHLY, stored('2024-03-01'), True, None, now=datetime(2024, 4, 2))
+    assert state['next_fetch'] == '2024-04-10'
+    # the release day came, the fetch changed nothing: try again tomorrow
+    state = save_state(storage, 'cpi', MONTHLY, stored('2024-03-01'), False, state, now=datetime(2024, 4, 10))
+    assert (state['scheduled_release'], state['next_fetch']) == ('2024-04-10', '2024-04-11')
+    # past the grace period, wait for the next month's release
+    late = datetime(2024, 4, 10 + RELEASE_GRACE_DAYS)
+    state = save_state(storage, 'cpi', MONTHLY, stored('2024-03-01'), False, state, now=late)
+    assert state['next_fetch'] == '2024-05-10'
+
+
+def test_a_released_monthly_series_waits_for_the_next_release():
+    storage = MemoryStorage()
+    state = save_state(storage, 'cpi', MONTHLY, stored('2024-03-01'), True, None, now=datetime(2024, 4, 2))
+    state = save_state(storage, 'cpi', MONTHLY, stored('2024-03-01', '2024-04-01'), True, state, now=datetime(2024, 4, 11))
+    assert state['next_fetch'] == '2024-05-10'
+    assert state['last_observation'] == '2024-04-01'
+
+
+def test_an_empty_fetch_keeps_the_previous_watermark():
+    storage = MemoryStorage()
+    state = save_state(storage, 'cpi', MONTHLY, stored('2024-02-01', '2024-03-01'), True, None, now=datetime(2024, 4, 2))
+    state = save_state(storage, 'cpi', MONTHLY, stored(), False, state, now=datetime(2024, 4, 10))
+    assert (state['last_observation'], state['revision_start']) == ('2024-03-01', '2024-02-01')
+
+
+def test_a_changed_registry_entry_is_due():
+    storage = MemoryStorage()
+    state = save_state(storage, 'cpi', MONTHLY, stored('2024-03-01'), True, None, now=datetime(2024, 4, 2))
+    assert release_due(MONTHLY, None, date(2024, 4, 3)) == (True, 'no state')
+    assert not release_due(MONTHLY, state, date(2024, 4, 3))[0]
+    assert release_due({**MONTHLY, 'revision_rows': 6}, state, date(2024, 4, 3)) == (True, 'registry entry changed')
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    # a series whose next release is not due, and an extraction that only records it ran
+    state = save_state(extraction_lambda.storage, 'cpi', MONTHLY, stored('2024-03-01'), True, None, now=datetime.now())
+    assert not release_due(MONTHLY, state, date.today())[0]
+    calls = []
+    monkeypatch.setattr(extraction_lambda, 'extract_series', lambda *args: calls.append(args) or stored('2024-03-01'))
+    return calls
+
+
+def test_a_series_that_is_not_due_is_skipped(extractor):
+    result = extraction_lambda.run_extractor('cpi', MONTHLY, 'key')
+    assert result['status'] == 'skipped'
+    assert result['reason'].startswith('next release due')
+    assert extractor == []
+
+
+def test_a_forced_fetch_reports_the_force(extractor):
+    result = extraction_lambda.run_extractor('cpi', MONTHLY, 'key', force=True)
+    assert (result['status'], result['reason']) == ('success', 'forced')
+    assert len(extractor) == 1